@@ -1,9 +1,23 @@
 from django.contrib import admin
-from .models import Employee
+from django.contrib.admin.views.main import ChangeList
+from .models import Employee, blind_index, prime_employee_ids
+
+
+class EmployeeChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # Only the page being shown is decrypted, in one batch; get_employee_id reads the memo
+        prime_employee_ids(self.result_list)
+
 
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
     list_display = ('name', 'company', 'department', 'get_employee_id', 'role', 'start_date', 'end_date', 'phone_number', 'email', 'position')
+    list_select_related = ('company',)
+    search_fields = ('name', 'email', 'department', 'role')
+
+    def get_changelist(self, request, **kwargs):
+        return EmployeeChangeList
 
     def get_employee_id(self, obj):
         try:
@@ -12,12 +26,9 @@ class EmployeeAdmin(admin.ModelAdmin):
             return f"Error: {str(e)}"
     get_employee_id.short_description = 'Employee ID'
 
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request)
-        for employee in queryset:
-            try:
-                employee.employee_id  # This will trigger the property
-            except Exception as e:
-                # Log the error or handle it as needed
-                pass
-        return queryset
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term.strip():
+            # Employee IDs are encrypted, so match them exactly through the blind index
+            results |= queryset.filter(employee_id_hash=blind_index(search_term))
+        return results, may_have_duplicates
@@ -0,0 +1,332 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Avg, Count, DateField, DurationField, ExpressionWrapper, F, Q, Value
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Company, CompanyStats, Employee, Role
+from .utils import CommitBatch
+
+# Tenure is kept as day sums relative to this date, so rollups can be adjusted one employee at a time
+EPOCH = date(2000, 1, 1)
+BREAKDOWNS = ('department', 'role', 'position')
+
+
+def empty_rollup():
+    return {
+        'active': 0, 'ended': 0,
+        'department': {}, 'role': {}, 'position': {},
+        'hires': {}, 'leavers': {}, 'role_starts': {},
+        # Day sums over employees with a start date: (today - start) for active, (end - start) for ended
+        'active_dated': 0, 'active_start_days': 0.0, 'ended_dated': 0, 'ended_tenure_days': 0.0,
+    }
+
+
+def month(value):
+    return value.strftime('%Y-%m')
+
+
+def as_date(value):
+    # Instances saved with date strings (forms, create(start_date='...')) still hold the string
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def days(expression):
+    return ExpressionWrapper(expression, output_field=DurationField())
+
+
+def grouped(queryset, field):
+    return queryset.values(field).annotate(count=Count('id')).order_by().values_list(field, 'count')
+
+
+def monthly(queryset, field):
+    rows = queryset.filter(**{f'{field}__isnull': False}).annotate(month=TruncMonth(field))
+    return {month(value): count for value, count in grouped(rows, 'month')}
+
+
+def compute_rollup(company_id, today):
+    """Build a company's rollup from scratch with grouped aggregates over Employee and Role."""
+    employees = Employee.objects.filter(company_id=company_id)
+    active = Q(end_date__isnull=True) | Q(end_date__gte=today)
+    dated = Q(start_date__isnull=False)
+    epoch = Value(EPOCH, output_field=DateField())
+    totals = employees.aggregate(
+        active=Count('id', filter=active),
+        ended=Count('id', filter=~active),
+        active_dated=Count('id', filter=active & dated),
+        ended_dated=Count('id', filter=~active & dated),
+        active_start=Avg(days(F('start_date') - epoch), filter=active & dated),
+        ended_tenure=Avg(days(F('end_date') - F('start_date')), filter=~active & dated),
+    )
+    rollup = empty_rollup()
+    rollup.update(active=totals['active'], ended=totals['ended'],
+                  active_dated=totals['active_dated'], ended_dated=totals['ended_dated'])
+    # Averages rather than sums: a sum of 100k+ date differences overflows timedelta
+    if totals['active_start'] is not None:
+        rollup['active_start_days'] = totals['active_start'].total_seconds() / 86400 * totals['active_dated']
+    if totals['ended_tenure'] is not None:
+        rollup['ended_tenure_days'] = totals['ended_tenure'].total_seconds() / 86400 * totals['ended_dated']
+    for field in BREAKDOWNS:
+        rollup[field] = {value or '': count for value, count in grouped(employees.filter(active), field)}
+    rollup['hires'] = monthly(employees, 'start_date')
+    rollup['leavers'] = monthly(employees, 'end_date')
+    rollup['role_starts'] = monthly(Role.objects.filter(employee__company_id=company_id), 'start_date')
+    return rollup
+
+
+def employee_counts(values, today):
+    """The rollup counters one employee contributes to, as (section, key, amount)."""
+    if values['end_date'] is None or values['end_date'] >= today:
+        counts = [('active', None, 1)] + [(field, values[field] or '', 1) for field in BREAKDOWNS]
+        if values['start_date']:
+            counts += [('active_dated', None, 1), ('active_start_days', None, (values['start_date'] - EPOCH).days)]
+    else:
+        counts = [('ended', None, 1)]
+        if values['start_date']:
+            counts += [('ended_dated', None, 1), ('ended_tenure_days', None, (values['end_date'] - values['start_date']).days)]
+    if values['start_date']:
+        counts.append(('hires', month(values['start_date']), 1))
+    if values['end_date']:
+        counts.append(('leavers', month(values['end_date']), 1))
+    return counts
+
+
+def apply_counts(rollup, counts, sign):
+    for section, key, amount in counts:
+        if key is None:
+            rollup[section] += sign * amount
+            continue
+        total = rollup[section].get(key, 0) + sign * amount
+        if total:
+            rollup[section][key] = total
+        else:
+            rollup[section].pop(key, None)
+
+
+def by_count(counts):
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def present(rollup, today):
+    dated = rollup['active_dated'] + rollup['ended_dated']
+    tenure = rollup['active_dated'] * (today - EPOCH).days - rollup['active_start_days'] + rollup['ended_tenure_days']
+    return {
+        'as_of': today.isoformat(),
+        'headcount': rollup['active'],
+        'employments': {'active': rollup['active'], 'ended': rollup['ended']},
+        'by_department': by_count(rollup['department']),
+        'by_role': by_count(rollup['role']),
+        'by_position': by_count(rollup['position']),
+        'average_tenure_days': round(tenure / dated, 1) if dated else None,
+        'hires_per_month': dict(sorted(rollup['hires'].items())),
+        'leavers_per_month': dict(sorted(rollup['leavers'].items())),
+        'role_changes_per_month': dict(sorted(rollup['role_starts'].items())),
+    }
+
+
+def ensure_rows(company_ids):
+    # Writers and rebuilds coordinate through the generation on this row, so it has to exist first
+    CompanyStats.objects.bulk_create([CompanyStats(company_id=pk) for pk in company_ids], ignore_conflicts=True)
+
+
+def company_stats(company_id):
+    """Workforce figures for a company, served from its rollup.
+
+    Active/ended depends on the date, so a rollup from an earlier day (or one marked
+    stale by a bulk write) is rebuilt on read; saves in between adjust it in place.
+    """
+    today = timezone.now().date()
+    row = CompanyStats.objects.filter(company_id=company_id).values_list('as_of', 'rollup', 'generation').first()
+    if row and row[0] == today:
+        return present(row[1], today)
+    if row is None:
+        ensure_rows([company_id])
+        generation = CompanyStats.objects.filter(company_id=company_id).values_list('generation', flat=True).get()
+    else:
+        generation = row[2]
+    rollup = compute_rollup(company_id, today)
+    # A write during the rebuild may or may not be counted in it, so keep it only if there was none; the next read rebuilds
+    CompanyStats.objects.filter(company_id=company_id, generation=generation).update(
+        as_of=today, rollup=rollup, generation=generation + 1, built_generation=generation + 1, updated_at=timezone.now(),
+    )
+    return present(rollup, today)
+
+
+def mark_stale(company_ids):
+    # For writes that skip model signals (bulk_create, bulk_update, queryset.update)
+    ensure_rows(company_ids)
+    CompanyStats.objects.filter(company_id__in=company_ids).update(as_of=None, generation=F('generation') + 1)
+
+
+def current_generation(company_id):
+    return CompanyStats.objects.filter(company_id=company_id).values_list('generation', flat=True).first() or 0
+
+
+def adjust(company_id, started, changes=(), stale=False):
+    """Apply (counts, sign) changes to today's rollup after the transaction that made them has committed.
+
+    ``started`` is the company's generation before that transaction first wrote to it. A rollup
+    stored since then may count the changes already, so it is marked stale instead.
+    """
+    today = timezone.now().date()
+    with transaction.atomic():
+        stats = CompanyStats.objects.select_for_update().filter(company_id=company_id).first()
+        if stats is None:
+            if not Company.objects.filter(pk=company_id).exists():
+                return
+            ensure_rows([company_id])
+            stats = CompanyStats.objects.select_for_update().get(company_id=company_id)
+        # Bumped even with nothing to adjust, so a rebuild running now is not stored without these changes
+        stats.generation += 1
+        # Without a rollup for today the next read computes one, changes included
+        if stats.as_of == today and (stale or stats.built_generation > started):
+            stats.as_of = None
+        elif stats.as_of == today:
+            for counts, sign in changes:
+                apply_counts(stats.rollup, counts(today), sign)
+        stats.save(update_fields=['as_of', 'rollup', 'generation', 'updated_at'])
+
+
+class RollupChanges(CommitBatch):
+    """A transaction's changes to company rollups, applied with one adjust() per company once it commits."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = {}
+        self.changes = {}
+        self.employee_companies = {}
+        # Start dates of roles deleted along with their employee, by employee id
+        self.cascaded_roles = {}
+
+    def begin(self, company_id):
+        # Read before the first write, without locking; adjust() compares it with the stored rollup
+        if company_id not in self.started:
+            self.started[company_id] = current_generation(company_id)
+
+    def add(self, company_id, counts, sign):
+        self.changes.setdefault(company_id, []).append((counts, sign))
+
+    def company_of(self, employee_id):
+        if employee_id not in self.employee_companies:
+            self.employee_companies[employee_id] = Employee.objects.filter(pk=employee_id).values_list('company_id', flat=True).first()
+        return self.employee_companies[employee_id]
+
+    def run(self):
+        for company_id, started in self.started.items():
+            adjust(company_id, started, self.changes.get(company_id, ()))
+
+
+def deleted_with(origin, model):
+    # origin is the instance or queryset whose delete() started the cascade
+    return isinstance(origin, model) or getattr(origin, 'model', None) is model
+
+
+EMPLOYEE_FIELDS = ('company_id', 'start_date', 'end_date', *BREAKDOWNS)
+
+
+def employee_values(instance):
+    values = {field: getattr(instance, field) for field in EMPLOYEE_FIELDS}
+    values['start_date'], values['end_date'] = as_date(values['start_date']), as_date(values['end_date'])
+    return values
+
+
+def employee_change(values):
+    return lambda today: employee_counts(values, today)
+
+
+def role_counts(start_date):
+    return lambda today: [('role_starts', month(start_date), 1)]
+
+
+@receiver(pre_save, sender=Employee)
+def remember_employee(sender, instance, **kwargs):
+    before = Employee.objects.filter(pk=instance.pk).values(*EMPLOYEE_FIELDS).first() if instance.pk else None
+    after = employee_values(instance)
+    instance._rollup = None
+    if before != after:
+        batch = RollupChanges.for_write()
+        for values in (before, after):
+            if values:
+                batch.begin(values['company_id'])
+        instance._rollup = (batch, before, after)
+
+
+@receiver(post_save, sender=Employee)
+def employee_saved(sender, instance, created, **kwargs):
+    if not getattr(instance, '_rollup', None):
+        return
+    batch, before, after = instance._rollup
+    if before:
+        batch.add(before['company_id'], employee_change(before), -1)
+    batch.add(after['company_id'], employee_change(after), 1)
+    batch.finish()
+
+
+@receiver(pre_delete, sender=Employee)
+def employee_deleting(sender, instance, origin=None, **kwargs):
+    # A deleted company takes its rollup with it
+    instance._rollup = None
+    if not deleted_with(origin, Company):
+        instance._rollup = batch = RollupChanges.for_write()
+        batch.begin(instance.company_id)
+
+
+@receiver(post_delete, sender=Employee)
+def employee_deleted(sender, instance, **kwargs):
+    batch = getattr(instance, '_rollup', None)
+    if batch is None:
+        return
+    values = employee_values(instance)
+    batch.add(values['company_id'], employee_change(values), -1)
+    for start_date in batch.cascaded_roles.pop(instance.pk, []):
+        batch.add(values['company_id'], role_counts(start_date), -1)
+    batch.finish()
+
+
+@receiver(pre_save, sender=Role)
+def remember_role(sender, instance, **kwargs):
+    before = Role.objects.filter(pk=instance.pk).values_list('start_date', flat=True).first() if instance.pk else None
+    instance._rollup = None
+    if before != as_date(instance.start_date):
+        batch = RollupChanges.for_write()
+        company_id = batch.company_of(instance.employee_id)
+        batch.begin(company_id)
+        instance._rollup = (batch, company_id, before)
+
+
+@receiver(post_save, sender=Role)
+def role_saved(sender, instance, created, **kwargs):
+    if not getattr(instance, '_rollup', None):
+        return
+    batch, company_id, before = instance._rollup
+    batch.add(company_id, role_counts(as_date(instance.start_date)), 1)
+    if before:
+        batch.add(company_id, role_counts(before), -1)
+    batch.finish()
+
+
+@receiver(pre_delete, sender=Role)
+def role_deleting(sender, instance, origin=None, **kwargs):
+    instance._rollup = None
+    if not instance.start_date or deleted_with(origin, Company):
+        return
+    batch = RollupChanges.for_write()
+    if not deleted_with(origin, Role):
+        # Deleted with its employee: employee_deleted counts it, without a query per role
+        batch.cascaded_roles.setdefault(instance.employee_id, []).append(as_date(instance.start_date))
+        return
+    company_id = batch.company_of(instance.employee_id)
+    if company_id is not None:
+        batch.begin(company_id)
+        instance._rollup = (batch, company_id)
+
+
+@receiver(post_delete, sender=Role)
+def role_deleted(sender, instance, **kwargs):
+    if getattr(instance, '_rollup', None):
+        batch, company_id = instance._rollup
+        batch.add(company_id, role_counts(as_date(instance.start_date)), -1)
+        batch.finish()
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from . import analytics, authentication, caching, timeline  # noqa: F401 registers the cache invalidation, stats and timeline receivers
+        from .search import ensure_search_index
+        post_migrate.connect(ensure_search_index, sender=self)
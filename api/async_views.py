@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .models import Employee, Role
+from .pagination import RoleHistoryPagination
+from .serializers import EMPLOYEE_READ_COLUMNS, EmployeeReadSerializer, RoleSerializer
+from .views import EmployeeViewSet, find_employees
+
+# Fernet is CPU bound; a bounded pool keeps a burst of large pages from starving the event loop
+DECRYPT_POOL = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'DECRYPT_THREADS', None) or os.cpu_count(), thread_name_prefix='decrypt'
+)
+
+employee_detail_sync = EmployeeViewSet.as_view({'get': 'retrieve', 'put': 'update', 'patch': 'partial_update', 'delete': 'destroy'})
+
+
+def json_response(data, status=200, headers=None):
+    # DRF's renderer, so the bytes match what the sync views return
+    return HttpResponse(JSONRenderer().render(data), status=status, headers=headers, content_type='application/json')
+
+
+def read_only(view):
+    """GET and HEAD run ``view``, OPTIONS lists the allowed methods, anything else is a 405."""
+    allow = {'Allow': 'GET, HEAD, OPTIONS'}
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method == 'OPTIONS':
+            return HttpResponse(headers=allow)
+        if request.method not in ('GET', 'HEAD'):
+            return json_response({'detail': f'Method "{request.method}" not allowed.'}, status=405, headers=allow)
+        response = await view(request, *args, **kwargs)
+        if request.method == 'HEAD':
+            length = len(response.content)
+            response.content = b''
+            response['Content-Length'] = str(length)
+        return response
+    return wrapper
+
+
+@sync_to_async
+def authenticate(request):
+    """Run the configured DRF authentication classes; returns the DRF request, or an error response."""
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        user = drf_request.user
+    except exceptions.AuthenticationFailed as e:
+        return None, json_response({'detail': e.detail}, status=401, headers={'WWW-Authenticate': 'Token'})
+    if not user.is_authenticated:
+        error = exceptions.NotAuthenticated()
+        return None, json_response({'detail': error.detail}, status=401, headers={'WWW-Authenticate': 'Token'})
+    return drf_request, None
+
+
+async def represent_employees(rows):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(DECRYPT_POOL, EmployeeReadSerializer().represent_many, rows)
+
+
+@read_only
+async def employee_search(request):
+    drf_request, error = await authenticate(request)
+    if error:
+        return error
+    employees = await sync_to_async(lambda: list(find_employees(drf_request)))()
+    return json_response(await represent_employees(employees))
+
+
+@csrf_exempt
+async def employee_detail(request, pk):
+    # Writes, HEAD and OPTIONS stay on the sync viewset, which does its own CSRF checks
+    if request.method != 'GET':
+        return await sync_to_async(employee_detail_sync)(request, pk=pk)
+    _, error = await authenticate(request)
+    if error:
+        return error
+    try:
+        employee = await Employee.objects.values(*EMPLOYEE_READ_COLUMNS).aget(pk=pk)
+    except Employee.DoesNotExist:
+        return json_response({'detail': 'No Employee matches the given query.'}, status=404)
+    return json_response((await represent_employees([employee]))[0])
+
+
+@read_only
+async def employee_role_history(request, id):
+    drf_request, error = await authenticate(request)
+    if error:
+        return error
+    if not await Employee.objects.filter(id=id).aexists():
+        return json_response({'detail': 'Employee not found'}, status=404)
+
+    paginator = RoleHistoryPagination()
+    page = await sync_to_async(paginator.paginate_queryset)(Role.objects.filter(employee_id=id), drf_request)
+    return json_response(paginator.get_paginated_response(RoleSerializer(page, many=True).data).data)
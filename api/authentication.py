@@ -0,0 +1,118 @@
+import hashlib
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .models import APIKey
+
+User = get_user_model()
+
+KEY_PREFIX = 'api-auth'
+
+
+def timeout():
+    return getattr(settings, 'AUTH_CACHE_TIMEOUT', 300)
+
+
+def auth_cache_key(key):
+    # Keys are credentials, so only their hash ever reaches the cache backend
+    return f"{KEY_PREFIX}:{hashlib.sha256(key.encode('utf-8')).hexdigest()}"
+
+
+def forget(*keys):
+    cache_keys = [auth_cache_key(key) for key in keys]
+    if cache_keys:
+        transaction.on_commit(lambda: cache.delete_many(cache_keys))
+
+
+def lookup_user(key):
+    token = Token.objects.select_related('user').filter(key=key).first()
+    if token is None:
+        token = APIKey.objects.select_related('user').filter(key=key).first()
+    return token.user if token else None
+
+
+def remember(key, user):
+    # Only the id and active flag: never the password hash, and nothing that goes stale with the profile
+    cache.set(auth_cache_key(key), (user.pk, user.is_active), timeout())
+
+
+def issue_token(user):
+    """Return the user's DRF token, creating it on first login, and warm the auth cache for it."""
+    token, _ = Token.objects.get_or_create(user=user)
+    remember(token.key, user)
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Accepts DRF tokens and APIKey keys, as ``Token <key>`` or ``Api-Key <key>``.
+
+    Which user a key belongs to is cached for AUTH_CACHE_TIMEOUT seconds, so a warm request
+    skips the token and key tables. The user row itself is read on every request, which also
+    re-checks is_active in workers that never saw the user being deactivated.
+    """
+    keywords = ('token', 'api-key')
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower().decode() not in self.keywords:
+            return None
+
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed('Invalid token header. No credentials provided.')
+        elif len(auth) > 2:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain spaces.')
+
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed('Invalid token header. Token string should not contain invalid characters.')
+
+        return self.authenticate_credentials(key)
+
+    def authenticate_credentials(self, key):
+        cached = cache.get(auth_cache_key(key))
+        if cached is None:
+            user = lookup_user(key)
+            if user is None:
+                raise exceptions.AuthenticationFailed('Invalid token.')
+            remember(key, user)
+        else:
+            user_id, is_active = cached
+            user = User.objects.filter(pk=user_id).first() if is_active else None
+
+        if user is None or not user.is_active:
+            raise exceptions.AuthenticationFailed('User inactive or deleted.')
+        return (user, key)
+
+
+@receiver([post_save, post_delete], sender=Token)
+@receiver([post_save, post_delete], sender=APIKey)
+def forget_key(sender, instance, **kwargs):
+    forget(instance.key)
+
+
+@receiver(pre_save, sender=APIKey)
+def forget_replaced_key(sender, instance, **kwargs):
+    # A key changed in place must stop working; post_save only knows the new one
+    if instance.pk:
+        old_key = APIKey.objects.filter(pk=instance.pk).values_list('key', flat=True).first()
+        if old_key and old_key != instance.key:
+            forget(old_key)
+
+
+@receiver([post_save, post_delete], sender=User)
+def forget_user_keys(sender, instance, update_fields=None, **kwargs):
+    # A login only touches last_login, which authentication doesn't depend on
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    keys = [*Token.objects.filter(user_id=instance.pk).values_list('key', flat=True),
+            *APIKey.objects.filter(user_id=instance.pk).values_list('key', flat=True)]
+    forget(*keys)
@@ -0,0 +1,168 @@
+"""PostgreSQL backend that hands connections back to a per-process pool instead of closing them.
+
+Enable with ENGINE 'api.backends.postgresql_pool' and an optional POOL dict in the database
+settings: MAX_SIZE (connections per process), TIMEOUT (seconds to wait for a free one) and
+MAX_IDLE (seconds before an idle connection is dropped rather than reused).
+"""
+import os
+import threading
+import time
+from collections import deque
+from functools import partial
+
+from django.db.backends.postgresql import base
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from psycopg2 import OperationalError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, max_size=10, timeout=10, max_idle=300, health_checks=False):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.health_checks = health_checks
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.idle = deque()
+        self.lock = threading.Lock()
+        self.in_use = 0
+        self.metrics = {
+            'checkouts': 0, 'connections_opened': 0, 'connections_discarded': 0, 'timeouts': 0,
+            'wait_ms_total': 0.0, 'wait_ms_max': 0.0, 'checkout_ms_total': 0.0, 'checkout_ms_max': 0.0,
+        }
+
+    def checkout(self, connect):
+        started = time.perf_counter()
+        if not self.slots.acquire(timeout=self.timeout):
+            with self.lock:
+                self.metrics['timeouts'] += 1
+            raise PoolTimeout(f'No database connection free after {self.timeout}s (pool size {self.max_size})')
+        waited = time.perf_counter() - started
+        try:
+            connection = self.reuse()
+            if connection is None:
+                connection = connect()
+                with self.lock:
+                    self.metrics['connections_opened'] += 1
+        except BaseException:
+            self.slots.release()
+            raise
+
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.in_use += 1
+            self.metrics['checkouts'] += 1
+            self.metrics['wait_ms_total'] += waited * 1000
+            self.metrics['wait_ms_max'] = max(self.metrics['wait_ms_max'], waited * 1000)
+            self.metrics['checkout_ms_total'] += elapsed * 1000
+            self.metrics['checkout_ms_max'] = max(self.metrics['checkout_ms_max'], elapsed * 1000)
+        return connection
+
+    def reuse(self):
+        while True:
+            with self.lock:
+                if not self.idle:
+                    return None
+                connection, returned_at = self.idle.pop()
+            if connection.closed or time.monotonic() - returned_at > self.max_idle or not self.usable(connection):
+                self.discard(connection)
+                continue
+            return connection
+
+    def usable(self, connection):
+        if not self.health_checks:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            return True
+        except Exception:
+            return False
+
+    def checkin(self, connection):
+        try:
+            if not connection.closed:
+                status = connection.info.transaction_status
+                if status == TRANSACTION_STATUS_UNKNOWN:
+                    connection.close()
+                elif status != TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                if not connection.closed and not connection.autocommit:
+                    # Otherwise the health check would open a transaction that Django can't switch out of
+                    connection.autocommit = True
+            if connection.closed:
+                self.discard(connection)
+            else:
+                with self.lock:
+                    self.idle.append((connection, time.monotonic()))
+        finally:
+            with self.lock:
+                self.in_use -= 1
+            self.slots.release()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+        with self.lock:
+            self.metrics['connections_discarded'] += 1
+
+    def stats(self):
+        with self.lock:
+            checkouts = self.metrics['checkouts']
+            return {
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'idle': len(self.idle),
+                **{name: round(value, 2) for name, value in self.metrics.items()},
+                'wait_ms_avg': round(self.metrics['wait_ms_total'] / checkouts, 3) if checkouts else None,
+                'checkout_ms_avg': round(self.metrics['checkout_ms_total'] / checkouts, 3) if checkouts else None,
+            }
+
+
+def get_pool(alias, settings_dict):
+    # Keyed on the pid too: a forked worker must never reuse its parent's sockets
+    key = (alias, os.getpid())
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                options = settings_dict.get('POOL', {})
+                pool = _pools[key] = ConnectionPool(
+                    max_size=options.get('MAX_SIZE', 10),
+                    timeout=options.get('TIMEOUT', 10),
+                    max_idle=options.get('MAX_IDLE', 300),
+                    health_checks=settings_dict.get('CONN_HEALTH_CHECKS', False),
+                )
+    return pool
+
+
+def pool_stats(alias):
+    pool = _pools.get((alias, os.getpid()))
+    return pool.stats() if pool else None
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def get_new_connection(self, conn_params):
+        connection = self.pool.checkout(partial(super().get_new_connection, conn_params))
+        # super() only sets this when it opens a connection; pooled ones were opened with the same options
+        self.isolation_level = IsolationLevel(self.settings_dict['OPTIONS'].get('isolation_level', IsolationLevel.READ_COMMITTED))
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self.pool.checkin(self.connection)
@@ -0,0 +1,163 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import serializers
+
+from . import crypto
+from .analytics import mark_stale
+from .models import Company, Employee, Role
+from .serializers import EmployeeSerializer, RoleSerializer
+from .timeline import rebuild_timelines
+
+DEFAULT_WRITE_LIMIT = 1000
+DUPLICATE_EMPLOYEE = 'An employee with this ID already exists for this user in this company.'
+
+
+def write_limit():
+    return getattr(settings, 'BATCH_WRITE_LIMIT', DEFAULT_WRITE_LIMIT)
+
+
+class EmployeeItemSerializer(EmployeeSerializer):
+    # Plain ids, resolved for the whole list at once instead of one lookup per item
+    user = serializers.IntegerField(required=False)
+    company = serializers.IntegerField()
+
+
+class RoleItemSerializer(RoleSerializer):
+    class Meta(RoleSerializer.Meta):
+        fields = ['id', 'title', 'start_date', 'end_date', 'duties']
+        read_only_fields = ['id']
+
+
+class BatchErrors(Exception):
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__(f'{len(errors)} invalid items')
+
+
+def validate_items(serializer_class, items):
+    """Return ({index: validated item}, {index: errors}) so later checks can add to the same report."""
+    serializer = serializer_class()
+    data, errors = {}, {}
+    for index, item in enumerate(items):
+        try:
+            data[index] = serializer.run_validation(item)
+        except serializers.ValidationError as e:
+            errors[index] = e.detail if isinstance(e.detail, dict) else {'non_field_errors': e.detail}
+    return data, errors
+
+
+def raise_errors(errors):
+    if errors:
+        raise BatchErrors([{'index': index, 'errors': errors[index]} for index in sorted(errors)])
+
+
+def bulk_update_partial(model, objects):
+    """bulk_update each group of objects that set the same fields, so omitted fields keep their values."""
+    groups = {}
+    for obj, fields in objects:
+        groups.setdefault(tuple(sorted(fields)), []).append(obj)
+    for fields, group in groups.items():
+        if fields:
+            model.objects.bulk_update(group, fields)
+
+
+def write_employees(items, user, upsert=False):
+    """Create (or with ``upsert``, create or update) a list of employees for ``user``.
+
+    Every item is validated before anything is written, and the writes share one
+    transaction. Upserts match on company and employee_id, as the single create's
+    duplicate check does. Raises BatchErrors listing each invalid item.
+    """
+    data, errors = validate_items(EmployeeItemSerializer, items)
+    companies = Company.objects.in_bulk({item['company'] for item in data.values()})
+    seen = {}
+    for index, item in data.items():
+        if item['company'] not in companies:
+            errors[index] = {'company': [f'Invalid pk "{item["company"]}" - object does not exist.']}
+        item['employee_id_hash'] = crypto.blind_index(item.get('employee_id'))
+        if item['employee_id_hash']:
+            key = (item['company'], item['employee_id_hash'])
+            if key in seen:
+                errors.setdefault(index, {})['employee_id'] = [f'Duplicate of item {seen[key]} in this request.']
+            seen.setdefault(key, index)
+
+    existing = {}
+    if seen:
+        rows = Employee.objects.filter(user=user, company_id__in=companies, employee_id_hash__in={key[1] for key in seen})
+        for pk, company_id, employee_id_hash in rows.values_list('id', 'company_id', 'employee_id_hash'):
+            existing[(company_id, employee_id_hash)] = pk
+    if not upsert:
+        for key, index in seen.items():
+            if key in existing:
+                errors.setdefault(index, {})['employee_id'] = [DUPLICATE_EMPLOYEE]
+    raise_errors(errors)
+
+    today = timezone.now().date()
+    created, updated, results = [], [], []
+    for item in data.values():
+        item.pop('user', None)
+        employee_id = item.pop('employee_id', None)
+        employee_id_hash = item.pop('employee_id_hash')
+        company_id = item.pop('company')
+        pk = existing.get((company_id, employee_id_hash))
+        if pk is None:
+            # Same defaults as EmployeeSerializer.create
+            item.setdefault('start_date', today)
+            item.setdefault('end_date', today)
+            employee = Employee(user=user, company_id=company_id, _employee_id=employee_id or '',
+                                employee_id_hash=employee_id_hash, **item)
+            created.append(employee)
+        else:
+            employee = Employee(pk=pk, row_fingerprint=None, **item)
+            updated.append((employee, [*item, 'row_fingerprint']))
+        results.append((employee, 'created' if pk is None else 'updated'))
+
+    # One pass over the key ring for the whole list, not an encrypt per save()
+    for employee, token in zip(created, crypto.encrypt_many([employee._employee_id or None for employee in created])):
+        employee._employee_id = token or ''
+    with transaction.atomic():
+        Employee.objects.bulk_create(created)
+        bulk_update_partial(Employee, updated)
+        # Bulk writes skip the signals that keep timelines and company stats current
+        rebuild_timelines([employee.pk for employee, _ in updated])
+        mark_stale(companies)
+    return [{'index': index, 'id': employee.pk, 'status': result} for index, (employee, result) in enumerate(results)]
+
+
+def write_roles(items, employee, upsert=False):
+    """Create (or with ``upsert``, create or update) roles for one employee.
+
+    Upserts match on title and start date, the key uploads deduplicate roles on.
+    """
+    data, errors = validate_items(RoleItemSerializer, items)
+    existing = {}
+    if upsert:
+        seen = {}
+        for index, item in data.items():
+            key = (item['title'], item['start_date'])
+            if key in seen:
+                errors.setdefault(index, {})['start_date'] = [f'Duplicate of item {seen[key]} in this request.']
+            seen.setdefault(key, index)
+    raise_errors(errors)
+    if upsert:
+        for pk, title, start_date in Role.objects.filter(employee=employee).values_list('id', 'title', 'start_date'):
+            existing.setdefault((title, start_date), pk)
+
+    created, updated, results = [], [], []
+    for item in data.values():
+        pk = existing.get((item['title'], item['start_date']))
+        if pk is None:
+            role = Role(employee=employee, **item)
+            created.append(role)
+        else:
+            role = Role(pk=pk, employee=employee, **item)
+            updated.append((role, [field for field in item if field not in ('title', 'start_date')]))
+        results.append((role, 'created' if pk is None else 'updated'))
+
+    with transaction.atomic():
+        Role.objects.bulk_create(created)
+        bulk_update_partial(Role, updated)
+        rebuild_timelines([employee.pk])
+        mark_stale([employee.company_id])
+    return [{'index': index, 'id': role.pk, 'status': result} for index, (role, result) in enumerate(results)]
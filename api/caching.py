@@ -0,0 +1,122 @@
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.response import Response
+
+from .models import Company, Department
+
+KEY_PREFIX = 'api-response'
+STATS_KEY = 'api-response-stats'
+
+
+def timeout():
+    return getattr(settings, 'API_CACHE_TIMEOUT', 300)
+
+
+def fresh_version():
+    # Millisecond clock rather than 1, so a version evicted from the cache never comes back
+    # with a value that old entries were stored under
+    return int(time.time() * 1000)
+
+
+def scope_versions(scopes):
+    keys = [f'{KEY_PREFIX}:version:{scope}' for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = fresh_version()
+            if not cache.add(key, version, None):
+                version = cache.get(key, version)
+            versions[key] = version
+    return [versions[key] for key in keys]
+
+
+def bump(*scopes):
+    for scope in scopes:
+        key = f'{KEY_PREFIX}:version:{scope}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, fresh_version(), None)
+
+
+def invalidate(*scopes):
+    # Wait for the commit so a concurrent read can't re-cache the old rows
+    transaction.on_commit(lambda: bump(*scopes))
+
+
+def record(name):
+    key = f'{STATS_KEY}:{name}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def cache_stats():
+    stats = cache.get_many([f'{STATS_KEY}:hits', f'{STATS_KEY}:misses'])
+    hits = stats.get(f'{STATS_KEY}:hits', 0)
+    misses = stats.get(f'{STATS_KEY}:misses', 0)
+    total = hits + misses
+    return {
+        'backend': settings.CACHES['default']['BACKEND'].rsplit('.', 1)[-1],
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / total, 4) if total else None,
+    }
+
+
+def cached_response(request, scopes, build):
+    """Serve a GET from the cache, keyed on path, query string and the versions of ``scopes``."""
+    if request.method != 'GET':
+        return build()
+
+    versions = scope_versions(scopes)
+    # lists() rather than items(): ?id=1&id=2 must not share an entry with ?id=2
+    query = urlencode(sorted(request.query_params.lists()), doseq=True)
+    raw = f"{request.path}?{query}|{'|'.join(scopes)}|{'.'.join(map(str, versions))}"
+    key = f'{KEY_PREFIX}:{hashlib.sha256(raw.encode()).hexdigest()}'
+
+    data = cache.get(key)
+    if data is not None:
+        record('hits')
+        response = Response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    record('misses')
+    response = build()
+    if response.status_code == 200:
+        cache.set(key, response.data, timeout())
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+class CachedReadMixin:
+    """Read-through cache for list and retrieve; views say which scopes their output depends on."""
+
+    def cache_scopes(self):
+        raise NotImplementedError
+
+    def list(self, request, *args, **kwargs):
+        return cached_response(request, self.cache_scopes(), lambda: super(CachedReadMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return cached_response(request, self.cache_scopes(), lambda: super(CachedReadMixin, self).retrieve(request, *args, **kwargs))
+
+
+@receiver([post_save, post_delete], sender=Company)
+def invalidate_company(sender, instance, **kwargs):
+    invalidate('companies', f'company:{instance.pk}')
+
+
+@receiver([post_save, post_delete], sender=Department)
+def invalidate_department(sender, instance, **kwargs):
+    invalidate('departments', f'departments:{instance.company_id}')
@@ -0,0 +1,91 @@
+import base64
+import functools
+import hashlib
+import hmac
+
+from cryptography.fernet import Fernet, InvalidToken, MultiFernet
+from django.conf import settings
+
+DECRYPT_ERRORS = (InvalidToken, UnicodeDecodeError, base64.binascii.Error, TypeError, AttributeError)
+
+
+def encryption_keys():
+    # The primary key encrypts; fallbacks are only tried when decrypting during a rotation
+    return (settings.ENCRYPTION_KEY, *getattr(settings, 'ENCRYPTION_KEY_FALLBACKS', ()))
+
+
+@functools.lru_cache(maxsize=4)
+def _key_ring(keys):
+    return MultiFernet([Fernet(key) for key in keys])
+
+
+def get_key_ring():
+    """Return the process-wide MultiFernet for the configured keys, built once per key set."""
+    return _key_ring(encryption_keys())
+
+
+def encrypt(value):
+    return get_key_ring().encrypt(value.encode('utf-8')).decode('utf-8')
+
+
+def decrypt(token):
+    return get_key_ring().decrypt(token.encode('utf-8')).decode('utf-8')
+
+
+def encrypt_many(values):
+    ring_encrypt = get_key_ring().encrypt
+    return [None if value is None else ring_encrypt(value.encode('utf-8')).decode('utf-8') for value in values]
+
+
+def decrypt_many(tokens, on_error=None):
+    """Decrypt a page of tokens in one pass.
+
+    Empty tokens decrypt to None. Unreadable tokens become ``on_error(token)``, or None
+    when no handler is given.
+    """
+    ring_decrypt = get_key_ring().decrypt
+    values = []
+    for token in tokens:
+        if not token:
+            values.append(None)
+            continue
+        try:
+            values.append(ring_decrypt(token.encode('utf-8')).decode('utf-8'))
+        except DECRYPT_ERRORS:
+            values.append(on_error(token) if on_error else None)
+    return values
+
+
+def rotate_many(tokens, keys=None):
+    """Re-encrypt tokens under the primary key. Unreadable tokens come back as None.
+
+    ``keys`` lets worker processes that never load Django settings build the same key ring.
+    """
+    ring_rotate = (_key_ring(tuple(keys)) if keys else get_key_ring()).rotate
+    rotated = []
+    for token in tokens:
+        if not token:
+            rotated.append(token)
+            continue
+        try:
+            rotated.append(ring_rotate(token.encode('utf-8')).decode('utf-8'))
+        except DECRYPT_ERRORS:
+            rotated.append(None)
+    return rotated
+
+
+def decryption_placeholder(token):
+    return f"Decryption error: {token[:10]}... (truncated)"
+
+
+def normalize(value):
+    # Applied before both encrypting and hashing, so the stored value and its index always agree
+    return str(value).strip()
+
+
+def blind_index(value):
+    # Deterministic keyed hash of a plaintext value, so encrypted columns can be matched exactly
+    if value is None:
+        return None
+    value = normalize(value)
+    return hmac.new(settings.BLIND_INDEX_KEY.encode(), value.encode('utf-8'), hashlib.sha256).hexdigest()
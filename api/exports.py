@@ -0,0 +1,117 @@
+import csv
+import json
+import zlib
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+
+from . import crypto
+from .models import Employee, Role
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+EMPLOYEE_COLUMNS = ['id', 'name', 'employee_id', 'department', 'role', 'position',
+                    'start_date', 'end_date', 'phone_number', 'email']
+ROLE_COLUMNS = ['title', 'start_date', 'end_date', 'duties']
+CSV_HEADER = EMPLOYEE_COLUMNS + [f'role_{column}' for column in ROLE_COLUMNS]
+
+# The first batch is small so the first rows go out quickly; later batches amortize the queries
+FIRST_BATCH_SIZE = 100
+BATCH_SIZE = 2000
+
+
+def iso(value):
+    return value.isoformat() if value is not None else None
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def employee_batches(company):
+    """Yield lists of employee dicts with decrypted IDs and their roles, newest first."""
+    rows = (
+        Employee.objects.filter(company=company).order_by('id')
+        .values('_employee_id', *[column for column in EMPLOYEE_COLUMNS if column != 'employee_id'])
+        # Server-side cursor on Postgres, so the table is never held in memory
+        .iterator(chunk_size=BATCH_SIZE)
+    )
+    size = FIRST_BATCH_SIZE
+    while True:
+        batch = list(islice(rows, size))
+        if not batch:
+            return
+        size = BATCH_SIZE
+
+        employee_ids = crypto.decrypt_many([row.pop('_employee_id') for row in batch], on_error=crypto.decryption_placeholder)
+        roles = {}
+        for role in (Role.objects.filter(employee_id__in=[row['id'] for row in batch])
+                     .order_by('employee_id', '-start_date', '-id').values('employee_id', *ROLE_COLUMNS)):
+            roles.setdefault(role.pop('employee_id'), []).append(
+                {**role, 'start_date': iso(role['start_date']), 'end_date': iso(role['end_date'])}
+            )
+        for row, employee_id in zip(batch, employee_ids):
+            row.update(employee_id=employee_id, start_date=iso(row['start_date']), end_date=iso(row['end_date']),
+                       roles=roles.get(row['id'], []))
+        yield batch
+
+
+def csv_chunks(company):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    empty_role = dict.fromkeys(ROLE_COLUMNS)
+    for batch in employee_batches(company):
+        lines = []
+        for row in batch:
+            employee = [row[column] for column in EMPLOYEE_COLUMNS]
+            # One line per role; employees without any still get a line
+            for role in row['roles'] or [empty_role]:
+                lines.append(writer.writerow(employee + [role[column] for column in ROLE_COLUMNS]))
+        yield ''.join(lines)
+
+
+def ndjson_chunks(company):
+    for batch in employee_batches(company):
+        yield ''.join(
+            json.dumps({**{column: row[column] for column in EMPLOYEE_COLUMNS}, 'roles': row['roles']}) + '\n'
+            for row in batch
+        )
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    for chunk in chunks:
+        # Sync flush so every batch reaches the client instead of waiting in the compressor
+        yield compressor.compress(chunk.encode('utf-8')) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+async def async_chunks(chunks):
+    """Serve a sync chunk generator as an async iterator, one thread hop per chunk.
+
+    Under ASGI, StreamingHttpResponse reads a sync iterator to the end before sending
+    anything. Each step runs on the same thread, so the server-side cursor keeps its connection.
+    """
+    done = object()
+    step = sync_to_async(next)
+    try:
+        while True:
+            chunk = await step(chunks, done)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        # Also runs when the client disconnects, releasing the cursor
+        await sync_to_async(chunks.close)()
+
+
+def export_company(company, fmt='csv', compress=False):
+    """Return (chunks, content_type, filename) for a streamed export of ``company``'s employees and roles."""
+    chunks = csv_chunks(company) if fmt == 'csv' else ndjson_chunks(company)
+    filename = f'company-{company.pk}-employees.{fmt}'
+    if compress:
+        return gzip_chunks(chunks), 'application/gzip', f'{filename}.gz'
+    return chunks, EXPORT_FORMATS[fmt], filename
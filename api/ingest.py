@@ -0,0 +1,305 @@
+import logging
+import time
+
+import pandas as pd
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import crypto
+from .analytics import mark_stale
+from .caching import invalidate
+from .models import Department, Employee, Role
+from .provisioning import provision_users
+from .readers import DEFAULT_BATCH_SIZE
+from .timeline import rebuild_timelines
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ['email', 'employee_id', 'department', 'role', 'start_date']
+EMPLOYEE_UPDATE_FIELDS = ['name', 'department', 'role', 'start_date', 'end_date', 'phone_number', 'email', 'position']
+
+
+class IngestError(Exception):
+    def __init__(self, index, message):
+        self.index = index
+        super().__init__(message)
+
+
+def clean_value(value):
+    if value is None:
+        return None
+    try:
+        if pd.isna(value):
+            return None
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+def clean_text(value, default=None):
+    value = clean_value(value)
+    if value is None:
+        return default
+    return str(value).strip()
+
+
+def clean_date(value):
+    value = clean_value(value)
+    if value is None:
+        return None
+    if hasattr(value, 'date'):
+        return value.date()
+    return value
+
+
+def row_fingerprint(row):
+    # Keyed like the blind index, since the row holds the plaintext employee ID
+    values = [row['employee_id'], *(row['fields'][field] for field in EMPLOYEE_UPDATE_FIELDS), row['duties']]
+    return crypto.blind_index('\x1f'.join('' if value is None else str(value) for value in values))
+
+
+class EmployeeIngest:
+    """Writes employee rows for one company with a fixed number of queries per chunk."""
+
+    def __init__(self, company, chunk_size=DEFAULT_BATCH_SIZE, full_roster=False):
+        self.company = company
+        self.chunk_size = chunk_size
+        self.full_roster = full_roster
+        self.departments = {}
+        self.employees = {}
+        self.fingerprints = set()
+        # Fingerprints of every row in the file, to find who a full roster no longer lists
+        self.seen = set()
+        self.stats = {'rows': 0, 'rows_unchanged': 0, 'users_created': 0, 'departments_created': 0,
+                      'employees_created': 0, 'employees_updated': 0, 'roles_created': 0, 'employees_removed': 0}
+
+    def load_existing(self):
+        for department in Department.objects.filter(company=self.company):
+            self.departments.setdefault(department.name, department)
+        rows = Employee.objects.filter(company=self.company, employee_id_hash__isnull=False).values_list(
+            'id', 'user_id', 'employee_id_hash', 'row_fingerprint'
+        )
+        for pk, user_id, employee_id_hash, fingerprint in rows:
+            self.employees[(user_id, employee_id_hash)] = pk
+            if fingerprint:
+                self.fingerprints.add(fingerprint)
+
+    def run(self, source, progress=None):
+        """Ingest a DataFrame or an iterable of DataFrame batches (see ``readers.iter_batches``).
+
+        Without a progress callback everything is written in one transaction. With one,
+        each batch commits on its own: a failing batch is rolled back and counted in
+        ``rows_failed`` while the remaining batches are still written.
+        """
+        started = time.perf_counter()
+        self.stats['rows_failed'] = 0
+        if progress is None:
+            with transaction.atomic():
+                self.load_existing()
+                for chunk in self.chunks(source):
+                    self.write_chunk(self.parse_rows(chunk))
+                if self.full_roster:
+                    self.close_missing()
+        else:
+            self.load_existing()
+            for chunk in self.chunks(source):
+                try:
+                    with transaction.atomic():
+                        self.write_chunk(self.parse_rows(chunk))
+                except Exception as e:
+                    self.chunk_failed(chunk, e)
+                progress(self.stats)
+            # A failed chunk's employees were never seen, so they must not be ended
+            if self.full_roster and not self.stats['rows_failed']:
+                with transaction.atomic():
+                    self.close_missing()
+
+        elapsed = time.perf_counter() - started
+        self.stats['seconds'] = round(elapsed, 3)
+        self.stats['rows_per_second'] = round(self.stats['rows'] / elapsed, 1) if elapsed else 0.0
+        logger.info('Bulk ingest for company %s: %s', self.company.pk, self.stats)
+        return self.stats
+
+    def chunks(self, source):
+        if isinstance(source, pd.DataFrame):
+            df = source
+            source = (df.iloc[offset:offset + self.chunk_size] for offset in range(0, len(df), self.chunk_size))
+        offset = 0
+        for number, chunk in enumerate(source):
+            if number == 0:
+                missing = [column for column in REQUIRED_COLUMNS if column not in chunk.columns]
+                if missing:
+                    raise IngestError(0, f"Missing required columns: {', '.join(missing)}")
+            # Batches from the streaming readers restart their index; number rows across the file
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            yield chunk
+
+    def chunk_failed(self, chunk, error):
+        logger.warning('Bulk ingest chunk at row %s failed: %s', chunk.index[0], error)
+        self.stats['rows_failed'] += len(chunk)
+        self.stats.setdefault('error', f'Error processing rows from {chunk.index[0]}: {str(error)}')
+        # The rolled back chunk may have populated the lookup caches
+        self.departments.clear()
+        self.employees.clear()
+        self.fingerprints.clear()
+        self.load_existing()
+
+    def parse_rows(self, chunk):
+        rows = []
+        for index, record in zip(chunk.index, chunk.to_dict('records')):
+            email = clean_text(record.get('email'))
+            employee_id = clean_text(record.get('employee_id'))
+            department = clean_text(record.get('department'))
+            title = clean_text(record.get('role'))
+            start_date = clean_date(record.get('start_date'))
+            if not email or not employee_id or not department or not title or not start_date:
+                raise IngestError(index, 'email, employee_id, department, role and start_date are required')
+
+            first_name = clean_text(record.get('first_name'), '')
+            last_name = clean_text(record.get('last_name'), '')
+            name = f"{first_name} {last_name}".strip() or clean_text(record.get('name'), '')
+            row = {
+                'index': index,
+                'email': email,
+                'first_name': first_name,
+                'last_name': last_name,
+                'employee_id': employee_id,
+                'employee_id_hash': crypto.blind_index(employee_id),
+                'department': department,
+                'fields': {
+                    'name': name,
+                    'department': department,
+                    'role': title,
+                    'start_date': start_date,
+                    'end_date': clean_date(record.get('end_date')),
+                    'phone_number': clean_text(record.get('phone_number')),
+                    'email': email,
+                    'position': clean_text(record.get('position')),
+                },
+                'duties': clean_text(record.get('duties'), ''),
+            }
+            row['fingerprint'] = row_fingerprint(row)
+            rows.append(row)
+        return rows
+
+    def resolve_users(self, rows):
+        emails = {row['email'] for row in rows}
+        users = {}
+        for user in User.objects.filter(email__in=emails).order_by('id'):
+            users.setdefault(user.email, user)
+
+        new_users = {}
+        for row in rows:
+            if row['email'] not in users and row['email'] not in new_users:
+                new_users[row['email']] = User(
+                    username=row['email'],
+                    email=row['email'],
+                    first_name=row['first_name'],
+                    last_name=row['last_name'],
+                )
+        if new_users:
+            created = provision_users(new_users.values())
+            users.update({user.email: user for user in created})
+            self.stats['users_created'] += len(created)
+        return users
+
+    def resolve_departments(self, rows):
+        new_departments = {}
+        for row in rows:
+            name = row['department']
+            if name not in self.departments and name not in new_departments:
+                new_departments[name] = Department(company=self.company, name=name)
+        if new_departments:
+            for department in Department.objects.bulk_create(new_departments.values()):
+                self.departments[department.name] = department
+            self.stats['departments_created'] += len(new_departments)
+            # bulk_create sends no post_save, so drop the cached department lists ourselves
+            invalidate(f'departments:{self.company.pk}', 'departments')
+
+    def write_chunk(self, rows):
+        if not rows:
+            return
+        if self.full_roster:
+            self.seen.update(row['fingerprint'] for row in rows)
+        # Rows identical to what was last written cost nothing beyond parsing
+        changed = [row for row in rows if row['fingerprint'] not in self.fingerprints]
+        if changed:
+            self.write_changed(changed)
+        self.stats['rows_unchanged'] += len(rows) - len(changed)
+        self.stats['rows'] += len(rows)
+
+    def write_changed(self, rows):
+        users = self.resolve_users(rows)
+        self.resolve_departments(rows)
+
+        # Later rows for the same employee win, matching the old per-row update_or_create
+        to_create = {}
+        to_update = {}
+        for row in rows:
+            key = (users[row['email']].pk, row['employee_id_hash'])
+            pk = self.employees.get(key)
+            if pk is None:
+                to_create[key] = Employee(
+                    user=users[row['email']],
+                    company=self.company,
+                    _employee_id=row['employee_id'],
+                    employee_id_hash=row['employee_id_hash'],
+                    row_fingerprint=row['fingerprint'],
+                    **row['fields']
+                )
+            else:
+                to_update[key] = Employee(pk=pk, row_fingerprint=row['fingerprint'], **row['fields'])
+
+        # Only new employees need ciphertext; encrypt them as one batch
+        new_employees = list(to_create.values())
+        for employee, token in zip(new_employees, crypto.encrypt_many([employee._employee_id for employee in new_employees])):
+            employee._employee_id = token
+
+        if to_create:
+            Employee.objects.bulk_create(to_create.values())
+            for key, employee in to_create.items():
+                self.employees[key] = employee.pk
+            self.stats['employees_created'] += len(to_create)
+        if to_update:
+            Employee.objects.bulk_update(to_update.values(), EMPLOYEE_UPDATE_FIELDS + ['row_fingerprint'])
+            self.stats['employees_updated'] += len(to_update)
+        self.fingerprints.update(row['fingerprint'] for row in rows)
+
+        # One role per (employee, title, start date); re-sending a row must not duplicate it
+        roles = {}
+        for row in rows:
+            pk = self.employees[(users[row['email']].pk, row['employee_id_hash'])]
+            roles[(pk, row['fields']['role'], str(row['fields']['start_date']))] = row['duties']
+        if to_update:
+            existing = Role.objects.filter(employee_id__in=[employee.pk for employee in to_update.values()])
+            for pk, title, start_date in existing.values_list('employee_id', 'title', 'start_date'):
+                roles.pop((pk, title, str(start_date)), None)
+        new_roles = [
+            Role(employee_id=pk, title=title, start_date=start_date, duties=duties)
+            for (pk, title, start_date), duties in roles.items()
+        ]
+        Role.objects.bulk_create(new_roles)
+        # bulk_create and bulk_update skip the signals that keep timelines and company stats current
+        rebuild_timelines({employee.pk for employee in to_create.values()} | {employee.pk for employee in to_update.values()})
+        mark_stale([self.company.pk])
+        self.stats['roles_created'] += len(new_roles)
+
+    def close_missing(self):
+        """End the employment of uploaded employees the full roster no longer lists."""
+        today = timezone.now().date()
+        listed = Employee.objects.filter(company=self.company, row_fingerprint__isnull=False)
+        missing = [pk for pk, fingerprint in listed.values_list('id', 'row_fingerprint') if fingerprint not in self.seen]
+        for offset in range(0, len(missing), self.chunk_size):
+            batch = missing[offset:offset + self.chunk_size]
+            Employee.objects.filter(Q(end_date__isnull=True) | Q(end_date__gt=today), pk__in=batch).update(end_date=today)
+            # Forget the fingerprint so the employee is written again if they reappear
+            Employee.objects.filter(pk__in=batch).update(row_fingerprint=None)
+            Role.objects.filter(employee_id__in=batch, end_date__isnull=True).update(end_date=today)
+            rebuild_timelines(batch)
+        if missing:
+            mark_stale([self.company.pk])
+        self.stats['employees_removed'] += len(missing)
@@ -0,0 +1,104 @@
+import logging
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .ingest import EmployeeIngest
+from .models import BulkUpload, Department, Employee
+from .readers import DEFAULT_BATCH_SIZE, iter_batches
+from .validation import VALIDATION_BATCH_SIZE, validate_batches
+
+logger = logging.getLogger(__name__)
+
+
+def claim_pending(limit):
+    """Atomically move up to ``limit`` pending uploads to running and return their ids.
+
+    The conditional UPDATE means two workers polling at once never claim the same job.
+    """
+    claimed = []
+    candidates = BulkUpload.objects.filter(status=BulkUpload.PENDING).order_by('uploaded_at').values_list('id', flat=True)[:limit]
+    for upload_id in candidates:
+        updated = BulkUpload.objects.filter(id=upload_id, status=BulkUpload.PENDING).update(
+            status=BulkUpload.RUNNING,
+            started_at=timezone.now(),
+        )
+        if updated:
+            claimed.append(upload_id)
+    return claimed
+
+
+def fingerprinted_employees(company):
+    # API edits clear an employee's fingerprint (see Employee.save), so only uploads raise this count
+    return Employee.objects.filter(company=company, row_fingerprint__isnull=False).count()
+
+
+def applied_upload(company, content_hash, full_roster=False):
+    """The company's latest upload if it is this same file, applied in full with no edits since, else None.
+
+    An older upload of the file doesn't count: a different file may have been applied after it.
+    """
+    latest = BulkUpload.objects.filter(company=company).exclude(status=BulkUpload.FAILED).order_by('-id').first()
+    if (latest is None or latest.status != BulkUpload.DONE or latest.content_hash != content_hash
+            or latest.rows_failed or (full_roster and not latest.full_roster)):
+        return None
+    return latest if latest.fingerprinted == fingerprinted_employees(company) else None
+
+
+def process_upload(upload_id, batch_size=DEFAULT_BATCH_SIZE):
+    close_old_connections()
+    upload = BulkUpload.objects.select_related('company').get(id=upload_id)
+
+    def progress(stats):
+        BulkUpload.objects.filter(id=upload.id).update(rows_done=stats['rows'], rows_failed=stats['rows_failed'])
+
+    try:
+        report = validate_upload(upload)
+        if len(report):
+            return reject_upload(upload, report)
+        with upload.file.open('rb') as f:
+            batches = iter_batches(f, upload.file.name, batch_size)
+            ingest = EmployeeIngest(upload.company, chunk_size=batch_size, full_roster=upload.full_roster)
+            stats = ingest.run(batches, progress=progress)
+    except Exception as e:
+        logger.exception('Bulk upload %s failed', upload.id)
+        BulkUpload.objects.filter(id=upload.id).update(
+            status=BulkUpload.FAILED,
+            error=str(e),
+            finished_at=timezone.now(),
+        )
+        return {'id': upload.id, 'status': BulkUpload.FAILED}
+
+    status = BulkUpload.FAILED if stats['rows_failed'] and not stats['rows'] else BulkUpload.DONE
+    BulkUpload.objects.filter(id=upload.id).update(
+        status=status,
+        processed=status == BulkUpload.DONE,
+        rows_done=stats['rows'],
+        rows_failed=stats['rows_failed'],
+        fingerprinted=fingerprinted_employees(upload.company),
+        error=stats.get('error', ''),
+        finished_at=timezone.now(),
+    )
+    return {'id': upload.id, 'status': status, **stats}
+
+
+def validate_upload(upload):
+    """Check the whole file before anything is written; returns the error report (empty when clean)."""
+    # A company without departments gets them from its first roster; after that names must match
+    departments = Department.objects.filter(company=upload.company).values_list('name', flat=True)
+    with upload.file.open('rb') as f:
+        return validate_batches(iter_batches(f, upload.file.name, VALIDATION_BATCH_SIZE), departments)
+
+
+def reject_upload(upload, report):
+    rows_failed = report['row'].nunique()
+    upload.error_report.save(f'upload_{upload.id}_errors.csv', ContentFile(report.to_csv(index=False).encode('utf-8')), save=False)
+    BulkUpload.objects.filter(id=upload.id).update(
+        status=BulkUpload.FAILED,
+        rows_failed=rows_failed,
+        error=f'{len(report)} problems in {rows_failed} rows; nothing was written. See the error report.',
+        error_report=upload.error_report.name,
+        finished_at=timezone.now(),
+    )
+    return {'id': upload.id, 'status': BulkUpload.FAILED, 'problems': len(report)}
@@ -0,0 +1,295 @@
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from itertools import cycle
+
+import django
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from django.utils import timezone
+from api.jobs import process_upload
+from api.models import Company, Employee
+from api.profiling import profile_queries
+from .bench_search import QUERIES
+from .bench_upload_memory import write_rows
+from .seed_bench import BENCH_USERNAME, LOGIN_HELP, bench_password, seed_dataset
+
+SCENARIOS = ['login', 'companies', 'departments', 'search', 'role_history', 'employee', 'bulk_upload']
+PERCENTILES = (50, 95, 99)
+UPLOAD_TIMEOUT = 120
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class ClientTransport:
+    """In-process requests through the Django test client; query counts come from the profiler."""
+
+    def __init__(self):
+        self.client = Client()
+        self.headers = {}
+
+    def authenticate(self, token):
+        self.headers = {'HTTP_AUTHORIZATION': f'Token {token}'}
+
+    def request(self, method, path, data=None, files=None):
+        with profile_queries() as profile:
+            if method == 'GET':
+                response = self.client.get(path, data, **self.headers)
+            elif files:
+                response = self.client.post(path, {**(data or {}), **files}, **self.headers)
+            else:
+                response = self.client.post(path, data, content_type='application/json', **self.headers)
+            body = response.json() if response.get('Content-Type', '').startswith('application/json') else None
+            if files and response.status_code == 202:
+                # No worker runs in-process, so the upload is processed inline and timed with the request
+                process_upload(body['id'])
+        return response.status_code, body, profile.count
+
+
+class HTTPTransport:
+    """Requests against a running server (runserver, gunicorn, ...).
+
+    Query counts are read from X-Query-Count, so start the server with QUERY_PROFILER=True to get them.
+    """
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.headers = {}
+
+    def authenticate(self, token):
+        self.headers = {'Authorization': f'Token {token}'}
+
+    def request(self, method, path, data=None, files=None):
+        url = self.base_url + path
+        headers = dict(self.headers)
+        payload = None
+        if method == 'GET' and data:
+            url += '?' + urllib.parse.urlencode(data)
+        elif files:
+            payload, headers['Content-Type'] = self.multipart(data or {}, files)
+        elif data is not None:
+            payload, headers['Content-Type'] = json.dumps(data).encode(), 'application/json'
+        request = urllib.request.Request(url, data=payload, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request) as response:
+                status, raw, response_headers = response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            status, raw, response_headers = e.code, e.read(), e.headers
+        body = json.loads(raw) if response_headers.get('Content-Type', '').startswith('application/json') else None
+        queries = int(response_headers['X-Query-Count']) if 'X-Query-Count' in response_headers else None
+        if files and status == 202:
+            status, queries = self.wait_for_upload(body['status_url'], queries)
+        return status, body, queries
+
+    def wait_for_upload(self, status_url, queries):
+        # The upload counts as done when the process_uploads worker has finished it
+        path = urllib.parse.urlsplit(status_url).path
+        deadline = time.monotonic() + UPLOAD_TIMEOUT
+        while time.monotonic() < deadline:
+            status, body, _ = self.request('GET', path)
+            if status != 200:
+                return status, queries
+            if body['status'] in ('done', 'failed'):
+                return (200 if body['status'] == 'done' else 500), queries
+            time.sleep(0.05)
+        raise CommandError(f'Upload {status_url} not processed after {UPLOAD_TIMEOUT}s; is process_uploads running?')
+
+    def multipart(self, data, files):
+        boundary = uuid.uuid4().hex
+        parts = []
+        for name, value in data.items():
+            parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for name, f in files.items():
+            parts.append(
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{os.path.basename(f.name)}"\r\n'
+                f'Content-Type: application/octet-stream\r\n\r\n'.encode() + f.read() + b'\r\n'
+            )
+        parts.append(f'--{boundary}--\r\n'.encode())
+        return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class Command(BaseCommand):
+    help = 'Run the API benchmark scenarios and report latency percentiles, throughput and queries per request as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000',
+                            help='Comma separated employee counts, each seeded into a throwaway test database (test client mode)')
+        parser.add_argument('--url', help='Benchmark a running server instead, e.g. http://127.0.0.1:8000 (seed it with seed_bench)')
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Comma separated subset of {', '.join(SCENARIOS)}")
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per scenario')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per scenario')
+        parser.add_argument('--upload-rows', type=int, default=500, help='Rows per bulk_upload request')
+        parser.add_argument('--output', help='Write the results as JSON to this path')
+        parser.add_argument('--baseline', help='Compare against results stored by an earlier --output')
+        parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown against the baseline (0.25 = 25%%)')
+        parser.add_argument('--fail-on-regression', action='store_true', help='Exit with an error when a regression is found')
+
+    def handle(self, *args, **options):
+        scenarios = options['scenarios'].split(',')
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+        results = {
+            'meta': {
+                'target': options['url'] or f'test client ({connection.vendor})',
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'created': timezone.now().isoformat(),
+            },
+            'results': {},
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            if options['url']:
+                results['results']['live'] = self.run_scenarios(HTTPTransport(options['url']), scenarios, tmp, options)
+            else:
+                results['results'] = self.run_sizes(scenarios, tmp, options)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+        else:
+            self.stdout.write(json.dumps(results, indent=2))
+
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                regressions = self.compare(json.load(f), results, options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{len(regressions)} regressions against {options["baseline"]}')
+
+    def run_sizes(self, scenarios, tmp, options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        setup_test_environment()
+        # Runs against a throwaway test database, never the configured one
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            with override_settings(MEDIA_ROOT=tmp):
+                results = {}
+                for size in sizes:
+                    seed_dataset(size)
+                    # Seeding bypasses the signals that version the response cache
+                    cache.clear()
+                    self.stdout.write(f'{size} employees seeded')
+                    results[str(size)] = self.run_scenarios(ClientTransport(), scenarios, tmp, options)
+                return results
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+    def run_scenarios(self, transport, scenarios, tmp, options):
+        status, body, _ = transport.request('POST', '/api/login/', {'username': BENCH_USERNAME, 'password': bench_password()})
+        if status != 200:
+            raise CommandError(f'Could not log in as {BENCH_USERNAME} ({LOGIN_HELP}): {body}')
+        transport.authenticate(body['token'])
+        fixtures = self.fixtures(transport)
+
+        results = {}
+        for name in scenarios:
+            requests = getattr(self, f'scenario_{name}')(fixtures, tmp, options['upload_rows'])
+            for _ in range(options['warmup']):
+                transport.request(*next(requests))
+            samples, queries, errors = [], [], 0
+            started = time.perf_counter()
+            for _ in range(options['iterations']):
+                method, path, data, files = next(requests)
+                request_started = time.perf_counter()
+                status, _, query_count = transport.request(method, path, data, files)
+                samples.append((time.perf_counter() - request_started) * 1000)
+                errors += status >= 400
+                if query_count is not None:
+                    queries.append(query_count)
+            elapsed = time.perf_counter() - started
+            results[name] = {
+                **{f'p{pct}_ms': round(percentile(samples, pct), 2) for pct in PERCENTILES},
+                'mean_ms': round(statistics.mean(samples), 2),
+                'throughput_rps': round(len(samples) / elapsed, 1),
+                'queries_per_request': round(statistics.mean(queries), 1) if queries else None,
+                'errors': errors,
+            }
+            self.stdout.write(
+                f"{name:>14}: p50 {results[name]['p50_ms']:8.2f} ms  p95 {results[name]['p95_ms']:8.2f} ms  "
+                f"p99 {results[name]['p99_ms']:8.2f} ms  {results[name]['throughput_rps']:8.1f} req/s  "
+                f"{results[name]['queries_per_request']} queries  {errors} errors"
+            )
+        return results
+
+    def fixtures(self, transport):
+        if isinstance(transport, ClientTransport):
+            company_ids = list(Company.objects.filter(name__startswith='Bench ').values_list('id', flat=True))
+            employee_ids = list(Employee.objects.filter(company_id__in=company_ids).order_by('?').values_list('id', flat=True)[:200])
+        else:
+            _, companies, _ = transport.request('GET', '/api/companies/', {'page_size': 100})
+            company_ids = [company['id'] for company in companies['results'] if company['name'].startswith('Bench ')]
+            _, employees, _ = transport.request('GET', '/api/employees/', {'page_size': 200})
+            employee_ids = [employee['id'] for employee in employees['results']]
+        if not company_ids or not employee_ids:
+            raise CommandError('No benchmark data found; run seed_bench first')
+        return {'company_ids': company_ids, 'employee_ids': employee_ids}
+
+    def scenario_login(self, fixtures, tmp, upload_rows):
+        while True:
+            yield 'POST', '/api/login/', {'username': BENCH_USERNAME, 'password': bench_password()}, None
+
+    def scenario_companies(self, fixtures, tmp, upload_rows):
+        while True:
+            yield 'GET', '/api/companies/', None, None
+
+    def scenario_departments(self, fixtures, tmp, upload_rows):
+        for company_id in cycle(fixtures['company_ids']):
+            yield 'GET', f'/api/companies/{company_id}/departments/', None, None
+
+    def scenario_search(self, fixtures, tmp, upload_rows):
+        for query in cycle(QUERIES):
+            yield 'GET', '/api/employees/search/', {'q': query}, None
+
+    def scenario_role_history(self, fixtures, tmp, upload_rows):
+        for employee_id in cycle(fixtures['employee_ids']):
+            yield 'GET', f'/api/employees/{employee_id}/role-history/', None, None
+
+    def scenario_employee(self, fixtures, tmp, upload_rows):
+        for employee_id in cycle(fixtures['employee_ids']):
+            yield 'GET', f'/api/employees/{employee_id}/', None, None
+
+    def scenario_bulk_upload(self, fixtures, tmp, upload_rows):
+        path = os.path.join(tmp, f'bench_upload_{upload_rows}.csv')
+        for iteration, company_id in enumerate(cycle(fixtures['company_ids'])):
+            # A new role on every row each time, so no upload is skipped as identical and every row is rewritten
+            write_rows(path, 'csv', upload_rows, role=f'Analyst {iteration}')
+            with open(path, 'rb') as f:
+                yield 'POST', '/api/employees/bulk_upload/', {'company': company_id}, {'file': f}
+
+    def compare(self, baseline, current, tolerance):
+        regressions = []
+        for size, scenarios in current['results'].items():
+            for name, result in scenarios.items():
+                before = baseline.get('results', {}).get(size, {}).get(name)
+                if not before:
+                    continue
+                change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+                line = f"{size:>8} {name:>14}: p95 {before['p95_ms']:8.2f} -> {result['p95_ms']:8.2f} ms ({change:+.0%})"
+                more_queries = (result['queries_per_request'] or 0) > (before['queries_per_request'] or 0)
+                if more_queries:
+                    line += f"  queries {before['queries_per_request']} -> {result['queries_per_request']}"
+                if change > tolerance or more_queries:
+                    regressions.append(line)
+                    self.stdout.write(self.style.ERROR(line))
+                else:
+                    self.stdout.write(line)
+        if not regressions:
+            self.stdout.write(self.style.SUCCESS('No regressions against the baseline'))
+        return regressions
@@ -0,0 +1,109 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from itertools import cycle
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from .bench_api import HTTPTransport, percentile
+from .bench_search import QUERIES
+from .seed_bench import BENCH_USERNAME, LOGIN_HELP, bench_password
+
+DEPLOYMENTS = {
+    'sync': ['talent_verify.wsgi:application'],
+    'async': ['talent_verify.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare the sync (WSGI) and async (uvicorn worker) deployments under concurrent load at the same worker count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='gunicorn workers for both deployments')
+        parser.add_argument('--concurrency', default='1,8,32', help='Comma separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=400, help='Requests per deployment and concurrency level')
+        parser.add_argument('--port', type=int, default=8799)
+        parser.add_argument('--output', help='Write the results as JSON to this path')
+
+    def handle(self, *args, **options):
+        levels = [int(level) for level in options['concurrency'].split(',')]
+        results = []
+        for deployment, target in DEPLOYMENTS.items():
+            server = self.start(target, options['workers'], options['port'])
+            try:
+                transport = HTTPTransport(f"http://127.0.0.1:{options['port']}")
+                status, body, _ = transport.request('POST', '/api/login/', {'username': BENCH_USERNAME, 'password': bench_password()})
+                if status != 200:
+                    raise CommandError(f'Could not log in; seed the database with seed_bench first and {LOGIN_HELP}')
+                transport.authenticate(body['token'])
+                _, page, _ = transport.request('GET', '/api/employees/', {'page_size': 100})
+                employee_ids = [employee['id'] for employee in page['results']]
+                if not employee_ids:
+                    raise CommandError('No employees found; seed the database with seed_bench first')
+
+                for concurrency in levels:
+                    result = self.load(transport, employee_ids, concurrency, options['requests'])
+                    result.update(deployment=deployment, workers=options['workers'], concurrency=concurrency)
+                    results.append(result)
+                    self.stdout.write(
+                        f"{deployment:>5}  {concurrency:>4} clients: {result['throughput_rps']:8.1f} req/s  "
+                        f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  p99 {result['p99_ms']:8.2f} ms  "
+                        f"{result['errors']} errors"
+                    )
+            finally:
+                server.terminate()
+                server.wait()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def start(self, target, workers, port):
+        command = [sys.executable, '-m', 'gunicorn', *target, '-w', str(workers), '-b', f'127.0.0.1:{port}', '--log-level', 'warning']
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env={**os.environ, 'QUERY_PROFILER': 'False'})
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(f'http://127.0.0.1:{port}/api/companies/', timeout=1)
+                return server
+            except urllib.error.HTTPError:
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"Server did not start: {' '.join(command)}")
+
+    def load(self, transport, employee_ids, concurrency, total):
+        # The same mix of async read endpoints for both deployments
+        paths = cycle([
+            ('/api/employees/search/', {'q': query}) for query in QUERIES
+        ] + [
+            (f'/api/employees/{employee_id}/', None) for employee_id in employee_ids[:10]
+        ] + [
+            (f'/api/employees/{employee_id}/role-history/', None) for employee_id in employee_ids[10:20]
+        ])
+        requests = [next(paths) for _ in range(total)]
+
+        def timed(request):
+            started = time.perf_counter()
+            status, _, _ = transport.request('GET', *request)
+            return (time.perf_counter() - started) * 1000, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            measured = list(pool.map(timed, requests))
+        elapsed = time.perf_counter() - started
+        samples = [ms for ms, _ in measured]
+        return {
+            'throughput_rps': round(len(samples) / elapsed, 1),
+            'p50_ms': round(percentile(samples, 50), 2),
+            'p95_ms': round(percentile(samples, 95), 2),
+            'p99_ms': round(percentile(samples, 99), 2),
+            'errors': sum(status >= 400 for _, status in measured),
+        }
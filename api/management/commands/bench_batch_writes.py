@@ -0,0 +1,115 @@
+import json
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+from api.models import Company
+from .bench_api import ClientTransport, HTTPTransport
+from .seed_bench import BENCH_USERNAME, LOGIN_HELP, bench_password, seed_dataset
+
+
+class Command(BaseCommand):
+    help = 'Compare writing employees and roles one request per object against the list-accepting batch endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000, help='Employees (and roles) written by each mode')
+        parser.add_argument('--batch-size', type=int, default=500, help='Objects per batch request')
+        parser.add_argument('--url', help='Benchmark a running server instead, e.g. http://127.0.0.1:8000 (seed it with seed_bench)')
+        parser.add_argument('--output', help='Write the results as JSON to this path')
+
+    def handle(self, *args, **options):
+        if options['url']:
+            results = self.run(HTTPTransport(options['url']), options)
+        else:
+            setup_test_environment()
+            # Runs against a throwaway test database, never the configured one
+            old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+            try:
+                seed_dataset(0, companies=1)
+                results = self.run(ClientTransport(), options)
+            finally:
+                teardown_databases(old_config, verbosity=0)
+                teardown_test_environment()
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def run(self, transport, options):
+        status, body, _ = transport.request('POST', '/api/login/', {'username': BENCH_USERNAME, 'password': bench_password()})
+        if status != 200:
+            raise CommandError(f'Could not log in as {BENCH_USERNAME} ({LOGIN_HELP}): {body}')
+        transport.authenticate(body['token'])
+        company_id = self.company_id(transport)
+
+        count, size = options['items'], options['batch_size']
+        results = []
+        employee_ids = {}
+        for mode in ('single', 'batch'):
+            prefix = uuid.uuid4().hex[:8]
+            items = [{
+                'company': company_id, 'name': f'Batch Bench {index}', 'department': 'IT', 'role': 'Data Analyst',
+                'employee_id': f'{prefix}-{index:06d}', 'start_date': '2021-01-01',
+            } for index in range(count)]
+            if mode == 'single':
+                requests = [('/api/employees/', item) for item in items]
+            else:
+                requests = [('/api/employees/', items[start:start + size]) for start in range(0, count, size)]
+            result, bodies = self.measure('employees', mode, transport, requests, count)
+            employee_ids[mode] = bodies[0]['id'] if mode == 'single' else bodies[0]['results'][0]['id']
+            results.append(result)
+
+        for mode in ('single', 'batch'):
+            employee_id = employee_ids[mode]
+            roles = [{'employee': employee_id, 'title': f'Role {index}', 'start_date': '2021-01-01', 'duties': '-'}
+                     for index in range(count)]
+            path = f'/api/employees/{employee_id}/roles/'
+            if mode == 'single':
+                requests = [(path, role) for role in roles]
+            else:
+                requests = [(path, roles[start:start + size]) for start in range(0, count, size)]
+            results.append(self.measure('roles', mode, transport, requests, count)[0])
+
+        for single, batch in ((results[0], results[1]), (results[2], results[3])):
+            batch['speedup'] = round(single['seconds'] / batch['seconds'], 1) if batch['seconds'] else None
+        for result in results:
+            queries = f"{result['queries_per_item']:6.2f}" if result['queries_per_item'] is not None else '     -'
+            self.stdout.write(
+                f"{result['kind']:>9} {result['mode']:>6}: {result['items']} items in {result['requests']:>5} requests  "
+                f"{result['seconds']:8.2f} s  {result['items_per_second']:9.1f} items/s  {queries} queries/item"
+                + (f"  {result['speedup']}x" if 'speedup' in result else '')
+            )
+        return results
+
+    def company_id(self, transport):
+        if isinstance(transport, ClientTransport):
+            company_ids = list(Company.objects.filter(name__startswith='Bench ').values_list('id', flat=True))
+        else:
+            _, companies, _ = transport.request('GET', '/api/companies/', {'page_size': 100})
+            company_ids = [company['id'] for company in companies['results'] if company['name'].startswith('Bench ')]
+        if not company_ids:
+            raise CommandError('No benchmark company found; run seed_bench first')
+        return company_ids[0]
+
+    def measure(self, kind, mode, transport, requests, count):
+        bodies = []
+        queries = 0
+        started = time.perf_counter()
+        for path, data in requests:
+            status, body, request_queries = transport.request('POST', path, data)
+            if status not in (200, 201):
+                raise CommandError(f'POST {path} returned {status}: {body}')
+            bodies.append(body)
+            queries = None if request_queries is None or queries is None else queries + request_queries
+        elapsed = time.perf_counter() - started
+        return {
+            'kind': kind,
+            'mode': mode,
+            'items': count,
+            'requests': len(requests),
+            'seconds': round(elapsed, 3),
+            'items_per_second': round(count / elapsed, 1) if elapsed else 0.0,
+            'queries_per_item': round(queries / count, 2) if queries is not None else None,
+        }, bodies
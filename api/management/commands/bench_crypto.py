@@ -0,0 +1,43 @@
+import time
+
+from cryptography.fernet import Fernet
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api import crypto
+
+
+def per_row_decrypt(tokens):
+    # What encrypt_data/decrypt_data and Employee.employee_id did before the key ring
+    return [Fernet(settings.ENCRYPTION_KEY).decrypt(token.encode('utf-8')).decode('utf-8') for token in tokens]
+
+
+def cached_decrypt(tokens):
+    return [crypto.decrypt(token) for token in tokens]
+
+
+class Command(BaseCommand):
+    help = 'Compare per-row Fernet construction with the cached key ring for employee ID decryption'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        tokens = crypto.encrypt_many([f'EMP{i:08d}' for i in range(rows)])
+        cases = [
+            ('per-row Fernet', per_row_decrypt),
+            ('cached key ring', cached_decrypt),
+            ('decrypt_many', crypto.decrypt_many),
+        ]
+        baseline = None
+        for label, decrypt in cases:
+            best = min(self.time(decrypt, tokens) for _ in range(options['repeat']))
+            rate = rows / best
+            baseline = baseline or rate
+            self.stdout.write(f'{label:>16}: {rate:>10.0f} decrypts/s  ({rate / baseline:.2f}x)')
+
+    def time(self, decrypt, tokens):
+        started = time.perf_counter()
+        decrypt(tokens)
+        return time.perf_counter() - started
@@ -0,0 +1,52 @@
+import statistics
+import time
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from .bench_api import percentile
+
+MODES = {
+    'new': ('django.db.backends.postgresql', 0),
+    'persistent': ('django.db.backends.postgresql', 600),
+    'pool': ('api.backends.postgresql_pool', 0),
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare per-request latency with a new connection per request, persistent connections and the pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Simulated requests per mode')
+        parser.add_argument('--database', default='default')
+
+    def handle(self, *args, **options):
+        settings_dict = connections[options['database']].settings_dict
+        if connections[options['database']].vendor != 'postgresql':
+            raise CommandError('This benchmark needs a PostgreSQL database')
+
+        for mode, (engine, conn_max_age) in MODES.items():
+            wrapper = import_module(f'{engine}.base').DatabaseWrapper(
+                {**settings_dict, 'ENGINE': engine, 'CONN_MAX_AGE': conn_max_age}, alias=f'bench_{mode}'
+            )
+            samples = []
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                # What request_started/request_finished do around every request
+                wrapper.close_if_unusable_or_obsolete()
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT id FROM api_company ORDER BY id LIMIT 1')
+                    cursor.fetchall()
+                wrapper.close_if_unusable_or_obsolete()
+                samples.append((time.perf_counter() - started) * 1000)
+            wrapper.close()
+            self.stdout.write(
+                f'{mode:>10}: p50 {statistics.median(samples):7.2f} ms  p95 {percentile(samples, 95):7.2f} ms  '
+                f'p99 {percentile(samples, 99):7.2f} ms'
+            )
+            if mode == 'pool':
+                stats = wrapper.pool.stats()
+                self.stdout.write(
+                    f"{'':>10}  {stats['connections_opened']} connections opened for {stats['checkouts']} checkouts, "
+                    f"checkout avg {stats['checkout_ms_avg']} ms"
+                )
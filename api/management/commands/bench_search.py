@@ -0,0 +1,77 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_databases, teardown_databases
+from api.models import Company, Employee
+from api.search import search_employees
+
+FIRST_NAMES = ['Tendai', 'Rutendo', 'Tatenda', 'Nyasha', 'Farai', 'Chipo', 'Kudzai', 'Tafadzwa', 'Rumbidzai',
+               'Tinashe', 'Simba', 'Natasha', 'Tamia', 'John', 'Mary', 'Peter', 'Grace', 'James', 'Ruth', 'David']
+LAST_NAMES = ['Moyo', 'Ncube', 'Sibanda', 'Dube', 'Mpofu', 'Ndlovu', 'Chikore', 'Mutasa', 'Banda', 'Phiri',
+              'Gumbo', 'Marufu', 'Zhou', 'Chirwa', 'Mhlanga', 'Nyathi', 'Shumba', 'Mlambo', 'Sithole', 'Tshuma']
+ROLES = ['Accountant', 'Software Engineer', 'HR Officer', 'Sales Representative', 'Data Analyst', 'Nurse',
+         'Teacher', 'Driver', 'Receptionist', 'Project Manager']
+DEPARTMENTS = ['Finance', 'IT', 'HR', 'Sales', 'Operations', 'Marketing', 'Logistics', 'Legal']
+QUERIES = ['tendai', 'moyo', 'kudzai ncube', 'engineer', 'tat', 'finance', 'mary phiri', 'data analyst', 'sibanda hr', 'zz']
+
+
+def seed(company, user, count, batch_size=5000):
+    rng = random.Random(count)
+    existing = Employee.objects.count()
+    for start in range(existing, count, batch_size):
+        Employee.objects.bulk_create([
+            Employee(
+                user=user,
+                company=company,
+                _employee_id='-',
+                name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                role=rng.choice(ROLES),
+                position=rng.choice(['Junior', 'Senior', 'Lead', 'Intern']),
+                department=rng.choice(DEPARTMENTS),
+            )
+            for _ in range(start, min(start + batch_size, count))
+        ])
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Measure employee search latency against the unindexed icontains scan at several table sizes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000', help='Comma separated employee counts, e.g. 10000,100000,1000000')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each query per size')
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        # Runs against a throwaway test database, never the configured one
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            user = User.objects.create(username='bench')
+            company = Company.objects.create(
+                name='Bench', registration_date='2020-01-01', address='-', contact_person='-', contact_phone='-', email='bench@example.com'
+            )
+            for size in sizes:
+                seed(company, user, size)
+                self.report(size, 'icontains scan', lambda q: list(Employee.objects.filter(name__icontains=q)), options['repeat'])
+                self.report(size, 'indexed search', lambda q: search_employees(q, limit=20), options['repeat'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+    def report(self, size, label, run, repeat):
+        samples = []
+        for _ in range(repeat):
+            for query in QUERIES:
+                started = time.perf_counter()
+                run(query)
+                samples.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(
+            f'{size:>9} employees  {label:>15}: p50 {statistics.median(samples):8.2f} ms  '
+            f'p95 {percentile(samples, 95):8.2f} ms  max {max(samples):8.2f} ms'
+        )
@@ -0,0 +1,62 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from api.models import Company, Employee
+from api.serializers import EMPLOYEE_READ_COLUMNS, EmployeeReadSerializer, EmployeeSerializer
+from .bench_search import seed
+
+
+class Command(BaseCommand):
+    help = 'Compare EmployeeSerializer with EmployeeReadSerializer on list-sized pages (objects per second)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Employees to seed')
+        parser.add_argument('--page-size', type=int, default=500, help='Employees serialized per page')
+        parser.add_argument('--repeat', type=int, default=3, help='Passes over the table per serializer')
+
+    def handle(self, *args, **options):
+        old_config = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+        try:
+            user = User.objects.create_superuser('bench', 'bench@example.com', 'bench')
+            company = Company.objects.create(
+                name='Bench', registration_date='2020-01-01', address='-', contact_person='-', contact_phone='-', email='bench@example.com'
+            )
+            seed(company, user, options['rows'])
+            employees = list(Employee.objects.order_by('id'))
+            for employee in employees:
+                employee.employee_id = f'EMP{employee.pk:07d}'
+            Employee.objects.bulk_update(employees, ['_employee_id', 'employee_id_hash'], batch_size=1000)
+
+            request = Request(APIRequestFactory().get('/api/employees/'))
+            request.user = user
+            page_size = options['page_size']
+            pages = [(start, start + page_size) for start in range(0, options['rows'], page_size)]
+            queryset = Employee.objects.order_by('id')
+
+            def model_serializer(start, end):
+                return EmployeeSerializer(queryset[start:end], many=True, context={'request': request}).data
+
+            def read_serializer(start, end):
+                return EmployeeReadSerializer(queryset.values(*EMPLOYEE_READ_COLUMNS)[start:end], many=True).data
+
+            renderer = JSONRenderer()
+            for start, end in pages[:3]:
+                if renderer.render(model_serializer(start, end)) != renderer.render(read_serializer(start, end)):
+                    raise CommandError(f'Serializers disagree on rows {start}-{end}')
+
+            for label, serialize in (('EmployeeSerializer', model_serializer), ('EmployeeReadSerializer', read_serializer)):
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    for start, end in pages:
+                        serialize(start, end)
+                elapsed = time.perf_counter() - started
+                objects = options['rows'] * options['repeat']
+                self.stdout.write(f'{label:>24}: {objects / elapsed:10.0f} objects/s  ({elapsed:.2f}s)')
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        self.stdout.write(self.style.SUCCESS('JSON output identical'))
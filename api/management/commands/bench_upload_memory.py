@@ -0,0 +1,118 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+FORMATS = ['csv', 'txt', 'xlsx', 'json', 'ndjson']
+HEADER = ['email', 'employee_id', 'first_name', 'last_name', 'department', 'role',
+          'start_date', 'end_date', 'phone_number', 'position', 'duties']
+
+# Runs in a fresh interpreter so each measurement starts from the same baseline.
+# ru_maxrss is read after the imports, so the reported growth is what parsing costs.
+CHILD = r'''
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+import pandas as pd
+from api.readers import iter_batches
+path, fmt, mode, batch_size = sys.argv[2], sys.argv[3], sys.argv[4], int(sys.argv[5])
+baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+started = time.perf_counter()
+rows = 0
+if mode == 'stream':
+    with open(path, 'rb') as f:
+        for batch in iter_batches(f, path, batch_size):
+            rows += len(batch)
+elif fmt == 'xlsx':
+    rows = len(pd.read_excel(path))
+elif fmt == 'json':
+    with open(path) as f:
+        rows = len(pd.DataFrame(json.load(f)))
+elif fmt == 'ndjson':
+    rows = len(pd.read_json(path, lines=True))
+else:
+    rows = len(pd.read_csv(path, header=None if fmt == 'txt' else 'infer'))
+peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'rows': rows, 'seconds': time.perf_counter() - started, 'baseline_kb': baseline, 'peak_kb': peak}))
+'''
+
+
+def write_rows(path, fmt, size, role='Analyst'):
+    rows = (
+        [f'user{i}@example.com', f'EMP{i:08d}', 'First', f'Last{i}', f'Dept{i % 20}', role,
+         '2020-01-01', '', '0770000000', 'Staff', 'Reconciling accounts and preparing reports']
+        for i in range(size)
+    )
+    if fmt in ('csv', 'txt'):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            if fmt == 'csv':
+                writer.writerow(HEADER)
+            writer.writerows(rows)
+    elif fmt == 'xlsx':
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(HEADER)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+    elif fmt == 'ndjson':
+        with open(path, 'w') as f:
+            for row in rows:
+                f.write(json.dumps(dict(zip(HEADER, row))) + '\n')
+    else:
+        with open(path, 'w') as f:
+            f.write('[')
+            for i, row in enumerate(rows):
+                f.write((',' if i else '') + json.dumps(dict(zip(HEADER, row))))
+            f.write(']')
+
+
+class Command(BaseCommand):
+    help = 'Benchmark peak RSS of streaming vs whole-file upload parsing against file size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000', help='Comma separated row counts')
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--output', help='Write the results as JSON to this path')
+
+    def handle(self, *args, **options):
+        fmt = options['format']
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        results = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for size in sizes:
+                path = os.path.join(tmp, f'employees_{size}.{fmt}')
+                write_rows(path, fmt, size)
+                file_mb = os.path.getsize(path) / 1024 / 1024
+                for mode in ('eager', 'stream'):
+                    output = subprocess.run(
+                        [sys.executable, '-c', CHILD, str(settings.BASE_DIR), path, fmt, mode, str(options['batch_size'])],
+                        check=True, capture_output=True, text=True,
+                    ).stdout
+                    measured = json.loads(output.strip().splitlines()[-1])
+                    result = {
+                        'format': fmt,
+                        'mode': mode,
+                        'rows': measured['rows'],
+                        'file_mb': round(file_mb, 2),
+                        'peak_rss_mb': round(measured['peak_kb'] / 1024, 2),
+                        'peak_rss_growth_mb': round((measured['peak_kb'] - measured['baseline_kb']) / 1024, 2),
+                        'seconds': round(measured['seconds'], 3),
+                    }
+                    results.append(result)
+                    self.stdout.write(
+                        f"{mode:>6} {result['rows']:>9} rows  {result['file_mb']:>8} MB file  "
+                        f"{result['peak_rss_mb']:>8} MB peak RSS (+{result['peak_rss_growth_mb']})  {result['seconds']:>7}s"
+                    )
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
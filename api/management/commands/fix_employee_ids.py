@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from cryptography.fernet import Fernet, InvalidToken
-from api.models import Employee
+from cryptography.fernet import InvalidToken
+from api import crypto
+from api.models import Employee, blind_index
 import base64
 
 class Command(BaseCommand):
@@ -9,7 +9,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         try:
-            f = Fernet(settings.ENCRYPTION_KEY)
+            crypto.get_key_ring()
             self.stdout.write(self.style.SUCCESS(f"ENCRYPTION_KEY is valid"))
         except (TypeError, ValueError) as e:
             self.stdout.write(self.style.ERROR(f'Invalid ENCRYPTION_KEY in settings: {str(e)}'))
@@ -20,12 +20,16 @@ class Command(BaseCommand):
             if employee._employee_id:
                 try:
                     # Try to decrypt
-                    decrypted = f.decrypt(employee._employee_id.encode('utf-8')).decode('utf-8')
+                    decrypted = crypto.decrypt(employee._employee_id)
                     self.stdout.write(self.style.SUCCESS(f"Employee {employee.id}: Successfully decrypted: {decrypted}"))
+                    if employee.employee_id_hash != blind_index(decrypted):
+                        employee.employee_id_hash = blind_index(decrypted)
+                        employee.save(update_fields=['employee_id_hash'])
+                        self.stdout.write(self.style.WARNING(f"Employee {employee.id}: Rebuilt employee_id_hash"))
                 except (InvalidToken, UnicodeDecodeError, base64.binascii.Error) as e:
                     # If decryption fails, set a placeholder value
                     placeholder = f"PLACEHOLDER_{employee.id}"
-                    employee._employee_id = f.encrypt(placeholder.encode('utf-8')).decode('utf-8')
+                    employee.employee_id = placeholder
                     employee.save()
                     self.stdout.write(self.style.WARNING(f"Employee {employee.id}: Set placeholder value. Original value: {employee._employee_id}. Error: {str(e)}"))
                 except Exception as e:
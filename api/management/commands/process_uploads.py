@@ -0,0 +1,70 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from api.jobs import claim_pending, process_upload
+from api.models import BulkUpload
+from api.readers import DEFAULT_BATCH_SIZE
+
+
+def init_worker():
+    # Forked workers must not share the parent's database sockets
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Process queued bulk uploads with a local process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Number of worker processes')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Rows read and written per batch')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between queue polls')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--requeue-running', action='store_true', help='Requeue jobs left running by a crashed worker')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if options['requeue_running']:
+            requeued = BulkUpload.objects.filter(status=BulkUpload.RUNNING).update(status=BulkUpload.PENDING)
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} running uploads'))
+
+        self.stdout.write(self.style.SUCCESS(f'Processing bulk uploads with {workers} workers'))
+        running = set()
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+            while True:
+                free = workers - len(running)
+                if free > 0:
+                    claimed = claim_pending(free)
+                    # Workers are forked on submit; don't hand them our open connection
+                    connections.close_all()
+                    for upload_id in claimed:
+                        self.stdout.write(f'Upload {upload_id}: started')
+                        running.add(pool.submit(process_upload, upload_id, options['batch_size']))
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, running = wait(running, timeout=options['poll_interval'], return_when=FIRST_COMPLETED)
+                running = set(running)
+                for future in done:
+                    self.report(future)
+
+        self.stdout.write(self.style.SUCCESS('Upload queue is empty'))
+
+    def report(self, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            self.stdout.write(self.style.ERROR(f'Worker crashed: {str(e)}'))
+            return
+        if result['status'] == BulkUpload.DONE:
+            self.stdout.write(self.style.SUCCESS(
+                f"Upload {result['id']}: {result['rows']} rows, {result['rows_failed']} failed, "
+                f"{result['rows_per_second']} rows/s"
+            ))
+        else:
+            self.stdout.write(self.style.ERROR(f"Upload {result['id']}: failed"))
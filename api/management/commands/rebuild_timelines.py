@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+from api.models import Employee
+from api.timeline import rebuild_batches
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed employment timeline of every employee (or of one company)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--company', type=int, help='Only rebuild employees of this company')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Employees rebuilt per batch')
+
+    def handle(self, *args, **options):
+        employees = Employee.objects.order_by('pk')
+        if options['company']:
+            employees = employees.filter(company_id=options['company'])
+
+        started = time.perf_counter()
+        done = 0
+        for rebuilt, last_pk in rebuild_batches(employees, options['chunk_size']):
+            done += rebuilt
+            self.stdout.write(f'{done} timelines rebuilt, up to pk {last_pk}')
+
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {done} timelines in {elapsed:.1f}s ({rate:.0f}/s)'))
@@ -0,0 +1,133 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Case, TextField, Value, When
+from django.db.models.functions import Cast
+from api import crypto
+from api.models import EncryptedCharField
+
+# Encrypted columns that are not EncryptedCharFields (the ciphertext is managed by a model property)
+ENCRYPTED_FIELDS = {
+    'api.Employee': ['_employee_id'],
+}
+
+
+def encrypted_fields():
+    fields = {label: list(names) for label, names in ENCRYPTED_FIELDS.items()}
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if isinstance(field, EncryptedCharField):
+                fields.setdefault(model._meta.label, []).append(field.attname)
+    return fields
+
+
+def raw(field):
+    # Cast to a plain text column so EncryptedCharField.from_db_value does not decrypt the ciphertext
+    return Cast(field, output_field=TextField())
+
+
+def write_raw(model, field, tokens, batch_size=1000):
+    """Store new ciphertexts as-is. bulk_update would pass them through get_prep_value and encrypt them again."""
+    for start in range(0, len(tokens), batch_size):
+        batch = tokens[start:start + batch_size]
+        cases = [When(pk=pk, then=Value(token, output_field=TextField())) for pk, token in batch]
+        model.objects.filter(pk__in=[pk for pk, _ in batch]).update(**{field: Case(*cases, output_field=TextField())})
+
+
+class Command(BaseCommand):
+    help = 'Re-encrypt every encrypted field under the current ENCRYPTION_KEY'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Rows read and written per chunk')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Encryption worker processes')
+        parser.add_argument('--checkpoint', help='JSON file recording progress; an existing file is resumed from')
+        parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint')
+
+    def handle(self, *args, **options):
+        keys = crypto.encryption_keys()
+        try:
+            crypto.get_key_ring()
+        except (TypeError, ValueError) as e:
+            raise CommandError(f'Invalid encryption key in settings: {str(e)}')
+        if len(keys) == 1:
+            self.stdout.write(self.style.WARNING(
+                'No ENCRYPTION_KEY_FALLBACKS configured; data will be re-encrypted under the current key only'
+            ))
+
+        self.checkpoint_path = options['checkpoint']
+        self.checkpoint = {}
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path) and not options['restart']:
+            with open(self.checkpoint_path) as f:
+                self.checkpoint = json.load(f)
+            self.stdout.write(f'Resuming from checkpoint {self.checkpoint}')
+
+        self.workers = max(1, options['workers'])
+        started = time.perf_counter()
+        total = 0
+        # Spawned workers only run api.crypto, so they never touch (or inherit) database connections
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context) as pool:
+            rotate = partial(pool.map, partial(crypto.rotate_many, keys=keys))
+            for label, fields in encrypted_fields().items():
+                total += self.rotate_model(rotate, apps.get_model(label), fields, options['chunk_size'])
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f'Rotated {total} rows in {elapsed:.1f}s ({rate:.0f} rows/s)'))
+
+    def rotate_model(self, rotate, model, fields, chunk_size):
+        label = model._meta.label
+        last_pk = self.checkpoint.get(label, 0)
+        done = failed = 0
+        self.stdout.write(f"{label}: rotating {', '.join(fields)} from pk > {last_pk}")
+        while True:
+            chunk_started = time.perf_counter()
+            # Keyset pagination keeps every chunk an index range scan, however deep we are
+            queryset = model.objects.filter(pk__gt=last_pk).order_by('pk')
+            rows = list(queryset.values_list('pk', *[raw(field) for field in fields])[:chunk_size])
+            if not rows:
+                break
+
+            updates = {field: [] for field in fields}
+            for index, field in enumerate(fields, start=1):
+                tokens = [row[index] for row in rows]
+                slices = [tokens[i::self.workers] for i in range(self.workers)]
+                # Undo the round-robin split so values line up with rows again
+                rotated = [None] * len(tokens)
+                for i, result in enumerate(rotate(slices)):
+                    rotated[i::self.workers] = result
+                for row, token, new_token in zip(rows, tokens, rotated):
+                    if new_token is None and token:
+                        failed += 1
+                    elif new_token != token:
+                        updates[field].append((row[0], new_token))
+
+            with transaction.atomic():
+                for field, tokens in updates.items():
+                    write_raw(model, field, tokens)
+
+            last_pk = rows[-1][0]
+            done += len(rows)
+            self.save_checkpoint(label, last_pk)
+            elapsed = time.perf_counter() - chunk_started
+            self.stdout.write(f'{label}: {done} rows, up to pk {last_pk} ({len(rows) / elapsed:.0f} rows/s)')
+
+        if failed:
+            self.stdout.write(self.style.WARNING(f'{label}: {failed} values could not be decrypted with any configured key'))
+        return done
+
+    def save_checkpoint(self, label, last_pk):
+        if not self.checkpoint_path:
+            return
+        self.checkpoint[label] = last_pk
+        tmp_path = f'{self.checkpoint_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
@@ -0,0 +1,97 @@
+import os
+import random
+import secrets
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from api import crypto
+from api.models import Company, Department, Employee, Role
+from .bench_search import DEPARTMENTS, FIRST_NAMES, LAST_NAMES, ROLES
+
+BENCH_USERNAME = 'bench'
+# The bench user is a superuser, so it never gets a fixed password. Benchmarks on throwaway
+# test databases use one generated per process; a seeded server needs BENCH_PASSWORD.
+GENERATED_PASSWORD = secrets.token_urlsafe(16)
+LOGIN_HELP = 'set BENCH_PASSWORD to the password the server was seeded with'
+
+
+def bench_password():
+    return os.environ.get('BENCH_PASSWORD') or GENERATED_PASSWORD
+
+
+def bench_user(password=None):
+    user = User.objects.filter(username=BENCH_USERNAME).first()
+    if user is None:
+        user = User.objects.create_superuser(BENCH_USERNAME, 'bench@example.com', password or bench_password())
+    return user
+
+
+def seed_dataset(employees, companies=5, roles_per_employee=2, batch_size=5000, password=None):
+    """Top the database up to ``employees`` synthetic employees spread over ``companies`` companies.
+
+    Deterministic for a given size, and safe to call repeatedly with growing sizes.
+    """
+    rng = random.Random(employees)
+    user = bench_user(password)
+    for index in range(Company.objects.filter(name__startswith='Bench ').count(), companies):
+        company = Company.objects.create(
+            name=f'Bench {index}', registration_date='2020-01-01', address='1 Bench Road', contact_person='Bench',
+            contact_phone='0770000000', email=f'bench{index}@example.com',
+        )
+        Department.objects.bulk_create([Department(company=company, name=name) for name in DEPARTMENTS])
+    company_ids = list(Company.objects.filter(name__startswith='Bench ').order_by('id').values_list('id', flat=True))
+
+    existing = Employee.objects.filter(company_id__in=company_ids).count()
+    for start in range(existing, employees, batch_size):
+        numbers = range(start, min(start + batch_size, employees))
+        employee_ids = [f'BENCH{number:08d}' for number in numbers]
+        with transaction.atomic():
+            created = Employee.objects.bulk_create([
+                Employee(
+                    user=user,
+                    company_id=company_ids[number % len(company_ids)],
+                    _employee_id=token,
+                    employee_id_hash=crypto.blind_index(employee_id),
+                    name=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    role=rng.choice(ROLES),
+                    position=rng.choice(['Junior', 'Senior', 'Lead', 'Intern']),
+                    department=rng.choice(DEPARTMENTS),
+                    start_date=f'20{10 + number % 14}-0{1 + number % 9}-01',
+                    email=f'employee{number}@example.com',
+                )
+                for number, employee_id, token in zip(numbers, employee_ids, crypto.encrypt_many(employee_ids))
+            ])
+            roles = []
+            for employee in created:
+                for index in range(roles_per_employee):
+                    current = index == roles_per_employee - 1
+                    roles.append(Role(
+                        employee=employee,
+                        title=rng.choice(ROLES),
+                        start_date=f'{2010 + index * 3}-01-01',
+                        end_date=None if current else f'{2012 + index * 3}-12-31',
+                        duties='Synthetic benchmark role',
+                    ))
+            Role.objects.bulk_create(roles)
+    return {'employees': employees, 'companies': len(company_ids), 'roles_per_employee': roles_per_employee}
+
+
+class Command(BaseCommand):
+    help = 'Seed the configured database with synthetic companies, employees and roles for bench_api --url'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=10000)
+        parser.add_argument('--companies', type=int, default=5)
+        parser.add_argument('--roles-per-employee', type=int, default=2)
+        parser.add_argument('--password', help='Password for the bench superuser (default: $BENCH_PASSWORD)')
+
+    def handle(self, *args, **options):
+        password = options['password'] or os.environ.get('BENCH_PASSWORD')
+        if not password:
+            raise CommandError('The bench user is a superuser in the configured database; pass --password or set BENCH_PASSWORD')
+        summary = seed_dataset(options['employees'], options['companies'], options['roles_per_employee'], password=password)
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {summary['employees']} employees across {summary['companies']} companies; "
+            f"log in as {BENCH_USERNAME} with the given password"
+        ))
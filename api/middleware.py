@@ -0,0 +1,38 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .profiling import DEFAULT_REPEAT_THRESHOLD, profile_queries
+
+logger = logging.getLogger('api.profiling')
+
+
+class QueryProfilerMiddleware:
+    """Opt-in (QUERY_PROFILER_ENABLED) per-request query counts, SQL time and N+1 detection."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'QUERY_PROFILER_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+
+    def __call__(self, request):
+        with profile_queries() as profile:
+            response = self.get_response(request)
+
+        summary = profile.summary(self.threshold)
+        response['X-Query-Count'] = str(summary['queries'])
+        response['X-Query-Time-Ms'] = str(summary['sql_ms'])
+        if summary['n_plus_one']:
+            response['X-Query-N-Plus-One'] = str(len(summary['n_plus_one']))
+
+        level = logging.WARNING if summary['n_plus_one'] else logging.INFO
+        logger.log(level, json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            **summary,
+        }))
+        return response
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:37
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_bulkupload_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='bulkupload',
+            name='file',
+            field=models.FileField(upload_to='uploads/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['csv', 'xlsx', 'txt', 'json', 'ndjson', 'jsonl'])]),
+        ),
+    ]
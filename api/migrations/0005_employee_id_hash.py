@@ -0,0 +1,91 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:39
+
+import hashlib
+import hmac
+import logging
+import re
+
+from cryptography.fernet import Fernet, InvalidToken
+from django.conf import settings
+from django.db import migrations, models
+
+logger = logging.getLogger(__name__)
+
+# Version byte 0x80 and a timestamp, base64 encoded
+FERNET_TOKEN = re.compile(r'gAAAAA[A-Za-z0-9_-]{50,}={0,2}$')
+
+
+def backfill_employee_id_hash(apps, schema_editor):
+    Employee = apps.get_model('api', 'Employee')
+    f = Fernet(settings.ENCRYPTION_KEY)
+    key = settings.BLIND_INDEX_KEY.encode()
+    seen = {}
+    duplicates = []
+    batch = []
+    for employee in Employee.objects.only('id', 'user_id', 'company_id', '_employee_id').order_by('id').iterator(chunk_size=2000):
+        stored = employee._employee_id
+        if not stored:
+            continue
+        try:
+            plaintext = f.decrypt(stored.encode('utf-8')).decode('utf-8')
+            encrypted = True
+        except (InvalidToken, UnicodeDecodeError, ValueError):
+            if FERNET_TOKEN.match(stored):
+                # A token under some other key stays unindexed; fix_employee_ids replaces it with a placeholder
+                continue
+            # Older bulk uploads stored the ID unencrypted
+            plaintext = stored
+            encrypted = False
+        normalized = plaintext.strip()
+        digest = hmac.new(key, normalized.encode('utf-8'), hashlib.sha256).hexdigest()
+        identity = (employee.user_id, employee.company_id, digest)
+        if identity in seen:
+            # Duplicates were possible while the ciphertext was randomized
+            duplicates.append((employee.id, seen[identity], employee.user_id, employee.company_id))
+            continue
+        seen[identity] = employee.id
+        employee.employee_id_hash = digest
+        if normalized != plaintext or not encrypted:
+            # Store the same value the hash was taken from, as Employee.employee_id does now
+            employee._employee_id = f.encrypt(normalized.encode('utf-8')).decode('utf-8')
+        batch.append(employee)
+        if len(batch) >= 2000:
+            Employee.objects.bulk_update(batch, ['employee_id_hash', '_employee_id'])
+            batch = []
+    if duplicates:
+        # An unindexed duplicate would be invisible to lookups and re-created by the next upload
+        for employee_id, first_id, user_id, company_id in duplicates:
+            logger.error('Employee %s has the same employee ID as employee %s (user %s, company %s)',
+                         employee_id, first_id, user_id, company_id)
+        listed = ', '.join(f'{employee_id} (same as {first_id})' for employee_id, first_id, _, _ in duplicates)
+        raise RuntimeError(
+            f'{len(duplicates)} employees share an employee ID with an older employee of the same user and '
+            f'company: {listed}. Merge, delete or renumber them, then run migrate again.'
+        )
+    if batch:
+        Employee.objects.bulk_update(batch, ['employee_id_hash', '_employee_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_bulkupload_ndjson'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='employee',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='employee_id_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_employee_id_hash, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='employee',
+            unique_together={('user', 'company', 'employee_id_hash')},
+        ),
+    ]
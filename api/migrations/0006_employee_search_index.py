@@ -0,0 +1,61 @@
+from django.db import migrations
+
+# Copied from api.search as it stood when this migration was written, so later edits there don't change history
+PG_DOCUMENT = (
+    "lower(coalesce(name, '') || ' ' || coalesce(role, '') || ' ' || "
+    "coalesce(position, '') || ' ' || coalesce(department, ''))"
+)
+SQLITE_FTS_TABLE = 'api_employee_fts'
+SQLITE_FTS_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS api_employee_fts USING fts5(
+        name, role, position, department, content='api_employee', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS api_employee_fts_ai AFTER INSERT ON api_employee BEGIN
+        INSERT INTO api_employee_fts(rowid, name, role, position, department) VALUES (new.id, new.name, new.role, new.position, new.department);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS api_employee_fts_ad AFTER DELETE ON api_employee BEGIN
+        INSERT INTO api_employee_fts(api_employee_fts, rowid, name, role, position, department) VALUES ('delete', old.id, old.name, old.role, old.position, old.department);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS api_employee_fts_au AFTER UPDATE ON api_employee BEGIN
+        INSERT INTO api_employee_fts(api_employee_fts, rowid, name, role, position, department) VALUES ('delete', old.id, old.name, old.role, old.position, old.department);
+        INSERT INTO api_employee_fts(rowid, name, role, position, department) VALUES (new.id, new.name, new.role, new.position, new.department);
+    END""",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS api_employee_search_tsv ON api_employee USING gin (to_tsvector('simple', {PG_DOCUMENT}))"
+        )
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS api_employee_search_trgm ON api_employee USING gin (({PG_DOCUMENT}) gin_trgm_ops)"
+        )
+    elif vendor == 'sqlite':
+        for statement in SQLITE_FTS_SCHEMA:
+            schema_editor.execute(statement)
+        schema_editor.execute("INSERT INTO api_employee_fts(api_employee_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS api_employee_search_tsv')
+        schema_editor.execute('DROP INDEX IF EXISTS api_employee_search_trgm')
+    elif vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {SQLITE_FTS_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SQLITE_FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_employee_id_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.6 on 2026-10-18 14:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_employee_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='department',
+            index=models.Index(fields=['company', 'name'], name='department_company_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employee',
+            index=models.Index(fields=['company', 'name'], name='employee_company_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employeehistory',
+            index=models.Index(fields=['employee_id', '-start_date'], name='history_employee_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='role',
+            index=models.Index(fields=['employee', '-start_date', '-id'], name='role_employee_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='role',
+            index=models.Index(condition=models.Q(('end_date__isnull', True)), fields=['employee'], name='role_current_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_access_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeTimeline',
+            fields=[
+                ('employee', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='timeline', serialize=False, to='api.employee')),
+                ('entries', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
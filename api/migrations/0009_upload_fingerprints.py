@@ -0,0 +1,28 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_employee_timeline'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkupload',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='bulkupload',
+            name='full_roster',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='employee',
+            name='row_fingerprint',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True),
+        ),
+    ]
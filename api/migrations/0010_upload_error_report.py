@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_upload_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkupload',
+            name='error_report',
+            field=models.FileField(blank=True, upload_to='upload_reports/'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_company_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkupload',
+            name='fingerprinted',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
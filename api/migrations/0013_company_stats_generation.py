@@ -0,0 +1,23 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_bulkupload_fingerprinted'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='companystats',
+            name='built_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='companystats',
+            name='generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -2,21 +2,20 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
 from django.utils.crypto import get_random_string
-from cryptography.fernet import Fernet,InvalidToken
 from django.conf import settings
 from django.core.exceptions import ValidationError
-import base64
 from django.db.models.signals import post_save
 from django.dispatch import receiver
+from . import crypto
 
 
 def encrypt_data(data):
-    f = Fernet(settings.ENCRYPTION_KEY)
-    return f.encrypt(data.encode()).decode()
+    return crypto.encrypt(data)
 
 def decrypt_data(encrypted_data):
-    f = Fernet(settings.ENCRYPTION_KEY)
-    return f.decrypt(encrypted_data.encode()).decode()
+    return crypto.decrypt(encrypted_data)
+
+blind_index = crypto.blind_index
 
 class EncryptedCharField(models.CharField):
      def from_db_value(self,value,expression,connection):
@@ -52,6 +51,11 @@ class Department(models.Model):
     company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='departments')
     name = models.CharField(max_length=255)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['company', 'name'], name='department_company_name_idx'),
+        ]
+
     def __str__(self):
         return f"{self.company.name} - {self.name}"
 
@@ -59,6 +63,9 @@ class Department(models.Model):
 class Employee(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='employees')
     _employee_id = models.TextField(db_column='employee_id')  # Renamed to _employee_id
+    employee_id_hash = models.CharField(max_length=64, null=True, blank=True, db_index=True, editable=False)
+    # Hash of the upload row this employee was last written from; unchanged rows are skipped on re-upload
+    row_fingerprint = models.CharField(max_length=64, null=True, blank=True, editable=False)
     name = models.CharField(max_length=100, default='Unknown')
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
     department = models.CharField(max_length=100)
@@ -70,29 +77,54 @@ class Employee(models.Model):
     position = models.CharField(max_length=100, blank=True, null=True)
 
     class Meta:
-        unique_together = ['user', 'company', '_employee_id']
+        unique_together = ['user', 'company', 'employee_id_hash']
+        indexes = [
+            models.Index(fields=['company', 'name'], name='employee_company_name_idx'),
+        ]
 
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        # Uploads write through bulk_create/bulk_update; any other edit means the next upload must rewrite the row
+        self.row_fingerprint = None
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'row_fingerprint'}
+        super().save(*args, **kwargs)
     
 
     @property
     def employee_id(self):
         if not self._employee_id:
             return None
-        try:
-            f = Fernet(settings.ENCRYPTION_KEY)
-            return f.decrypt(self._employee_id.encode('utf-8')).decode('utf-8')
-        except (InvalidToken, UnicodeDecodeError, base64.binascii.Error) as e:
-            return f"Decryption error: {self._employee_id[:10]}... (truncated)"
+        # Memo keyed on the ciphertext so direct writes to _employee_id are never served stale
+        cached = self.__dict__.get('_employee_id_plain')
+        if cached is None or cached[0] != self._employee_id:
+            plaintext = crypto.decrypt_many([self._employee_id], on_error=crypto.decryption_placeholder)[0]
+            cached = self.__dict__['_employee_id_plain'] = (self._employee_id, plaintext)
+        return cached[1]
 
     @employee_id.setter
     def employee_id(self, value):
         if value is None:
             self._employee_id = None
+            self.employee_id_hash = None
         else:
-            f = Fernet(settings.ENCRYPTION_KEY)
-            self._employee_id = f.encrypt(value.encode('utf-8')).decode('utf-8')
+            value = crypto.normalize(value)
+            self._employee_id = crypto.encrypt(value)
+            self.employee_id_hash = blind_index(value)
+            self.__dict__['_employee_id_plain'] = (self._employee_id, value)
+
+
+def prime_employee_ids(employees):
+    """Decrypt the employee IDs of a page of employees in one batch and memoize them on the instances."""
+    pending = [employee for employee in employees
+               if employee._employee_id and employee.__dict__.get('_employee_id_plain', (None,))[0] != employee._employee_id]
+    plaintexts = crypto.decrypt_many([employee._employee_id for employee in pending], on_error=crypto.decryption_placeholder)
+    for employee, plaintext in zip(pending, plaintexts):
+        employee.__dict__['_employee_id_plain'] = (employee._employee_id, plaintext)
+    return employees
+
 class EmployeeHistory(models.Model):
     employee_id = models.ForeignKey(Employee, on_delete=models.CASCADE)
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
@@ -104,6 +136,11 @@ class EmployeeHistory(models.Model):
     position = models.CharField(max_length=100)  # New field
     reason_for_leaving = models.TextField()  
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['employee_id', '-start_date'], name='history_employee_start_idx'),
+        ]
+
 
 
 class Role(models.Model):
@@ -113,14 +150,66 @@ class Role(models.Model):
     end_date = models.DateField(null=True, blank=True)
     duties = models.TextField()
 
+    class Meta:
+        indexes = [
+            # Matches RoleHistoryPagination's ordering, so role history pages come straight off the index
+            models.Index(fields=['employee', '-start_date', '-id'], name='role_employee_start_idx'),
+            # Current roles only; stays small however much history accumulates
+            models.Index(fields=['employee'], condition=models.Q(end_date__isnull=True), name='role_current_idx'),
+        ]
+
     def __str__(self):
         return f"{self.employee.user.username} - {self.title}"
 
+class EmployeeTimeline(models.Model):
+    # Roles and EmployeeHistory merged newest first; maintained by api.timeline
+    employee = models.OneToOneField(Employee, on_delete=models.CASCADE, primary_key=True, related_name='timeline')
+    entries = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.employee.name} - {len(self.entries)} entries"
+
+class CompanyStats(models.Model):
+    """Per-company workforce counters behind companies/<id>/stats (see api.analytics)."""
+    company = models.OneToOneField(Company, on_delete=models.CASCADE, primary_key=True, related_name='stats_rollup')
+    # Day the counters were computed for; None marks them stale after a bulk write
+    as_of = models.DateField(null=True, blank=True)
+    rollup = models.JSONField(default=dict)
+    # Bumped before and after every write the rollup counts; a rebuild is only stored if no write came in while it ran
+    generation = models.PositiveIntegerField(default=0)
+    # Generation the stored rollup was built at; writes that began after it adjust it, earlier ones may be in it already
+    built_generation = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
 class BulkUpload(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
     company = models.ForeignKey(Company, on_delete=models.CASCADE)
-    file = models.FileField(upload_to='uploads/', validators=[FileExtensionValidator(allowed_extensions=['csv', 'xlsx', 'txt'])])
+    file = models.FileField(upload_to='uploads/', validators=[FileExtensionValidator(allowed_extensions=['csv', 'xlsx', 'txt', 'json', 'ndjson', 'jsonl'])])
     uploaded_at = models.DateTimeField(auto_now_add=True)
     processed = models.BooleanField(default=False)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # A full roster ends employees it no longer lists; a partial upload only adds and updates
+    full_roster = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    rows_done = models.PositiveIntegerField(default=0)
+    rows_failed = models.PositiveIntegerField(default=0)
+    # Company employees carrying an upload fingerprint when this upload finished; fewer now means edits since
+    fingerprinted = models.PositiveIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    error_report = models.FileField(upload_to='upload_reports/', blank=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.company.name} - {self.uploaded_at}"
@@ -135,14 +224,31 @@ class UserProfile(models.Model):
     def __str__(self):
         return self.user.username
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_company_id = instance.company_id
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._saved_company_id = self.company_id
+
+    def has_changed(self):
+        return self._state.adding or self.company_id != getattr(self, '_saved_company_id', None)
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    instance.userprofile.save()
+def save_user_profile(sender, instance, created, **kwargs):
+    # Only a profile this user object has loaded can carry edits, and only an edited one needs writing
+    if created or not User.userprofile.is_cached(instance):
+        return
+    if instance.userprofile.has_changed():
+        instance.userprofile.save()
 
 class APIKey(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
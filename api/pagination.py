@@ -0,0 +1,133 @@
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def estimated_count(queryset):
+    """Row count for a list page; unfiltered Postgres tables use the planner's estimate instead of COUNT(*)."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        # reltuples is -1 until the table has been vacuumed or analyzed
+        if row and row[0] >= 0:
+            return row[0], True
+    return queryset.count(), False
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor pagination on indexed columns, so page 1000 costs the same as page 1.
+
+    DRF's cursor only records the first ordering field and falls back to offsets when
+    rows share it; here the cursor holds every ordering field and pages continue with a
+    row-value comparison, so ties on a leading column such as start_date need no offset.
+    The ordering must end with a unique field.
+
+    Pass ``?page_size=`` to change the page size and ``?count=exact`` or ``?count=estimate``
+    to include a total.
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    count_query_param = 'count'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        self.count_is_estimate = False
+        mode = request.query_params.get(self.count_query_param)
+        if mode in ('exact', 'true', '1'):
+            self.count = queryset.count()
+        elif mode == 'estimate':
+            self.count, self.count_is_estimate = estimated_count(queryset)
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        offset, reverse, current_position = self.cursor or (0, False, None)
+
+        ordering = reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if current_position is not None:
+            queryset = queryset.filter(self.after(queryset.model, ordering, current_position))
+
+        # One extra row tells whether another page follows
+        results = list(queryset[offset:offset + self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None or offset > 0
+            self.has_previous = following_position is not None
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None or offset > 0
+            self.next_position, self.previous_position = following_position, current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def after(self, model, ordering, position):
+        """Rows strictly past ``position`` in ``ordering``, as (a, b) > (x, y) spelled out with Q objects."""
+        try:
+            values = json.loads(position)
+            if not isinstance(values, list) or len(values) != len(ordering):
+                raise ValueError
+            values = [model._meta.get_field(order.lstrip('-')).to_python(value) for order, value in zip(ordering, values)]
+        except (ValueError, TypeError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+        condition = Q()
+        equal = Q()
+        for order, value in zip(ordering, values):
+            field = order.lstrip('-')
+            lookup = '__lt' if order.startswith('-') else '__gt'
+            condition |= equal & Q(**{field + lookup: value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def _get_position_from_instance(self, instance, ordering):
+        fields = [order.lstrip('-') for order in ordering]
+        if isinstance(instance, dict):
+            values = [instance[field] for field in fields]
+        else:
+            values = [getattr(instance, field) for field in fields]
+        return json.dumps([str(value) for value in values], separators=(',', ':'))
+
+    def get_paginated_response(self, data):
+        payload = OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+        ])
+        if self.count is not None:
+            payload['count'] = self.count
+            payload['count_is_estimate'] = self.count_is_estimate
+        payload['results'] = data
+        return Response(payload)
+
+    def get_paginated_response_schema(self, schema):
+        schema = super().get_paginated_response_schema(schema)
+        schema['properties']['count'] = {'type': 'integer', 'example': 123}
+        schema['properties']['count_is_estimate'] = {'type': 'boolean'}
+        return schema
+
+
+def reverse_ordering(ordering):
+    return tuple(order[1:] if order.startswith('-') else '-' + order for order in ordering)
+
+
+class RoleHistoryPagination(KeysetPagination):
+    ordering = ('-start_date', '-id')
@@ -0,0 +1,83 @@
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.db import connections
+
+DEFAULT_REPEAT_THRESHOLD = 5
+
+IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+STRING_RE = re.compile(r"'(?:[^']|'')*'")
+NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def query_shape(sql):
+    """Normalize a query so the same statement with different parameters compares equal."""
+    sql = IN_LIST_RE.sub('IN (...)', sql)
+    sql = STRING_RE.sub('?', sql)
+    return NUMBER_RE.sub('?', sql)
+
+
+class QueryProfile:
+    """Database execute wrapper that records every query and how long it took."""
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def total_ms(self):
+        return sum(duration for _, duration in self.queries) * 1000
+
+    def repeated(self, threshold=DEFAULT_REPEAT_THRESHOLD):
+        # The same shape run over and over in one request is the signature of an N+1
+        shapes = Counter(query_shape(sql) for sql, _ in self.queries)
+        return [(shape, count) for shape, count in shapes.most_common() if count >= threshold]
+
+    def summary(self, threshold=DEFAULT_REPEAT_THRESHOLD):
+        return {
+            'queries': self.count,
+            'sql_ms': round(self.total_ms, 2),
+            'n_plus_one': [{'shape': shape, 'count': count} for shape, count in self.repeated(threshold)],
+        }
+
+
+@contextmanager
+def profile_queries():
+    profile = QueryProfile()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        yield profile
+
+
+@contextmanager
+def query_budget(max_queries, repeat_threshold=None):
+    """Fail when the wrapped block runs more than ``max_queries`` queries.
+
+    With ``repeat_threshold`` it also fails when any query shape repeats that many times.
+    Meant for tests: ``with query_budget(4): self.client.get('/api/companies/')``.
+    """
+    with profile_queries() as profile:
+        yield profile
+
+    problems = []
+    if profile.count > max_queries:
+        problems.append(f'{profile.count} queries run, budget is {max_queries}')
+    if repeat_threshold:
+        for shape, count in profile.repeated(repeat_threshold):
+            problems.append(f'possible N+1, {count}x: {shape}')
+    if problems:
+        listing = '\n'.join(f'  {index}. {sql}' for index, (sql, _) in enumerate(profile.queries, start=1))
+        raise AssertionError('\n'.join(problems) + '\nQueries:\n' + listing)
@@ -0,0 +1,21 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from .models import UserProfile
+
+User = get_user_model()
+DEFAULT_BATCH_SIZE = 1000
+
+
+def provision_users(users, company=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert unsaved ``users`` and a UserProfile for each, a batch at a time.
+
+    bulk_create sends no post_save, so create_user_profile never runs; the profiles it
+    would have made are inserted here in the same transaction instead. No other User
+    receiver has work to do for a user that did not exist before. Returns the saved users.
+    """
+    users = list(users)
+    with transaction.atomic():
+        created = User.objects.bulk_create(users, batch_size=batch_size)
+        UserProfile.objects.bulk_create([UserProfile(user=user, company=company) for user in created], batch_size=batch_size)
+    return created
@@ -0,0 +1,164 @@
+import io
+import itertools
+import json
+
+import pandas as pd
+from openpyxl import load_workbook
+
+UPLOAD_COLUMNS = [
+    'user', 'employee_id', 'name', 'company', 'department', 'role',
+    'start_date', 'end_date', 'phone_number', 'email', 'position'
+]
+UPLOAD_EXTENSIONS = ('.csv', '.txt', '.xlsx', '.json', '.ndjson', '.jsonl')
+DEFAULT_BATCH_SIZE = 1000
+JSON_READ_SIZE = 64 * 1024
+
+
+class UnsupportedFormat(ValueError):
+    pass
+
+
+def iter_batches(file, name=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield the rows of an uploaded file as DataFrames of at most ``batch_size`` rows.
+
+    Only one batch is held in memory at a time, whatever the size of the file.
+    """
+    name = (name or file.name).lower()
+    if name.endswith('.csv'):
+        return iter_csv(file, batch_size)
+    elif name.endswith('.txt'):
+        return iter_csv(file, batch_size, header=None, names=UPLOAD_COLUMNS)
+    elif name.endswith('.xlsx'):
+        return iter_xlsx(file, batch_size)
+    elif name.endswith(('.ndjson', '.jsonl')):
+        return iter_ndjson(file, batch_size)
+    elif name.endswith('.json'):
+        return iter_json(file, batch_size)
+    raise UnsupportedFormat('Unsupported file format')
+
+
+def text_cell(value):
+    # Numbers come back as the text a CSV would hold, so an ID or phone number reads the same from every file type
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return str(value)
+    return value
+
+
+def iter_csv(file, batch_size, **kwargs):
+    # Every column is read as text; letting pandas guess types per chunk turns '0042' into 42 in one batch and not the next
+    options = dict(sep=',', chunksize=batch_size, dtype=str, keep_default_na=False, na_values=[''])
+    with pd.read_csv(file, **options, **kwargs) as reader:
+        for chunk in reader:
+            yield chunk
+
+
+def iter_xlsx(file, batch_size):
+    workbook = load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(column).strip() if column is not None else '' for column in header]
+        batch = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append([text_cell(value) for value in row])
+            if len(batch) >= batch_size:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+                batch = []
+        if batch:
+            yield pd.DataFrame.from_records(batch, columns=columns)
+    finally:
+        workbook.close()
+
+
+def records_to_batches(records, batch_size):
+    batch = []
+    for record in records:
+        batch.append({key: text_cell(value) for key, value in record.items()})
+        if len(batch) >= batch_size:
+            yield pd.DataFrame.from_records(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame.from_records(batch)
+
+
+def text_stream(file):
+    return io.TextIOWrapper(file, encoding='utf-8') if not isinstance(file, io.TextIOBase) else file
+
+
+def iter_ndjson(file, batch_size):
+    def records():
+        for line in text_stream(file):
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+    return records_to_batches(records(), batch_size)
+
+
+def iter_json_array(stream):
+    """Decode the objects of a top-level JSON array one at a time."""
+    decoder = json.JSONDecoder()
+    separators = ', \t\r\n'
+    buffer = ''
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        while pos < len(buffer) and buffer[pos] in separators:
+            pos += 1
+        if pos < len(buffer):
+            if not started:
+                if buffer[pos] != '[':
+                    raise ValueError('JSON uploads must contain an array of objects')
+                started = True
+                pos += 1
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The object is split across reads; fetch more unless the file is done
+                if eof:
+                    raise
+            else:
+                yield record
+                continue
+        if eof:
+            if started:
+                raise ValueError('Unterminated JSON array')
+            return
+        data = stream.read(JSON_READ_SIZE)
+        eof = not data
+        buffer = buffer[pos:] + data
+        pos = 0
+
+
+def iter_json(file, batch_size):
+    stream = text_stream(file)
+    head = stream.read(1)
+    while head and head.isspace():
+        head = stream.read(1)
+    if head == '{':
+        # Newline-delimited objects saved with a .json extension
+        first_line = head + stream.readline()
+        lines = (line.strip() for line in itertools.chain([first_line], stream))
+        return records_to_batches((json.loads(line) for line in lines if line), batch_size)
+    return records_to_batches(iter_json_array(_PrefixedStream(head, stream)), batch_size)
+
+
+class _PrefixedStream:
+    def __init__(self, prefix, stream):
+        self.prefix = prefix
+        self.stream = stream
+
+    def read(self, size):
+        if self.prefix:
+            data, self.prefix = self.prefix, ''
+            return data + self.stream.read(size - len(data))
+        return self.stream.read(size)
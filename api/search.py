@@ -0,0 +1,120 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Employee
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_TERMS = 8
+
+# Must match the expression indexed by migration 0006 exactly, or Postgres won't use the indexes.
+# word_similarity scores the query against the best-matching stretch of the document, where
+# similarity() would compare it with the whole concatenation and score every match low.
+PG_DOCUMENT = (
+    "lower(coalesce(name, '') || ' ' || coalesce(role, '') || ' ' || "
+    "coalesce(position, '') || ' ' || coalesce(department, ''))"
+)
+PG_SEARCH_SQL = f"""
+    SELECT id FROM api_employee
+    WHERE to_tsvector('simple', {PG_DOCUMENT}) @@ to_tsquery('simple', %s) OR %s <%% {PG_DOCUMENT}
+    ORDER BY ts_rank(to_tsvector('simple', {PG_DOCUMENT}), to_tsquery('simple', %s)) + word_similarity(%s, {PG_DOCUMENT}) DESC, id
+    LIMIT %s OFFSET %s
+"""
+
+SQLITE_FTS_TABLE = 'api_employee_fts'
+SQLITE_FTS_COLUMNS = 'name, role, position, department'
+# Name matches outrank role, position and department matches
+SQLITE_SEARCH_SQL = f"""
+    SELECT rowid FROM {SQLITE_FTS_TABLE}
+    WHERE {SQLITE_FTS_TABLE} MATCH %s
+    ORDER BY bm25({SQLITE_FTS_TABLE}, 10.0, 3.0, 2.0, 1.0), rowid
+    LIMIT %s OFFSET %s
+"""
+SQLITE_FTS_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_FTS_TABLE} USING fts5(
+        {SQLITE_FTS_COLUMNS}, content='api_employee', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ai AFTER INSERT ON api_employee BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, {SQLITE_FTS_COLUMNS}) VALUES (new.id, new.name, new.role, new.position, new.department);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_ad AFTER DELETE ON api_employee BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, {SQLITE_FTS_COLUMNS}) VALUES ('delete', old.id, old.name, old.role, old.position, old.department);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SQLITE_FTS_TABLE}_au AFTER UPDATE ON api_employee BEGIN
+        INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, {SQLITE_FTS_COLUMNS}) VALUES ('delete', old.id, old.name, old.role, old.position, old.department);
+        INSERT INTO {SQLITE_FTS_TABLE}(rowid, {SQLITE_FTS_COLUMNS}) VALUES (new.id, new.name, new.role, new.position, new.department);
+    END""",
+]
+
+
+def install_sqlite_fts(cursor, rebuild=False):
+    """Create the FTS5 index and the triggers that keep it in sync with api_employee.
+
+    Migration 0006 created them first. SQLite drops triggers whenever a migration rebuilds
+    api_employee, so this runs after every migrate (see ApiConfig.ready).
+    """
+    cursor.execute(f"SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = '{SQLITE_FTS_TABLE}_ai'")
+    triggers_missing = cursor.fetchone() is None
+    for statement in SQLITE_FTS_SCHEMA:
+        cursor.execute(statement)
+    if rebuild or triggers_missing:
+        cursor.execute(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')")
+
+
+def ensure_search_index(using='default', **kwargs):
+    from django.db import connections
+    conn = connections[using]
+    if conn.vendor != 'sqlite' or 'api_employee' not in conn.introspection.table_names():
+        return
+    with conn.cursor() as cursor:
+        install_sqlite_fts(cursor)
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def page_params(params):
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+        offset = int(params.get('offset', 0))
+    except (TypeError, ValueError):
+        return DEFAULT_LIMIT, 0
+    return max(1, min(limit, MAX_LIMIT)), max(0, offset)
+
+
+def ranked_ids(terms, limit, offset):
+    vendor = connection.vendor
+    with connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            tsquery = ' & '.join(f'{term}:*' for term in terms)
+            text = ' '.join(terms)
+            cursor.execute(PG_SEARCH_SQL, [tsquery, text, tsquery, text, limit, offset])
+        elif vendor == 'sqlite':
+            match = ' '.join(f'"{term}"*' for term in terms)
+            cursor.execute(SQLITE_SEARCH_SQL, [match, limit, offset])
+        else:
+            return None
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_employees(query, limit=DEFAULT_LIMIT, offset=0):
+    """Return at most ``limit`` employees matching ``query`` on name, role, position or department, best first."""
+    limit = max(1, min(limit, MAX_LIMIT))
+    terms = search_terms(query or '')
+    if not terms:
+        return list(Employee.objects.order_by('name', 'id')[offset:offset + limit])
+
+    ids = ranked_ids(terms, limit, offset)
+    if ids is None:
+        # No index for this database; fall back to an (unranked) scan, still bounded
+        lookup = Q()
+        for term in terms:
+            lookup &= (Q(name__icontains=term) | Q(role__icontains=term) |
+                       Q(position__icontains=term) | Q(department__icontains=term))
+        return list(Employee.objects.filter(lookup).order_by('name', 'id')[offset:offset + limit])
+
+    employees = Employee.objects.in_bulk(ids)
+    return [employees[pk] for pk in ids if pk in employees]
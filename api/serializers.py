@@ -1,7 +1,11 @@
+from operator import attrgetter, itemgetter
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Company, Department,UserProfile, Employee, Role, BulkUpload
+from . import crypto
+from .models import Company, Department,UserProfile, Employee, Role, BulkUpload, prime_employee_ids
 from django.contrib.auth import get_user_model
+from django.db import models
 from django.utils import timezone
 from django.shortcuts import get_object_or_404
 User = get_user_model()
@@ -62,6 +66,13 @@ class EmployeeHistorySerializer(serializers.ModelSerializer):
         model = Role
         fields = '__all__'
 
+class EmployeeListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Decrypt the whole page of employee IDs in one pass instead of once per row
+        employees = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        prime_employee_ids([employee for employee in employees if isinstance(employee, Employee)])
+        return super().to_representation(employees)
+
 class EmployeeSerializer(serializers.ModelSerializer):
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all(), required=False)
     company = serializers.PrimaryKeyRelatedField(queryset=Company.objects.all())
@@ -72,6 +83,7 @@ class EmployeeSerializer(serializers.ModelSerializer):
         model = Employee
         fields =  ['id', 'user', 'name', 'company', 'department', 'employee_id', 'role', 'start_date','end_date', 'phone_number', 'email', 'position']
         read_only_fields = ['id']
+        list_serializer_class = EmployeeListSerializer
 
     def create(self, validated_data):
         request = self.context.get('request')
@@ -91,11 +103,15 @@ class EmployeeSerializer(serializers.ModelSerializer):
         if 'end_date' not in validated_data:
             validated_data['end_date'] = timezone.now().date()
 
-        employee = Employee.objects.create(**validated_data)
-
+        employee = Employee(**validated_data)
         if employee_id:
             employee.employee_id = employee_id
-            employee.save()
+            duplicate = Employee.objects.filter(
+                user=employee.user, company=employee.company, employee_id_hash=employee.employee_id_hash
+            )
+            if duplicate.exists():
+                raise serializers.ValidationError({"employee_id": "An employee with this ID already exists for this user in this company."})
+        employee.save()
 
         return employee
 
@@ -108,7 +124,67 @@ class EmployeeSerializer(serializers.ModelSerializer):
             representation['employee_id'] = instance.employee_id
         return representation
 
+_date = serializers.DateField().to_representation
+
+# (output key, model column, converter) in EmployeeSerializer's field order
+EMPLOYEE_READ_FIELDS = (
+    ('id', 'id', None),
+    ('user', 'user_id', None),
+    ('name', 'name', str),
+    ('company', 'company_id', None),
+    ('department', 'department', str),
+    ('employee_id', '_employee_id', None),
+    ('role', 'role', str),
+    ('start_date', 'start_date', _date),
+    ('end_date', 'end_date', _date),
+    ('phone_number', 'phone_number', str),
+    ('email', 'email', str),
+    ('position', 'position', str),
+)
+EMPLOYEE_READ_COLUMNS = [column for _, column, _ in EMPLOYEE_READ_FIELDS]
+
+class EmployeeReadListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        rows = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return self.child.represent_many(list(rows))
+
+class EmployeeReadSerializer(serializers.BaseSerializer):
+    """Read-only twin of EmployeeSerializer for list and search responses.
+
+    Takes ``.values(*EMPLOYEE_READ_COLUMNS)`` rows or Employee instances and renders the
+    same JSON, decrypting the page's employee IDs in one batch.
+    """
+    class Meta:
+        list_serializer_class = EmployeeReadListSerializer
+
+    def to_representation(self, instance):
+        return self.represent_many([instance])[0]
+
+    def represent_many(self, rows):
+        if not rows:
+            return []
+        getter = itemgetter if isinstance(rows[0], dict) else attrgetter
+        records = list(map(getter(*EMPLOYEE_READ_COLUMNS), rows))
+        employee_ids = crypto.decrypt_many([record[5] for record in records], on_error=crypto.decryption_placeholder)
+        data = []
+        for record, employee_id in zip(records, employee_ids):
+            item = {
+                key: value if value is None or convert is None else convert(value)
+                for (key, _, convert), value in zip(EMPLOYEE_READ_FIELDS, record)
+            }
+            item['employee_id'] = employee_id
+            data.append(item)
+        return data
+
 class BulkUploadSerializer(serializers.ModelSerializer):
+    duration = serializers.SerializerMethodField()
+
     class Meta:
         model = BulkUpload
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+    def get_duration(self, obj):
+        if not obj.started_at:
+            return None
+        end = obj.finished_at or timezone.now()
+        return round((end - obj.started_at).total_seconds(), 3)
\ No newline at end of file
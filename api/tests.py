@@ -1,3 +1,1288 @@
-from django.test import TestCase
+import base64
+import csv
+import gzip
+import importlib
+import io
+import json
+import shutil
+import tempfile
+from datetime import date
+from functools import partial
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+import pandas as pd
+from cryptography.fernet import Fernet
+from openpyxl import Workbook
+
+from django.apps import apps as django_apps
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, models, transaction
+from django.db.models.functions import Cast
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import isolate_apps
+from django.urls import get_resolver
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from . import crypto
+from .authentication import auth_cache_key
+from .caching import scope_versions
+from .ingest import EmployeeIngest
+from .jobs import process_upload
+from .management.commands.rotate_keys import Command as RotateKeysCommand
+from .models import APIKey, BulkUpload, Company, CompanyStats, Department, Employee, EmployeeHistory, EmployeeTimeline, EncryptedCharField, Role, UserProfile, blind_index
+from .analytics import company_stats, compute_rollup, present
+from .backends.postgresql_pool.base import ConnectionPool, PoolTimeout
+from .pagination import RoleHistoryPagination
+from .profiling import profile_queries, query_budget, query_shape
+from .provisioning import provision_users
+from .readers import iter_batches
+from .search import search_employees
+from .serializers import EMPLOYEE_READ_COLUMNS, EmployeeReadSerializer, EmployeeSerializer
+from .timeline import get_timeline, rebuild_timelines
+from .validation import validate_batches
+
+
+def make_company(name='Acme'):
+    return Company.objects.create(
+        name=name, registration_date='2020-01-01', address='1 Main St', contact_person='Jane',
+        contact_phone='0771000000', email=f'{name.lower()}@example.com',
+    )
+
+
+def make_employees(company, count, user=None):
+    user = user or User.objects.create(username=f'owner-{company.pk}')
+    employees = []
+    for index in range(count):
+        employee = Employee(user=user, company=company, name=f'Employee {index}', role='Clerk', department='Ops')
+        employee.employee_id = f'E{index:05d}'
+        employees.append(employee)
+    return Employee.objects.bulk_create(employees)
+
+
+class ReaderTests(TestCase):
+    def batches(self, content, name, batch_size=2):
+        return list(iter_batches(io.BytesIO(content.encode()), name, batch_size))
+
+    def test_json_split_across_reads(self):
+        records = [{'name': f'Employee {index}', 'duties': 'x' * index} for index in range(12)]
+        content = json.dumps(records)
+        # Reads of a few bytes split every object, and every string, across several reads
+        for size in (1, 3, 7, 64):
+            with mock.patch('api.readers.JSON_READ_SIZE', size):
+                batches = self.batches(content, 'roster.json', batch_size=5)
+            self.assertEqual([len(batch) for batch in batches], [5, 5, 2])
+            self.assertEqual(pd.concat(batches).to_dict('records'), records)
+
+    def test_json_escapes_inside_strings(self):
+        records = [{'name': 'Say "hi"]', 'duties': '{not: an object}, [or] \\ "a list"'}, {'name': 'é', 'duties': ''}]
+        with mock.patch('api.readers.JSON_READ_SIZE', 4):
+            batches = self.batches(json.dumps(records), 'roster.json')
+        self.assertEqual(batches[0].to_dict('records'), records)
+
+    def test_json_empty_and_malformed_arrays(self):
+        self.assertEqual(self.batches('  [ ]  ', 'roster.json'), [])
+        self.assertEqual(self.batches('', 'roster.json'), [])
+        with self.assertRaisesMessage(ValueError, 'Unterminated JSON array'):
+            self.batches('[{"name": "A"}, ', 'roster.json')
+        with self.assertRaisesMessage(ValueError, 'array of objects'):
+            self.batches('"name"', 'roster.json')
+
+    def test_ndjson_blank_lines(self):
+        content = '\n{"name": "A"}\n\n   \n{"name": "B"}\r\n{"name": "C"}\n\n'
+        for name in ('roster.ndjson', 'roster.json'):
+            batches = self.batches(content, name)
+            self.assertEqual([len(batch) for batch in batches], [2, 1])
+            self.assertEqual(list(pd.concat(batches)['name']), ['A', 'B', 'C'])
+
+    def test_xlsx_batch_boundaries(self):
+        workbook = Workbook()
+        sheet = workbook.active
+        sheet.append([' name ', 'role'])
+        for index in range(5):
+            sheet.append([f'Employee {index}', 'Clerk'])
+            if index == 1:
+                sheet.append([None, None])
+        content = io.BytesIO()
+        workbook.save(content)
+        content.seek(0)
+        batches = list(iter_batches(content, 'roster.xlsx', batch_size=2))
+        self.assertEqual([len(batch) for batch in batches], [2, 2, 1])
+        self.assertEqual(list(batches[0].columns), ['name', 'role'])
+        self.assertEqual(list(pd.concat(batches)['name']), [f'Employee {index}' for index in range(5)])
+
+        content.seek(0)
+        self.assertEqual([len(batch) for batch in iter_batches(content, 'roster.xlsx', batch_size=5)], [5])
+
+    def test_values_read_as_text(self):
+        # A blank phone number used to make pandas read that batch's phones as floats
+        content = 'employee_id,phone_number\n0042,771000001\n0043,771000002\n0044,\n0045,771000004\n'
+        rows = pd.concat(self.batches(content, 'roster.csv'))
+        self.assertEqual(list(rows['employee_id']), ['0042', '0043', '0044', '0045'])
+        self.assertEqual(list(rows['phone_number'].fillna('')), ['771000001', '771000002', '', '771000004'])
+
+        rows = pd.concat(self.batches('jdoe,0042,Jane\njroe,0043,\n', 'roster.txt'))
+        self.assertEqual(list(rows['employee_id']), ['0042', '0043'])
+        self.assertTrue(pd.isna(rows['name'].iloc[1]))
+
+        records = [{'employee_id': 771000001, 'phone_number': 771000001.0, 'active': True}, {'employee_id': 'A7', 'phone_number': 1.5}]
+        rows = pd.concat(self.batches(json.dumps(records), 'roster.json'))
+        self.assertEqual(list(rows['employee_id']), ['771000001', 'A7'])
+        self.assertEqual(list(rows['phone_number']), ['771000001', '1.5'])
+        self.assertEqual(rows['active'].iloc[0], True)
+
+        workbook = Workbook()
+        workbook.active.append(['employee_id', 'phone_number', 'start_date'])
+        workbook.active.append([771000001, 771000001.0, date(2024, 1, 2)])
+        content = io.BytesIO()
+        workbook.save(content)
+        content.seek(0)
+        rows = next(iter_batches(content, 'roster.xlsx'))
+        self.assertEqual(rows.iloc[0].tolist()[:2], ['771000001', '771000001'])
+        self.assertEqual(rows['start_date'].iloc[0], pd.Timestamp(2024, 1, 2))
+
+
+class BlindIndexTests(TestCase):
+    def backfill(self):
+        migration = importlib.import_module('api.migrations.0005_employee_id_hash')
+        migration.backfill_employee_id_hash(django_apps, None)
+
+    def test_setter_normalizes_once(self):
+        employee = Employee(name='A')
+        employee.employee_id = '  E1 '
+        self.assertEqual(crypto.decrypt(employee._employee_id), 'E1')
+        self.assertEqual(employee.employee_id_hash, blind_index('E1'))
+
+    def test_backfill(self):
+        company = make_company()
+        employee = make_employees(company, 1)[0]
+        employee._employee_id = crypto.encrypt(' E9 ')
+        employee.employee_id_hash = None
+        employee.save()
+        self.backfill()
+        employee.refresh_from_db()
+        self.assertEqual(employee.employee_id_hash, blind_index('E9'))
+        self.assertEqual(employee.employee_id, 'E9')
+
+    def test_backfill_plaintext_ids(self):
+        company = make_company()
+        plain, foreign = make_employees(company, 2)
+        # Bulk uploads once stored the ID as it came in the file
+        Employee.objects.filter(pk=plain.pk).update(_employee_id=' 00042 ', employee_id_hash=None)
+        other_key = Fernet(Fernet.generate_key()).encrypt(b'E7').decode()
+        Employee.objects.filter(pk=foreign.pk).update(_employee_id=other_key, employee_id_hash=None)
+        self.backfill()
+        plain.refresh_from_db()
+        self.assertEqual(plain.employee_id_hash, blind_index('00042'))
+        self.assertEqual(crypto.decrypt(plain._employee_id), '00042')
+        foreign.refresh_from_db()
+        self.assertEqual((foreign._employee_id, foreign.employee_id_hash), (other_key, None))
+
+    def test_backfill_fails_on_duplicates(self):
+        company = make_company()
+        first, second = make_employees(company, 2)
+        # Randomized ciphertexts once let the same ID be stored twice
+        Employee.objects.filter(pk__in=[first.pk, second.pk]).update(employee_id_hash=None)
+        Employee.objects.filter(pk=second.pk).update(_employee_id=crypto.encrypt('E00000'))
+        with self.assertLogs('api.migrations.0005_employee_id_hash', 'ERROR'):
+            with self.assertRaisesMessage(RuntimeError, f'{second.pk} (same as {first.pk})'):
+                self.backfill()
+
+
+class CryptoBatchTests(TestCase):
+    def test_round_trip(self):
+        values = ['E1', None, '', 'é-2', 'E1']
+        tokens = crypto.encrypt_many(values)
+        self.assertIsNone(tokens[1])
+        self.assertNotEqual(tokens[0], tokens[4])
+        self.assertEqual(crypto.decrypt_many(tokens), values)
+        # Empty tokens decrypt to None, as an unset employee ID does
+        self.assertEqual(crypto.decrypt_many(['', None]), [None, None])
+        self.assertEqual(crypto.decrypt_many(['garbage'], on_error=lambda token: f'bad {token}'), ['bad garbage'])
+        self.assertEqual(crypto.decrypt_many(['garbage']), [None])
+
+    def test_key_rotation(self):
+        old_key, new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+        with override_settings(ENCRYPTION_KEY=old_key, ENCRYPTION_KEY_FALLBACKS=[]):
+            old_tokens = crypto.encrypt_many(['E1', 'E2'])
+        with override_settings(ENCRYPTION_KEY=new_key, ENCRYPTION_KEY_FALLBACKS=[old_key]):
+            self.assertEqual(crypto.decrypt_many(old_tokens), ['E1', 'E2'])
+            rotated = crypto.rotate_many(old_tokens + ['garbage', ''])
+            self.assertEqual(rotated[2:], [None, ''])
+        with override_settings(ENCRYPTION_KEY=new_key, ENCRYPTION_KEY_FALLBACKS=[]):
+            self.assertEqual(crypto.decrypt_many(rotated[:2]), ['E1', 'E2'])
+            self.assertEqual(crypto.decrypt_many(old_tokens), [None, None])
+        # Worker processes pass the keys explicitly instead of reading settings
+        by_keys = crypto.rotate_many(old_tokens, keys=[new_key, old_key])
+        self.assertEqual([Fernet(new_key).decrypt(token.encode()).decode() for token in by_keys], ['E1', 'E2'])
+
+
+class KeyRotationTests(TransactionTestCase):
+    def setUp(self):
+        self.old_key, self.new_key = Fernet.generate_key().decode(), Fernet.generate_key().decode()
+
+    def test_rotates_employee_ids(self):
+        with override_settings(ENCRYPTION_KEY=self.old_key, ENCRYPTION_KEY_FALLBACKS=[]):
+            employees = make_employees(make_company(), 3)
+        Employee.objects.filter(pk=employees[2].pk).update(_employee_id='unreadable')
+        out = io.StringIO()
+        with override_settings(ENCRYPTION_KEY=self.new_key, ENCRYPTION_KEY_FALLBACKS=[self.old_key]):
+            call_command('rotate_keys', workers=1, chunk_size=2, stdout=out)
+        self.assertIn('1 values could not be decrypted', out.getvalue())
+        tokens = Employee.objects.order_by('pk').values_list('_employee_id', flat=True)
+        self.assertEqual([Fernet(self.new_key).decrypt(token.encode()).decode() for token in tokens[:2]], ['E00000', 'E00001'])
+        self.assertEqual(tokens[2], 'unreadable')
+
+    @isolate_apps('api')
+    def test_rotates_encrypted_char_fields(self):
+        class Secret(models.Model):
+            value = EncryptedCharField(max_length=255)
+
+        with connection.schema_editor() as editor:
+            editor.create_model(Secret)
+        try:
+            with override_settings(ENCRYPTION_KEY=self.old_key, ENCRYPTION_KEY_FALLBACKS=[]):
+                Secret.objects.create(value='s3cret')
+            command = RotateKeysCommand(stdout=io.StringIO())
+            command.workers, command.checkpoint, command.checkpoint_path = 1, {}, None
+            rotate = partial(map, partial(crypto.rotate_many, keys=[self.new_key, self.old_key]))
+            command.rotate_model(rotate, Secret, ['value'], 100)
+
+            token = Secret.objects.values_list(Cast('value', output_field=models.TextField()), flat=True).get()
+            # Re-encrypted exactly once: the stored token opens with the new key alone
+            self.assertEqual(Fernet(self.new_key).decrypt(token.encode()).decode(), 's3cret')
+            with override_settings(ENCRYPTION_KEY=self.new_key, ENCRYPTION_KEY_FALLBACKS=[]):
+                self.assertEqual(Secret.objects.get().value, 's3cret')
+        finally:
+            with connection.schema_editor() as editor:
+                editor.delete_model(Secret)
+
+
+class EmployeeSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = make_company()
+        cls.user = User.objects.create(username='owner')
+        cls.sales = Employee.objects.create(user=cls.user, company=cls.company, name='Rudo Banda', role='Clerk', department='Sales')
+        cls.named = Employee.objects.create(user=cls.user, company=cls.company, name='Tendai Sales', role='Driver', department='Ops')
+        cls.analyst = Employee.objects.create(user=cls.user, company=cls.company, name='Chipo Moyo', role='Data Analyst', department='IT')
+
+    def names(self, query, **kwargs):
+        return [employee.name for employee in search_employees(query, **kwargs)]
+
+    def test_prefix_and_all_terms(self):
+        self.assertEqual(self.names('tend'), ['Tendai Sales'])
+        self.assertEqual(self.names('data analy'), ['Chipo Moyo'])
+        self.assertEqual(self.names('data zebra'), [])
+
+    def test_index_follows_writes(self):
+        self.named.name = 'Farai Dube'
+        self.named.save()
+        self.assertEqual(self.names('farai'), ['Farai Dube'])
+        self.assertNotIn('Farai Dube', self.names('tendai'))
+
+        # Bulk writes skip model signals, so the index must be kept by the database itself
+        Employee.objects.filter(pk=self.analyst.pk).update(role='Engineer')
+        self.assertEqual(self.names('engineer'), ['Chipo Moyo'])
+        self.assertEqual(self.names('analyst'), [])
+
+        self.sales.delete()
+        self.assertEqual(self.names('rudo'), [])
+        self.assertEqual(self.names('sales'), [])
+
+    def test_name_matches_rank_first(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Column weights are an FTS5 ranking feature')
+        self.assertEqual(self.names('sales'), ['Tendai Sales', 'Rudo Banda'])
+        self.assertEqual(self.names('sales', limit=1, offset=1), ['Rudo Banda'])
+
+    def test_misspelling_matches_a_word(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Trigram matching needs pg_trgm')
+        # word_similarity compares the query with the closest words; similarity() against the
+        # whole document scores this 0.23, under the 0.3 threshold
+        self.assertEqual(self.names('tendaii'), ['Tendai Sales'])
+        self.assertEqual(self.names('moyo chpo')[0], 'Chipo Moyo')
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.employee = make_employees(make_company(), 1)[0]
+        # Most rows share a start date, so the cursor position alone cannot separate them
+        Role.objects.bulk_create(
+            [Role(employee=cls.employee, title=f'Role {index}', start_date='2021-01-01', duties='-') for index in range(23)]
+            + [Role(employee=cls.employee, title='Latest', start_date='2022-01-01', duties='-'),
+               Role(employee=cls.employee, title='Earliest', start_date='2020-01-01', duties='-')]
+        )
+
+    def walk(self, url):
+        pages = []
+        while url:
+            request = Request(APIRequestFactory().get(url))
+            paginator = RoleHistoryPagination()
+            page = paginator.paginate_queryset(Role.objects.filter(employee=self.employee), request)
+            pages.append([role.pk for role in page])
+            url = paginator.get_next_link()
+            if url:
+                # The cursor carries the full (start_date, id) key, never an offset
+                self.assertEqual(paginator.decode_cursor(Request(APIRequestFactory().get(url))).offset, 0)
+        return pages
+
+    def test_pages_over_shared_start_dates(self):
+        pages = self.walk('/history/?page_size=4')
+        expected = list(Role.objects.filter(employee=self.employee).order_by('-start_date', '-id').values_list('id', flat=True))
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual([len(page) for page in pages], [4, 4, 4, 4, 4, 4, 1])
+
+    def test_previous_link(self):
+        request = Request(APIRequestFactory().get('/history/?page_size=4'))
+        paginator = RoleHistoryPagination()
+        first = [role.pk for role in paginator.paginate_queryset(Role.objects.filter(employee=self.employee), request)]
+        request = Request(APIRequestFactory().get(paginator.get_next_link()))
+        paginator.paginate_queryset(Role.objects.filter(employee=self.employee), request)
+        request = Request(APIRequestFactory().get(paginator.get_previous_link()))
+        back = [role.pk for role in paginator.paginate_queryset(Role.objects.filter(employee=self.employee), request)]
+        self.assertEqual(back, first)
+
+    def test_invalid_cursor(self):
+        for position in ('not json', '["2021-01-01"]', '["someday","1"]'):
+            cursor = base64.b64encode(urlencode({'p': position}).encode()).decode()
+            request = Request(APIRequestFactory().get('/history/', {'cursor': cursor}))
+            with self.assertRaises(NotFound):
+                RoleHistoryPagination().paginate_queryset(Role.objects.all(), request)
+
+
+@override_settings(API_CACHE_TIMEOUT=300)
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = make_company()
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, path, data=None):
+        response = self.client.get(path, data)
+        return response['X-Cache'], response.json()
+
+    def test_write_bumps_version(self):
+        before = scope_versions(['companies'])
+        with self.captureOnCommitCallbacks(execute=True):
+            make_company('Globex')
+        self.assertGreater(scope_versions(['companies']), before)
+
+    def test_stale_entry_not_served(self):
+        self.assertEqual(self.get('/api/companies/')[0], 'MISS')
+        self.assertEqual(self.get('/api/companies/')[0], 'HIT')
+        self.assertEqual(self.get(f'/api/companies/{self.company.pk}/')[0], 'MISS')
+        self.assertEqual(self.get(f'/api/companies/{self.company.pk}/')[0], 'HIT')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_company('Globex')
+            self.company.name = 'Acme Holdings'
+            self.company.save()
+        status, body = self.get('/api/companies/')
+        self.assertEqual((status, sorted(company['name'] for company in body['results'])), ('MISS', ['Acme Holdings', 'Globex']))
+        self.assertEqual(self.get(f'/api/companies/{self.company.pk}/')[1]['name'], 'Acme Holdings')
+
+    def test_repeated_query_params_keyed_separately(self):
+        self.assertEqual(self.get('/api/companies/', {'tag': ['a', 'b']})[0], 'MISS')
+        self.assertEqual(self.get('/api/companies/', {'tag': ['b']})[0], 'MISS')
+        self.assertEqual(self.get('/api/companies/', {'tag': ['a', 'b']})[0], 'HIT')
+
+
+class QueryProfilerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = make_company()
+        cls.employees = make_employees(cls.company, 6)
+        Role.objects.bulk_create([
+            Role(employee=employee, title='Clerk', start_date='2021-01-01', duties='Filing')
+            for employee in cls.employees
+        ])
+
+    def test_query_shape_ignores_parameters(self):
+        self.assertEqual(
+            query_shape('SELECT * FROM t WHERE id IN (%s, %s, %s) LIMIT 21'),
+            query_shape('SELECT * FROM t WHERE id IN (%s) LIMIT 5'),
+        )
+
+    def test_budget_exceeded(self):
+        with self.assertRaisesMessage(AssertionError, '3 queries run, budget is 2'):
+            with query_budget(2):
+                for _ in range(3):
+                    Company.objects.count()
+
+    def test_budget_flags_n_plus_one(self):
+        with self.assertRaisesMessage(AssertionError, 'possible N+1, 6x'):
+            with query_budget(10, repeat_threshold=5):
+                [role.employee.name for role in Role.objects.all()]
+
+        with query_budget(1, repeat_threshold=5):
+            [role.employee.name for role in Role.objects.select_related('employee')]
+
+    @override_settings(QUERY_PROFILER_ENABLED=False)
+    def test_middleware_off_by_default(self):
+        response = self.client.get('/api/companies/')
+        self.assertNotIn('X-Query-Count', response)
+
+    @override_settings(QUERY_PROFILER_ENABLED=True)
+    def test_middleware_headers(self):
+        with self.assertLogs('api.profiling', 'INFO') as logs:
+            response = self.client.get('/api/employees/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('X-Query-Time-Ms', response)
+        self.assertLessEqual(int(response['X-Query-Count']), 2)
+        self.assertNotIn('X-Query-N-Plus-One', response)
+        self.assertIn('"path": "/api/employees/"', logs.output[0])
+
+    def test_employee_list_budget(self):
+        with query_budget(2, repeat_threshold=5):
+            response = self.client.get('/api/employees/')
+        self.assertEqual(len(response.json()['results']), 6)
+
+
+class EmployeeAdminTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        make_employees(make_company(), 150, user=cls.admin)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_decrypts_visible_page_only(self):
+        with query_budget(10, repeat_threshold=5):
+            response = self.client.get('/admin/api/employee/')
+        self.assertContains(response, 'E00149')
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+
+    def test_search_by_employee_id(self):
+        response = self.client.get('/admin/api/employee/', {'q': 'E00042'})
+        self.assertEqual([employee.name for employee in response.context['cl'].result_list], ['Employee 42'])
+
+
+class EmployeeReadSerializerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        employees = make_employees(make_company(), 3, user=cls.admin)
+        Employee.objects.filter(pk=employees[0].pk).update(
+            start_date='2021-02-03', end_date=None, phone_number='0771234567', email='a@example.com', position='Lead'
+        )
+        Employee.objects.filter(pk=employees[1].pk).update(_employee_id='not-a-token')
+        Employee.objects.filter(pk=employees[2].pk).update(_employee_id='')
+
+    def render_both(self, user):
+        request = Request(APIRequestFactory().get('/api/employees/'))
+        request.user = user
+        queryset = Employee.objects.order_by('id')
+        renderer = JSONRenderer()
+        return (
+            renderer.render(EmployeeSerializer(queryset, many=True, context={'request': request}).data),
+            renderer.render(EmployeeReadSerializer(queryset.values(*EMPLOYEE_READ_COLUMNS), many=True).data),
+            renderer.render(EmployeeReadSerializer(list(queryset), many=True).data),
+        )
+
+    def test_identical_json(self):
+        for user in (self.admin, AnonymousUser()):
+            model_json, values_json, instances_json = self.render_both(user)
+            self.assertEqual(model_json, values_json)
+            self.assertEqual(model_json, instances_json)
+
+    def test_list_endpoint(self):
+        with query_budget(1):
+            response = self.client.get('/api/employees/')
+        self.assertEqual(response.json()['results'][0]['employee_id'], 'E00000')
+        self.assertEqual(response.json()['results'][0]['company'], self.admin.employees.first().company_id)
+
+    def test_department_list_unaffected(self):
+        company = Company.objects.get()
+        Department.objects.create(company=company, name='Ops')
+        response = self.client.get(f'/api/companies/{company.pk}/departments/')
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Ops'])
+
+
+class QueryPlanTests(TestCase):
+    """The hot lookups must stay index scans; a regression to a table scan fails here."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = make_company()
+        # Enough names per company that the composite index beats company_id alone
+        cls.employee = make_employees(cls.company, 50)[0]
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor == 'postgresql':
+            # Tiny test tables would otherwise always be scanned sequentially, and unanalyzed ones
+            # leave the planner choosing between indexes at random
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute(f'ANALYZE {queryset.model._meta.db_table}')
+        plan = queryset.explain()
+        self.assertIn(index_name, plan, f'Expected {index_name} in plan:\n{plan}')
+
+    def test_employee_company_name(self):
+        self.assertUsesIndex(Employee.objects.filter(company=self.company, name='Employee 0'), 'employee_company_name_idx')
+
+    def test_department_company_name(self):
+        self.assertUsesIndex(Department.objects.filter(company=self.company, name='Ops'), 'department_company_name_idx')
+
+    def test_role_history(self):
+        roles = Role.objects.filter(employee=self.employee).order_by('-start_date', '-id')
+        self.assertUsesIndex(roles, 'role_employee_start_idx')
+        if connection.vendor == 'sqlite':
+            self.assertNotIn('TEMP B-TREE', roles.explain())
+
+    def test_current_roles(self):
+        self.assertUsesIndex(Role.objects.filter(employee=self.employee, end_date__isnull=True), 'role_current_idx')
+
+    def test_employee_history(self):
+        history = EmployeeHistory.objects.filter(employee_id=self.employee).order_by('-start_date')
+        self.assertUsesIndex(history, 'history_employee_start_idx')
+
+
+class SeedBenchTests(TestCase):
+    def test_requires_password(self):
+        with mock.patch.dict('os.environ', {'BENCH_PASSWORD': ''}):
+            with self.assertRaisesMessage(CommandError, 'pass --password or set BENCH_PASSWORD'):
+                call_command('seed_bench', employees=0, companies=1)
+        self.assertFalse(User.objects.exists())
+
+    def test_seeds_with_given_password(self):
+        call_command('seed_bench', employees=3, companies=1, password='s3cret-for-test', stdout=io.StringIO())
+        self.assertTrue(User.objects.get(username='bench').check_password('s3cret-for-test'))
+        self.assertEqual(Employee.objects.count(), 3)
+
+
+class CachedAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'pass')
+        cls.employee = make_employees(make_company(), 1, user=cls.user)[0]
+        cls.api_key = APIKey.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.token = self.client.post('/api/login/', {'username': 'reader', 'password': 'pass'}).json()['token']
+
+    def auth_queries(self, header):
+        with profile_queries() as profile:
+            response = self.client.get(f'/api/employees/{self.employee.pk}/', HTTP_AUTHORIZATION=header)
+        self.assertEqual(response.status_code, 200)
+        return [sql for sql, _ in profile.queries if 'authtoken_token' in sql or 'api_apikey' in sql or 'auth_user' in sql]
+
+    def assertOnlyUserLookup(self, queries):
+        # The key -> user mapping is cached; the user row is still read to re-check is_active
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('authtoken_token', queries[0])
+        self.assertNotIn('api_apikey', queries[0])
+
+    def test_warm_token_skips_key_lookup(self):
+        # login_view warms the cache, so even the first request skips the token table
+        self.assertOnlyUserLookup(self.auth_queries(f'Token {self.token}'))
+
+    def test_api_key(self):
+        self.assertIn('api_apikey', ' '.join(self.auth_queries(f'Api-Key {self.api_key.key}')))
+        self.assertOnlyUserLookup(self.auth_queries(f'Api-Key {self.api_key.key}'))
+
+    def test_cache_holds_no_user_object(self):
+        self.assertEqual(cache.get(auth_cache_key(self.token)), (self.user.pk, True))
+
+    def test_deleted_key_rejected(self):
+        self.auth_queries(f'Api-Key {self.api_key.key}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api_key.delete()
+        response = self.client.get(f'/api/employees/{self.employee.pk}/', HTTP_AUTHORIZATION=f'Api-Key {self.api_key.key}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_user_rejected(self):
+        self.auth_queries(f'Token {self.token}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        response = self.client.get(f'/api/employees/{self.employee.pk}/', HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_deactivated_elsewhere_rejected(self):
+        self.auth_queries(f'Token {self.token}')
+        # As another worker would: the row changes but this process's cache is never told
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.client.get(f'/api/employees/{self.employee.pk}/', HTTP_AUTHORIZATION=f'Token {self.token}')
+        self.assertEqual(response.status_code, 401)
+
+    def test_replaced_key_rejected(self):
+        old_key = self.api_key.key
+        self.auth_queries(f'Api-Key {old_key}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.api_key.key = 'replacement-key'
+            self.api_key.save()
+        response = self.client.get(f'/api/employees/{self.employee.pk}/', HTTP_AUTHORIZATION=f'Api-Key {old_key}')
+        self.assertEqual(response.status_code, 401)
+        self.auth_queries('Api-Key replacement-key')
+
+    def test_invalid_token(self):
+        response = self.client.get(f'/api/employees/{self.employee.pk}/', HTTP_AUTHORIZATION='Token nope')
+        self.assertEqual(response.status_code, 401)
+
+
+class AsyncReadViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        cls.employee = make_employees(make_company(), 3, user=cls.admin)[0]
+        Role.objects.bulk_create([
+            Role(employee=cls.employee, title=f'Title {year}', start_date=f'{year}-01-01', duties='-')
+            for year in range(2015, 2023)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_detail_matches_sync_serializer(self):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = self.admin
+        expected = JSONRenderer().render(EmployeeSerializer(self.employee, context={'request': request}).data)
+        response = self.client.get(f'/api/employees/{self.employee.pk}/')
+        self.assertEqual(response.content, expected)
+        self.assertEqual(self.client.get('/api/employees/999999/').status_code, 404)
+
+    def test_detail_writes_use_viewset(self):
+        response = self.client.patch(
+            f'/api/employees/{self.employee.pk}/', {'position': 'Lead'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Employee.objects.get(pk=self.employee.pk).position, 'Lead')
+
+    def test_role_history_pages(self):
+        first = self.client.get(f'/api/employees/{self.employee.pk}/role-history/', {'page_size': 5}).json()
+        self.assertEqual([role['title'] for role in first['results']], [f'Title {year}' for year in range(2022, 2017, -1)])
+        second = self.client.get(first['next']).json()
+        self.assertEqual([role['title'] for role in second['results']], ['Title 2017', 'Title 2016', 'Title 2015'])
+
+    def test_search(self):
+        response = self.client.get('/api/employees/search/', {'employee_id': 'E00002'})
+        self.assertEqual([row['name'] for row in response.json()], ['Employee 2'])
+
+    def test_requires_authentication(self):
+        self.client.logout()
+        for path in (f'/api/employees/{self.employee.pk}/', '/api/employees/search/',
+                     f'/api/employees/{self.employee.pk}/role-history/'):
+            self.assertEqual(self.client.get(path).status_code, 401)
+
+    def test_head_and_options(self):
+        for path in (f'/api/employees/{self.employee.pk}/', '/api/employees/search/',
+                     f'/api/employees/{self.employee.pk}/role-history/'):
+            get = self.client.get(path)
+            head = self.client.head(path)
+            self.assertEqual((head.status_code, head.content), (200, b''))
+            self.assertEqual(head['Content-Length'], str(len(get.content)))
+            self.assertIn('GET', self.client.options(path)['Allow'])
+        response = self.client.post('/api/employees/search/')
+        self.assertEqual((response.status_code, response['Allow']), (405, 'GET, HEAD, OPTIONS'))
+
+    def test_routes_mounted_once(self):
+        names = ('employee_search', 'employee_detail_async', 'employee_role_history', 'company-list', 'employee-detail',
+                 'employee-bulk-upload', 'role-list', 'department-list-create', 'bulk_upload_status')
+        for name in names:
+            # The router also adds a format-suffixed variant of each of its routes
+            possibilities = [entry[0][0] for entry in get_resolver().reverse_dict.getlist(name)]
+            self.assertEqual(len([p for p in possibilities if 'format' not in p[1]]), 1, name)
+        self.assertEqual(self.client.get(f'/api/companies/{self.employee.company_id}/companies/').status_code, 404)
+
+
+class CompanyExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass')
+        cls.company = make_company()
+        cls.employees = make_employees(cls.company, 3, user=cls.admin)
+        make_employees(make_company('Other'), 2)
+        Role.objects.bulk_create([
+            Role(employee=cls.employees[0], title='Clerk', start_date='2019-01-01', end_date='2020-12-31', duties='Filing'),
+            Role(employee=cls.employees[0], title='Manager', start_date='2021-01-01', duties='Managing'),
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def export(self, **params):
+        response = self.client.get(f'/api/companies/{self.company.pk}/export/', params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(content.decode())))
+        # Two roles for the first employee, one bare line each for the others
+        self.assertEqual([(row['employee_id'], row['role_title']) for row in rows],
+                         [('E00000', 'Manager'), ('E00000', 'Clerk'), ('E00001', ''), ('E00002', '')])
+
+    def test_ndjson_gzip(self):
+        response, content = self.export(type='ndjson', gzip='true')
+        self.assertIn('.ndjson.gz', response['Content-Disposition'])
+        rows = [json.loads(line) for line in gzip.decompress(content).decode().splitlines()]
+        self.assertEqual([row['employee_id'] for row in rows], ['E00000', 'E00001', 'E00002'])
+        self.assertEqual(rows[0]['roles'][0], {'title': 'Manager', 'start_date': '2021-01-01', 'end_date': None, 'duties': 'Managing'})
+
+    def test_superuser_only(self):
+        self.client.logout()
+        response = self.client.get(f'/api/companies/{self.company.pk}/export/')
+        self.assertEqual(response.status_code, 403)
+
+    async def test_streams_asynchronously_under_asgi(self):
+        await self.async_client.aforce_login(self.admin)
+        response = await self.async_client.get(f'/api/companies/{self.company.pk}/export/', {'gzip': 'true'})
+        # A sync iterator would be read into a list before the first byte under ASGI
+        self.assertTrue(response.is_async)
+        self.assertTrue(hasattr(response.streaming_content, '__aiter__'))
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        rows = list(csv.DictReader(io.StringIO(gzip.decompress(content).decode())))
+        self.assertEqual([row['employee_id'] for row in rows], ['E00000', 'E00000', 'E00001', 'E00002'])
+
+    def test_streams_synchronously_under_wsgi(self):
+        response, _ = self.export()
+        self.assertFalse(response.is_async)
+
+
+class BatchVerificationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('partner', 'partner@example.com', 'pass')
+        cls.company = make_company()
+        cls.employees = make_employees(cls.company, 50)
+        Employee.objects.filter(pk=cls.employees[1].pk).update(email='Jane.Doe@Example.com', start_date='2022-03-01')
+        Role.objects.bulk_create([
+            Role(employee=employee, title='Junior Clerk', start_date='2018-01-01', end_date='2019-12-31', duties='-')
+            for employee in cls.employees
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def verify(self, claims):
+        return self.client.post('/api/verify/batch', {'claims': claims}, content_type='application/json')
+
+    def test_verdicts(self):
+        company = self.company.pk
+        response = self.verify([
+            {'company': company, 'employee_id': 'E00000', 'role': 'junior  clerk', 'start_date': '2018-01-01', 'end_date': '2019-12-31'},
+            {'company': company, 'email': 'jane.doe@example.com', 'role': 'Clerk', 'start_date': '2022-03-01', 'end_date': None},
+            {'company': company, 'employee_id': 'E00002', 'role': 'Director'},
+            {'company': company, 'employee_id': 'E99999'},
+            {'company': company + 1, 'employee_id': 'E00000'},
+            {'company': company},
+        ])
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['verdict'] for result in results],
+                         ['match', 'match', 'mismatch', 'not_found', 'not_found', 'invalid'])
+        self.assertEqual(results[2]['mismatches'], ['role'])
+        self.assertEqual(response.json()['summary']['match'], 2)
+
+    def test_constant_queries(self):
+        claims = [{'company': self.company.pk, 'employee_id': f'E{index:05d}', 'role': 'Clerk'} for index in range(50)]
+        with query_budget(6):
+            response = self.verify(claims)
+        self.assertEqual(response.json()['timing']['queries'], 2)
+        self.assertEqual(response.json()['summary']['match'], 50)
+
+    @override_settings(VERIFY_BATCH_LIMIT=3)
+    def test_size_limit(self):
+        response = self.verify([{'company': self.company.pk, 'employee_id': 'E00000'}] * 4)
+        self.assertEqual(response.status_code, 413)
+
+
+class EmployeeTimelineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', 'reader@example.com', 'pass')
+        cls.company = make_company()
+        cls.employee = make_employees(cls.company, 1)[0]
+        cls.department = Department.objects.create(company=cls.company, name='Ops')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def timeline(self):
+        return self.client.get(f'/api/employees/{self.employee.pk}/timeline/').json()['entries']
+
+    def test_signals_keep_timeline_current(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Role.objects.create(employee=self.employee, title='Clerk', start_date='2019-01-01', end_date='2020-12-31', duties='-')
+            EmployeeHistory.objects.create(
+                employee_id=self.employee, company=self.company, department=self.department, role='Intern',
+                start_date='2018-01-01', end_date='2018-12-31', duties='-', position='Intern', reason_for_leaving='Studies',
+            )
+            role = Role.objects.create(employee=self.employee, title='Manager', start_date='2021-01-01', duties='-')
+        self.assertEqual([entry['title'] for entry in self.timeline()], ['Manager', 'Clerk', 'Intern'])
+        self.assertEqual(self.timeline()[2]['department'], 'Ops')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            role.delete()
+            self.company.name = 'Renamed'
+            self.company.save()
+        self.assertEqual([(entry['title'], entry['company']) for entry in self.timeline()],
+                         [('Clerk', 'Renamed'), ('Intern', 'Renamed')])
+
+    def test_one_rebuild_per_transaction(self):
+        with mock.patch('api.timeline.rebuild_timelines', wraps=rebuild_timelines) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                for index in range(20):
+                    Role.objects.create(employee=self.employee, title=f'Role {index}', start_date='2020-01-01', duties='-')
+            rebuild.assert_called_once_with({self.employee.pk})
+            self.assertEqual(len(self.timeline()), 20)
+
+            rebuild.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.employee.delete()
+            # The roles go with the employee, and so does the timeline
+            rebuild.assert_not_called()
+        self.assertFalse(EmployeeTimeline.objects.exists())
+
+    def test_company_rename_rebuilds_in_batches(self):
+        second = make_employees(self.company, 1, user=self.user)[0]
+        with mock.patch('api.timeline.REBUILD_BATCH_SIZE', 1), \
+                mock.patch('api.timeline.rebuild_timelines', wraps=rebuild_timelines) as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.company.address = 'Elsewhere'
+                self.company.save()
+                self.department.save()
+            rebuild.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.company.name = 'Renamed'
+                self.company.save()
+        self.assertEqual([call.args[0] for call in rebuild.call_args_list], [[self.employee.pk], [second.pk]])
+        self.assertEqual(get_timeline(second.pk)['entries'], [])
+
+    def test_read_is_one_lookup(self):
+        self.timeline()
+        self.assertTrue(EmployeeTimeline.objects.filter(employee=self.employee).exists())
+        with profile_queries() as profile:
+            self.timeline()
+        self.assertEqual(sum('api_employeetimeline' in sql for sql, _ in profile.queries), 1)
+        self.assertFalse(any('api_role' in sql for sql, _ in profile.queries))
+
+
+class FakeConnection:
+    closed = False
+    autocommit = True
+
+    class info:
+        transaction_status = 0  # TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+    def test_reuse_and_metrics(self):
+        pool = ConnectionPool(max_size=2, timeout=0.01)
+        first = pool.checkout(FakeConnection)
+        second = pool.checkout(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(FakeConnection)
+        pool.checkin(first)
+        self.assertIs(pool.checkout(FakeConnection), first)
+
+        second.close()
+        pool.checkin(second)
+        stats = pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connections_opened'], stats['timeouts']), (3, 2, 1))
+        self.assertEqual((stats['in_use'], stats['idle'], stats['connections_discarded']), (1, 0, 1))
+
+    def test_postgres_checkout_and_checkin(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('The pool backend needs PostgreSQL')
+        engine = 'api.backends.postgresql_pool'
+        wrapper = importlib.import_module(f'{engine}.base').DatabaseWrapper(
+            {**connection.settings_dict, 'ENGINE': engine, 'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': True}, alias='pool_test',
+        )
+        self.addCleanup(lambda: [raw.close() for raw, _ in wrapper.pool.idle])
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            backend_pid = cursor.fetchone()[0]
+        wrapper.close()
+        self.assertEqual((wrapper.pool.stats()['in_use'], wrapper.pool.stats()['idle']), (0, 1))
+
+        # A transaction left open is rolled back on check-in, and the connection goes back to autocommit
+        # so the health check on the next check-out doesn't start another one
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            self.assertEqual(cursor.fetchone()[0], backend_pid)
+        self.assertEqual(wrapper.pool.stats()['in_use'], 1)
+        wrapper.close()
+
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid(), now() = statement_timestamp()')
+            self.assertEqual(cursor.fetchone(), (backend_pid, True))
+        wrapper.close()
+        stats = wrapper.pool.stats()
+        self.assertEqual((stats['checkouts'], stats['connections_opened'], stats['in_use'], stats['idle']), (3, 1, 0, 1))
+
+
+def roster(count, **changes):
+    rows = [{'email': f'e{index}@example.com', 'employee_id': f'E{index:05d}', 'first_name': 'Emp', 'last_name': str(index),
+             'department': 'Ops', 'role': 'Clerk', 'start_date': date(2020, 1, 1)} for index in range(count)]
+    for index, fields in changes.items():
+        rows[int(index.lstrip('e'))].update(fields)
+    return pd.DataFrame(rows)
+
+
+class DeltaUploadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = make_company()
+        EmployeeIngest(cls.company).run(roster(50))
+
+    def test_unchanged_rows_are_not_written(self):
+        with profile_queries() as profile:
+            stats = EmployeeIngest(self.company).run(roster(50))
+        self.assertEqual((stats['rows'], stats['rows_unchanged'], stats['employees_updated'], stats['roles_created']), (50, 50, 0, 0))
+        self.assertFalse([sql for sql, _ in profile.queries if sql.startswith(('INSERT', 'UPDATE'))])
+
+    def test_only_changed_rows_are_written(self):
+        stats = EmployeeIngest(self.company).run(roster(51, e3={'role': 'Manager'}, e7={'position': 'Lead'}))
+        self.assertEqual(stats['rows_unchanged'], 48)
+        self.assertEqual((stats['employees_created'], stats['employees_updated'], stats['roles_created']), (1, 2, 2))
+        self.assertEqual(Role.objects.filter(employee__company=self.company).count(), 52)
+        self.assertEqual(Employee.objects.get(email='e3@example.com').role, 'Manager')
+
+    def test_full_roster_ends_missing_employees(self):
+        stats = EmployeeIngest(self.company, full_roster=True).run(roster(49))
+        self.assertEqual(stats['employees_removed'], 1)
+        removed = Employee.objects.get(email='e49@example.com')
+        self.assertEqual(removed.end_date, date.today())
+        self.assertFalse(removed.roles.filter(end_date__isnull=True).exists())
+        self.assertEqual(Employee.objects.filter(company=self.company, end_date__isnull=True).count(), 49)
+
+        # Coming back is a change, and a partial upload never ends anyone
+        stats = EmployeeIngest(self.company).run(roster(50))
+        self.assertEqual((stats['employees_updated'], stats['employees_removed']), (1, 0))
+        self.assertIsNone(Employee.objects.get(email='e49@example.com').end_date)
+
+
+class BulkUploadJobTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        self.company = make_company()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        # The worker closes stale connections between jobs; here that would be the test's own transaction
+        patcher = mock.patch('api.jobs.close_old_connections')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def upload(self, content):
+        with override_settings(MEDIA_ROOT=self.media):
+            return self.client.post('/api/employees/bulk_upload/', {
+                'company': self.company.pk, 'file': SimpleUploadedFile('roster.csv', content.encode()),
+            })
+
+    def test_identical_file_is_skipped(self):
+        content = roster(3).to_csv(index=False)
+        first = self.upload(content)
+        self.assertEqual(first.status_code, 202)
+        with override_settings(MEDIA_ROOT=self.media):
+            process_upload(first.json()['id'])
+
+        again = self.upload(content)
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json()['id'], first.json()['id'])
+        self.assertEqual(BulkUpload.objects.count(), 1)
+        self.assertEqual(self.upload(content + 'e9@example.com,E00009,Emp,9,Ops,Clerk,2020-01-01\n').status_code, 202)
+
+    def process(self, response):
+        self.assertEqual(response.status_code, 202)
+        with override_settings(MEDIA_ROOT=self.media):
+            process_upload(response.json()['id'])
+
+    def test_file_applied_before_another_is_reapplied(self):
+        first, second = roster(2).to_csv(index=False), roster(2, e1={'role': 'Manager'}).to_csv(index=False)
+        self.process(self.upload(first))
+        self.process(self.upload(second))
+        self.process(self.upload(first))
+        self.assertEqual(Employee.objects.get(name='Emp 1').role, 'Clerk')
+        self.assertEqual(self.upload(first).status_code, 200)
+
+    def test_file_is_reapplied_after_an_edit(self):
+        content = roster(2).to_csv(index=False)
+        self.process(self.upload(content))
+        employee = Employee.objects.get(name='Emp 1')
+        employee.role = 'Manager'
+        employee.save()
+        self.process(self.upload(content))
+        self.assertEqual(Employee.objects.get(name='Emp 1').role, 'Clerk')
+
+        Employee.objects.filter(name='Emp 0').delete()
+        self.process(self.upload(content))
+        self.assertEqual(Employee.objects.filter(company=self.company).count(), 2)
+
+    def test_bad_file_writes_nothing_and_reports_all_rows(self):
+        content = roster(4, e0={'email': 'nope'}, e2={'start_date': 'soon'}).to_csv(index=False)
+        upload_id = self.upload(content).json()['id']
+        with override_settings(MEDIA_ROOT=self.media):
+            process_upload(upload_id)
+            status = self.client.get(f'/api/employees/bulk_upload/{upload_id}/').json()
+            self.assertEqual((status['status'], status['rows_failed'], status['rows_done']), ('failed', 2, 0))
+            response = self.client.get(status['error_report_url'])
+            report = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertFalse(Employee.objects.exists())
+        self.assertEqual([(row['row'], row['column']) for row in report], [('1', 'email'), ('3', 'start_date')])
+
+
+class UploadValidationTests(TestCase):
+    def test_reports_every_bad_row(self):
+        df = roster(6, e1={'email': 'not-an-email'}, e2={'start_date': '2020-13-45'},
+                    e3={'end_date': date(2019, 1, 1)}, e4={'department': 'Space'}, e5={'employee_id': 'E00000', 'role': None})
+        report = validate_batches([df.iloc[:3], df.iloc[3:]], departments=['Ops'])
+        self.assertEqual(list(zip(report['row'], report['column'], report['error'])), [
+            (2, 'email', 'Invalid email address'),
+            (3, 'start_date', 'Invalid date, expected YYYY-MM-DD'),
+            (4, 'end_date', 'end_date is before start_date'),
+            (5, 'department', 'Unknown department'),
+            (6, 'employee_id', 'Duplicate employee_id, first used on row 1'),
+            (6, 'role', 'Required value is missing'),
+        ])
+
+    def test_missing_columns_and_clean_file(self):
+        report = validate_batches([roster(2).drop(columns=['email'])])
+        self.assertEqual(list(report['column'][report['row'] == 0]), ['email'])
+        self.assertEqual(len(validate_batches([roster(20)], departments=['Ops'])), 0)
+
+
+class BatchWriteTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('hr-sync', 'hr@example.com', 'pass')
+        cls.company = make_company()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def items(self, count, **fields):
+        return [{'company': self.company.pk, 'name': f'Person {index}', 'department': 'Ops', 'role': 'Clerk',
+                 'employee_id': f'B{index:04d}', **fields} for index in range(count)]
+
+    def post(self, path, items):
+        return self.client.post(path, items, content_type='application/json')
+
+    def test_create_list_in_constant_queries(self):
+        with profile_queries() as profile:
+            response = self.post('/api/employees/', self.items(100))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['summary'], {'created': 100, 'updated': 0})
+        self.assertLess(profile.count, 15)
+        employee = Employee.objects.get(pk=response.json()['results'][7]['id'])
+        self.assertEqual((employee.employee_id, employee.user, employee.start_date), ('B0007', self.user, date.today()))
+
+    def test_invalid_item_rejects_the_whole_list(self):
+        items = self.items(5)
+        items[1]['start_date'] = 'someday'
+        items[3]['employee_id'] = 'B0000'
+        items[4]['company'] = 999999
+        response = self.post('/api/employees/', items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([item['index'] for item in response.json()['items']], [1, 3, 4])
+        self.assertFalse(Employee.objects.exists())
+
+        self.post('/api/employees/', self.items(2))
+        response = self.post('/api/employees/', self.items(3))
+        self.assertEqual(response.json()['items'], [
+            {'index': 0, 'errors': {'employee_id': ['An employee with this ID already exists for this user in this company.']}},
+            {'index': 1, 'errors': {'employee_id': ['An employee with this ID already exists for this user in this company.']}},
+        ])
+
+    def test_upsert_employees_and_roles(self):
+        self.post('/api/employees/', self.items(2, start_date='2020-01-01'))
+        response = self.post('/api/employees/upsert/', self.items(3, role='Manager'))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([item['status'] for item in response.json()['results']], ['updated', 'updated', 'created'])
+        employee = Employee.objects.get(pk=response.json()['results'][0]['id'])
+        self.assertEqual((employee.role, str(employee.start_date)), ('Manager', '2020-01-01'))
+
+        path = f'/api/employees/{employee.pk}/roles/'
+        roles = [{'title': 'Clerk', 'start_date': '2020-01-01', 'duties': 'Filing'},
+                 {'title': 'Manager', 'start_date': '2022-01-01', 'duties': 'Managing'}]
+        self.assertEqual(self.post(path, roles).json()['summary'], {'created': 2, 'updated': 0})
+        roles[0]['end_date'] = '2021-12-31'
+        response = self.post(path + 'upsert/', roles + [{'title': 'Lead', 'start_date': '2024-01-01', 'duties': '-'}])
+        self.assertEqual(response.json()['summary'], {'created': 1, 'updated': 2})
+        self.assertEqual(str(employee.roles.get(title='Clerk').end_date), '2021-12-31')
+        self.assertEqual(len(get_timeline(employee.pk)['entries']), 3)
+
+    def test_role_batches_need_login(self):
+        employee = Employee.objects.get(pk=self.post('/api/employees/', self.items(1)).json()['results'][0]['id'])
+        self.client.logout()
+        path = f'/api/employees/{employee.pk}/roles/'
+        roles = [{'title': 'Clerk', 'start_date': '2020-01-01', 'duties': 'Filing'}]
+        self.assertEqual(self.post(path, roles).status_code, 401)
+        self.assertEqual(self.post(path + 'upsert/', roles).status_code, 401)
+        self.assertFalse(employee.roles.exists())
+
+    @override_settings(BATCH_WRITE_LIMIT=3)
+    def test_limit(self):
+        self.assertEqual(self.post('/api/employees/', self.items(4)).status_code, 413)
+
+
+class CompanyStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.company = make_company()
+        cls.employees = make_employees(cls.company, 6)
+        for index, employee in enumerate(cls.employees):
+            Employee.objects.filter(pk=employee.pk).update(
+                department='Ops' if index % 2 else 'Sales', position='Lead' if index == 0 else None,
+                start_date=date(2020, 1 + index, 1), end_date=date(2021, 6, 30) if index >= 4 else None,
+            )
+        Role.objects.create(employee=cls.employees[0], title='Clerk', start_date='2020-01-01', duties='-')
+
+    def expected(self):
+        today = date.today()
+        return present(compute_rollup(self.company.pk, today), today)
+
+    def test_members_only(self):
+        path = f'/api/companies/{self.company.pk}/stats/'
+        self.assertEqual(self.client.get(path).status_code, 401)
+        user = User.objects.create_user('outsider', 'outsider@example.com', 'pass')
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(path).status_code, 403)
+        UserProfile.objects.filter(user=user).update(company=self.company)
+        self.assertEqual(self.client.get(path).status_code, 200)
+
+    def test_aggregates(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pass'))
+        stats = self.client.get(f'/api/companies/{self.company.pk}/stats/').json()
+        self.assertEqual((stats['headcount'], stats['employments']), (4, {'active': 4, 'ended': 2}))
+        self.assertEqual(stats['by_department'], {'Ops': 2, 'Sales': 2})
+        self.assertEqual(stats['by_position'], {'': 3, 'Lead': 1})
+        self.assertEqual(stats['hires_per_month']['2020-03'], 1)
+        self.assertEqual(stats['leavers_per_month'], {'2021-06': 2})
+        self.assertEqual(stats['role_changes_per_month'], {'2020-01': 1})
+        ended = ((date(2021, 6, 30) - date(2020, 5, 1)).days + (date(2021, 6, 30) - date(2020, 6, 1)).days)
+        active = sum((date.today() - date(2020, month, 1)).days for month in range(1, 5))
+        self.assertEqual(stats['average_tenure_days'], round((ended + active) / 6, 1))
+
+    def test_saves_adjust_the_rollup(self):
+        company_stats(self.company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            employee = Employee.objects.get(pk=self.employees[1].pk)
+            employee.end_date = date(2022, 1, 31)
+            employee.department = 'Finance'
+            employee.save()
+            Employee.objects.get(pk=self.employees[5].pk).delete()
+            new = Employee(user=employee.user, company=self.company, name='New', department='Finance', role='Clerk', start_date='2023-02-01')
+            new.employee_id = 'N1'
+            new.save()
+            Role.objects.create(employee=new, title='Clerk', start_date='2023-02-01', duties='-')
+
+        with profile_queries() as profile:
+            stats = company_stats(self.company.pk)
+        self.assertEqual(profile.count, 1)
+        self.assertEqual(stats, self.expected())
+        self.assertEqual(stats['by_department'], {'Finance': 1, 'Ops': 1, 'Sales': 2})
+
+    def test_one_adjustment_per_transaction(self):
+        company_stats(self.company.pk)
+        employee = Employee.objects.get(pk=self.employees[0].pk)
+        with profile_queries() as profile:
+            with self.captureOnCommitCallbacks(execute=True):
+                employee.department = 'Finance'
+                employee.save()
+                for index in range(20):
+                    Role.objects.create(employee=employee, title=f'Role {index}', start_date=date(2022, 1, 1), duties='-')
+        # The generation read before the first write, then one locked read and update after the commit
+        self.assertEqual(sum('api_companystats' in sql for sql, _ in profile.queries), 3)
+        self.assertEqual(company_stats(self.company.pk)['role_changes_per_month']['2022-01'], 20)
+
+        with profile_queries() as profile:
+            with self.captureOnCommitCallbacks(execute=True):
+                employee.delete()
+        self.assertEqual(sum('api_companystats' in sql for sql, _ in profile.queries), 3)
+        self.assertEqual(company_stats(self.company.pk), self.expected())
+
+    def test_rolled_back_savepoint_adjusts_nothing(self):
+        company_stats(self.company.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                Employee.objects.get(pk=self.employees[0].pk).delete()
+                raise ValueError
+            employee = Employee.objects.get(pk=self.employees[1].pk)
+            employee.department = 'Finance'
+            employee.save()
+        self.assertEqual(company_stats(self.company.pk), self.expected())
+        self.assertEqual(company_stats(self.company.pk)['headcount'], 4)
+
+    def test_rebuild_between_commit_and_adjust_counts_once(self):
+        company_stats(self.company.pk)
+        CompanyStats.objects.filter(company=self.company).update(as_of=None)
+        with self.captureOnCommitCallbacks() as callbacks:
+            employee = Employee.objects.get(pk=self.employees[1].pk)
+            employee.department = 'Finance'
+            employee.save()
+        # A read lands after the write committed but before its adjustment runs, and rebuilds with the change
+        self.assertEqual(company_stats(self.company.pk)['by_department'], {'Finance': 1, 'Ops': 1, 'Sales': 2})
+        for callback in callbacks:
+            callback()
+        self.assertEqual(company_stats(self.company.pk), self.expected())
+
+    def test_rebuild_racing_a_write_is_not_stored(self):
+        def write_during_rebuild(company_id, today):
+            rollup = compute_rollup(company_id, today)
+            with self.captureOnCommitCallbacks(execute=True):
+                Employee.objects.filter(pk=self.employees[0].pk).get().delete()
+            return rollup
+
+        with mock.patch('api.analytics.compute_rollup', write_during_rebuild):
+            company_stats(self.company.pk)
+        self.assertIsNone(CompanyStats.objects.get(company=self.company).as_of)
+        self.assertEqual(company_stats(self.company.pk), self.expected())
+        self.assertEqual(company_stats(self.company.pk)['headcount'], 3)
+
+    def test_bulk_writes_mark_the_rollup_stale(self):
+        company_stats(self.company.pk)
+        EmployeeIngest(self.company).run(roster(3))
+        self.assertEqual(company_stats(self.company.pk)['headcount'], 7)
+        self.assertEqual(company_stats(self.company.pk), self.expected())
+
+
+class UserProvisioningTests(TestCase):
+    def test_ten_thousand_users_in_batched_inserts(self):
+        company = make_company()
+        users = [User(username=f'user{index}', email=f'user{index}@example.com') for index in range(10000)]
+        with profile_queries() as profile:
+            created = provision_users(users, company=company)
+        inserts = [sql for sql, _ in profile.queries if sql.startswith('INSERT')]
+        # Two statements per batch at most, never one per user
+        self.assertLess(len(inserts), 10000 / 20)
+        self.assertEqual(len(profile.queries) - len(inserts), 2)  # the savepoint and its release
+        self.assertEqual(UserProfile.objects.filter(company=company, user__in=[user.pk for user in created]).count(), 10000)
+
+    def test_user_save_skips_unchanged_profile(self):
+        with profile_queries() as profile:
+            user = User.objects.create_user('signals', 'signals@example.com', 'pass')
+        self.assertEqual(sum('api_userprofile' in sql for sql, _ in profile.queries), 1)
+
+        user = User.objects.get(pk=user.pk)
+        with profile_queries() as profile:
+            user.save()
+            user.userprofile
+            user.save()
+        self.assertEqual([sql for sql, _ in profile.queries if 'api_userprofile' in sql and not sql.startswith('SELECT')], [])
+
+        user.userprofile.company = make_company()
+        with profile_queries() as profile:
+            user.save()
+        self.assertEqual(sum(sql.startswith('UPDATE "api_userprofile"') for sql, _ in profile.queries), 1)
+        self.assertEqual(UserProfile.objects.get(user=user).company, user.userprofile.company)
@@ -0,0 +1,170 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Company, Department, Employee, EmployeeHistory, EmployeeTimeline, Role
+from .utils import CommitBatch
+
+REBUILD_BATCH_SIZE = 2000
+
+
+def iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def sort_key(entry):
+    # Newest first; open-ended entries ahead of finished ones that started the same day
+    return (entry['start_date'] or '', entry['end_date'] is None, entry['end_date'] or '', entry['id'])
+
+
+def build_entries(employee_ids):
+    """Return {employee_id: [entry, ...]} for ``employee_ids`` from three set-based queries."""
+    employees = {
+        row['id']: row for row in
+        Employee.objects.filter(id__in=employee_ids).values('id', 'department', 'company__name')
+    }
+    entries = {employee_id: [] for employee_id in employees}
+
+    for role in Role.objects.filter(employee_id__in=employees).values('id', 'employee_id', 'title', 'start_date', 'end_date', 'duties'):
+        employee = employees[role['employee_id']]
+        entries[role['employee_id']].append({
+            'source': 'role',
+            'id': role['id'],
+            'title': role['title'],
+            'company': employee['company__name'],
+            'department': employee['department'],
+            'start_date': iso(role['start_date']),
+            'end_date': iso(role['end_date']),
+            'duties': role['duties'],
+        })
+
+    history = EmployeeHistory.objects.filter(employee_id__in=employees).values(
+        'id', 'employee_id', 'role', 'position', 'start_date', 'end_date', 'duties', 'reason_for_leaving',
+        'company__name', 'department__name',
+    )
+    for item in history:
+        entries[item['employee_id']].append({
+            'source': 'history',
+            'id': item['id'],
+            'title': item['role'],
+            'position': item['position'],
+            'company': item['company__name'],
+            'department': item['department__name'],
+            'start_date': iso(item['start_date']),
+            'end_date': iso(item['end_date']),
+            'duties': item['duties'],
+            'reason_for_leaving': item['reason_for_leaving'],
+        })
+
+    for items in entries.values():
+        items.sort(key=sort_key, reverse=True)
+    return entries
+
+
+def rebuild_timelines(employee_ids):
+    entries = build_entries(set(employee_ids))
+    if not entries:
+        return 0
+    now = timezone.now()
+    EmployeeTimeline.objects.bulk_create(
+        [EmployeeTimeline(employee_id=employee_id, entries=items, updated_at=now) for employee_id, items in entries.items()],
+        update_conflicts=True,
+        unique_fields=['employee'],
+        update_fields=['entries', 'updated_at'],
+    )
+    return len(entries)
+
+
+def rebuild_batches(employees, batch_size=REBUILD_BATCH_SIZE):
+    """Rebuild the timelines of an Employee queryset ``batch_size`` at a time, yielding (rebuilt, last_pk) per batch."""
+    employees = employees.order_by('pk')
+    last_pk = 0
+    while True:
+        # Keyset pagination, as in rotate_keys
+        ids = list(employees.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return
+        last_pk = ids[-1]
+        yield rebuild_timelines(ids), last_pk
+
+
+def get_timeline(employee_id):
+    """The employee's timeline document, built on first read if signals haven't produced it yet."""
+    timeline = EmployeeTimeline.objects.filter(employee_id=employee_id).values('entries', 'updated_at').first()
+    if timeline is None and rebuild_timelines([employee_id]):
+        timeline = EmployeeTimeline.objects.filter(employee_id=employee_id).values('entries', 'updated_at').first()
+    return timeline
+
+
+class TimelineRebuild(CommitBatch):
+    """Employees whose timelines a transaction changed, rebuilt together once it commits."""
+
+    def __init__(self):
+        super().__init__()
+        self.employee_ids = set()
+        self.deleted = set()
+
+    def run(self):
+        employee_ids = self.employee_ids - self.deleted
+        if employee_ids:
+            rebuild_timelines(employee_ids)
+
+
+def schedule_rebuild(employee_ids):
+    # After commit, so the rebuild sees the change and a rollback never leaves a stale document
+    batch = TimelineRebuild.for_write()
+    batch.employee_ids.update(employee_ids)
+    batch.finish()
+
+
+def schedule_batched_rebuild(employees):
+    transaction.on_commit(lambda: sum(rebuilt for rebuilt, _ in rebuild_batches(employees, REBUILD_BATCH_SIZE)))
+
+
+def name_changed(sender, instance, update_fields):
+    if instance._state.adding or (update_fields is not None and 'name' not in update_fields):
+        return False
+    return sender.objects.filter(pk=instance.pk).exclude(name=instance.name).exists()
+
+
+@receiver([post_save, post_delete], sender=Role)
+def role_changed(sender, instance, **kwargs):
+    schedule_rebuild([instance.employee_id])
+
+
+@receiver([post_save, post_delete], sender=EmployeeHistory)
+def history_changed(sender, instance, **kwargs):
+    schedule_rebuild([instance.employee_id_id])
+
+
+@receiver(post_save, sender=Employee)
+def employee_changed(sender, instance, created, **kwargs):
+    # New employees have nothing to merge yet; get_timeline builds the (empty) document on demand
+    if not created:
+        schedule_rebuild([instance.pk])
+
+
+@receiver(pre_delete, sender=Employee)
+def employee_deleting(sender, instance, **kwargs):
+    # Sent before any of the cascade's post_delete signals, so the roles and history going with it rebuild nothing
+    batch = TimelineRebuild.current()
+    if batch is not None:
+        batch.deleted.add(instance.pk)
+
+
+# Timelines only carry company and department names, so other edits to either leave them as they are
+@receiver(pre_save, sender=Company)
+def company_renamed(sender, instance, update_fields=None, **kwargs):
+    if name_changed(sender, instance, update_fields):
+        employees = Employee.objects.filter(Q(company=instance) | Q(employeehistory__company=instance)).distinct()
+        schedule_batched_rebuild(employees)
+
+
+@receiver(pre_save, sender=Department)
+def department_renamed(sender, instance, update_fields=None, **kwargs):
+    if name_changed(sender, instance, update_fields):
+        schedule_batched_rebuild(Employee.objects.filter(employeehistory__department=instance).distinct())
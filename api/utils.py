@@ -1,4 +1,48 @@
+from django.db import transaction
 
 
-  
+class CommitBatch:
+    """Work collected over a transaction and done once, after it commits.
 
+    current() returns the batch of the running transaction (or savepoint), registering it with
+    on_commit on first use; outside a transaction it returns None and callers run a batch of
+    their own straight away. A rolled back savepoint drops its batch, as it drops any on_commit.
+    """
+
+    def __init__(self):
+        self.queued = False
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        self.run()
+
+    def run(self):
+        raise NotImplementedError
+
+    def finish(self):
+        # A batch from for_write() outside a transaction runs once its single write is done
+        if not self.queued:
+            self()
+
+    @classmethod
+    def current(cls, using=None):
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            return None
+        batches = connection.__dict__.setdefault('commit_batches', {})
+        key = (cls, tuple(connection.savepoint_ids))
+        batch = batches.get(key)
+        queued = {id(func) for _, func, _ in connection.run_on_commit}
+        if batch is None or batch.done or id(batch) not in queued:
+            # Forget batches whose transaction or savepoint has ended either way
+            for old in [old for old, pending in batches.items() if pending.done or id(pending) not in queued]:
+                del batches[old]
+            batch = batches[key] = cls()
+            batch.queued = True
+            transaction.on_commit(batch, using)
+        return batch
+
+    @classmethod
+    def for_write(cls, using=None):
+        return cls.current(using) or cls()
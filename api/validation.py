@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+
+from .ingest import REQUIRED_COLUMNS
+
+# Validation holds whole columns in memory anyway, so it reads far bigger batches than the ingest writes
+VALIDATION_BATCH_SIZE = 50000
+EMAIL_PATTERN = r'[^@\s]+@[^@\s]+\.[^@\s]+'
+REPORT_COLUMNS = ['row', 'column', 'value', 'error']
+
+
+def text(series):
+    return series.astype('string').str.strip().replace('', pd.NA)
+
+
+class UploadValidator:
+    """Checks every row of an upload, batch by batch, before anything is written.
+
+    Each check is one vectorized pandas operation over the batch. ``report()`` returns
+    one line per problem; ``row`` counts data rows from 1, whatever the file format,
+    and is 0 for problems with the file itself.
+    """
+
+    def __init__(self, departments=None):
+        # None means the company has no department list yet and any name is accepted
+        self.departments = set(departments) if departments else None
+        self.offset = 0
+        self.missing_columns = None
+        self.problems = []
+        self.id_rows = []
+        self.id_hashes = []
+
+    def add(self, rows, column, values, error):
+        self.problems.append(pd.DataFrame({
+            'row': rows + 1,
+            'column': column,
+            'value': values.astype('string').fillna(''),
+            'error': error,
+        }))
+
+    def check(self, batch):
+        batch = batch.set_axis(pd.RangeIndex(self.offset, self.offset + len(batch)))
+        self.offset += len(batch)
+        if self.missing_columns is None:
+            self.missing_columns = [column for column in REQUIRED_COLUMNS if column not in batch.columns]
+            for column in self.missing_columns:
+                self.problems.append(pd.DataFrame([{'row': 0, 'column': column, 'value': '', 'error': 'Missing required column'}]))
+
+        # Stripping is the costliest step, so each column is cleaned once and shared by every check
+        values = {column: text(batch[column]) for column in REQUIRED_COLUMNS + ['end_date'] if column in batch.columns}
+        for column in REQUIRED_COLUMNS:
+            if column in self.missing_columns:
+                continue
+            series = values[column]
+            blank = series.isna()
+            if blank.any():
+                self.add(batch.index[blank], column, series[blank], 'Required value is missing')
+
+        email = values.get('email')
+        if email is not None:
+            bad = email.notna() & ~email.str.fullmatch(EMAIL_PATTERN).fillna(False)
+            if bad.any():
+                self.add(batch.index[bad], 'email', email[bad], 'Invalid email address')
+
+        dates = {}
+        for column in ('start_date', 'end_date'):
+            if column not in values:
+                continue
+            parsed = pd.to_datetime(values[column], errors='coerce', format='ISO8601')
+            bad = values[column].notna() & parsed.isna()
+            if bad.any():
+                self.add(batch.index[bad], column, values[column][bad], 'Invalid date, expected YYYY-MM-DD')
+            dates[column] = parsed
+        if len(dates) == 2:
+            bad = dates['start_date'] > dates['end_date']
+            if bad.any():
+                self.add(batch.index[bad], 'end_date', values['end_date'][bad], 'end_date is before start_date')
+
+        department = values.get('department')
+        if department is not None and self.departments is not None:
+            bad = department.notna() & ~department.isin(self.departments)
+            if bad.any():
+                self.add(batch.index[bad], 'department', department[bad], 'Unknown department')
+
+        employee_id = values.get('employee_id')
+        if employee_id is not None:
+            # 64-bit hashes keep the whole file's IDs in a few MB for the duplicate check
+            present = employee_id.dropna()
+            self.id_rows.append(present.index.to_numpy())
+            self.id_hashes.append(pd.util.hash_pandas_object(present, index=False).to_numpy())
+
+    def duplicates(self):
+        if not self.id_rows:
+            return
+        rows = pd.Series(np.concatenate(self.id_rows))
+        ids = pd.Series(np.concatenate(self.id_hashes))
+        self.id_rows, self.id_hashes = [], []
+        repeated = ids.duplicated(keep='first')
+        if repeated.any():
+            first_row = rows.groupby(ids).transform('first')
+            self.problems.append(pd.DataFrame({
+                'row': rows[repeated] + 1,
+                'column': 'employee_id',
+                'value': '',
+                'error': 'Duplicate employee_id, first used on row ' + (first_row[repeated] + 1).astype(str),
+            }))
+
+    def report(self):
+        self.duplicates()
+        if not self.problems:
+            return pd.DataFrame(columns=REPORT_COLUMNS)
+        return pd.concat(self.problems, ignore_index=True).sort_values(['row', 'column'], kind='stable', ignore_index=True)
+
+
+def validate_batches(batches, departments=None):
+    validator = UploadValidator(departments)
+    for batch in batches:
+        validator.check(batch)
+    return validator.report()
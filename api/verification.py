@@ -0,0 +1,134 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.functions import Lower
+from rest_framework import serializers
+
+from .models import Employee, Role, blind_index
+from .profiling import profile_queries
+
+DEFAULT_BATCH_LIMIT = 500
+
+
+def batch_limit():
+    return getattr(settings, 'VERIFY_BATCH_LIMIT', DEFAULT_BATCH_LIMIT)
+
+
+class ClaimSerializer(serializers.Serializer):
+    company = serializers.IntegerField()
+    employee_id = serializers.CharField(required=False)
+    email = serializers.EmailField(required=False)
+    role = serializers.CharField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False, allow_null=True)
+
+    def validate(self, data):
+        if not data.get('employee_id') and not data.get('email'):
+            raise serializers.ValidationError('Either employee_id or email is required.')
+        return data
+
+
+def normalize(value):
+    return ' '.join(value.split()).casefold() if value else value
+
+
+def compare(claim, record):
+    """Return the claimed fields that ``record`` (a role or an employee's current role) contradicts."""
+    mismatches = []
+    if 'role' in claim and normalize(claim['role']) != normalize(record['role']):
+        mismatches.append('role')
+    for field in ('start_date', 'end_date'):
+        if field in claim and claim[field] != record[field]:
+            mismatches.append(field)
+    return mismatches
+
+
+def find_employees(claims):
+    # One query for every claim, whichever identifier it uses
+    lookup = Q()
+    for field, value in (('employee_id_hash', 'employee_id_hash'), ('email_lower', 'email')):
+        values = {claim[value] for claim in claims if claim.get(value)}
+        if values:
+            lookup |= Q(**{f'{field}__in': values})
+    rows = (
+        Employee.objects.annotate(email_lower=Lower('email'))
+        .filter(lookup, company_id__in={claim['company'] for claim in claims})
+        .values('id', 'company_id', 'employee_id_hash', 'email_lower', 'role', 'start_date', 'end_date')
+    )
+    by_hash, by_email = defaultdict(list), defaultdict(list)
+    for row in rows:
+        if row['employee_id_hash']:
+            by_hash[row['company_id'], row['employee_id_hash']].append(row)
+        if row['email_lower']:
+            by_email[row['company_id'], row['email_lower']].append(row)
+    return by_hash, by_email
+
+
+def verify_claims(items):
+    """Verify a batch of employment claims with a fixed number of queries, whatever the batch size."""
+    started = time.perf_counter()
+    results = [None] * len(items)
+    claims = []
+    for index, item in enumerate(items):
+        serializer = ClaimSerializer(data=item)
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'verdict': 'invalid', 'errors': serializer.errors}
+            continue
+        claim = dict(serializer.validated_data)
+        claim['index'] = index
+        claim['employee_id_hash'] = blind_index(claim['employee_id']) if claim.get('employee_id') else None
+        claim['email'] = claim['email'].lower() if claim.get('email') else None
+        claims.append(claim)
+
+    with profile_queries() as profile:
+        if claims:
+            by_hash, by_email = find_employees(claims)
+            matched = {}
+            for claim in claims:
+                candidates = by_hash.get((claim['company'], claim['employee_id_hash'])) or by_email.get((claim['company'], claim['email']), [])
+                matched[claim['index']] = candidates
+
+            roles = defaultdict(list)
+            employee_ids = {row['id'] for candidates in matched.values() for row in candidates}
+            if employee_ids:
+                for role in Role.objects.filter(employee_id__in=employee_ids).values('employee_id', 'title', 'start_date', 'end_date'):
+                    roles[role['employee_id']].append({**role, 'role': role['title']})
+
+            for claim in claims:
+                results[claim['index']] = verdict(claim, matched[claim['index']], roles)
+    lookup_ms = profile.total_ms
+
+    summary = defaultdict(int)
+    for result in results:
+        summary[result['verdict']] += 1
+    return {
+        'results': results,
+        'summary': {'total': len(results), **summary},
+        'timing': {
+            'total_ms': round((time.perf_counter() - started) * 1000, 2),
+            'sql_ms': round(lookup_ms, 2),
+            'queries': profile.count,
+        },
+    }
+
+
+def verdict(claim, candidates, roles):
+    if not candidates:
+        return {'index': claim['index'], 'verdict': 'not_found'}
+
+    best = None
+    for employee in candidates:
+        # The employee row carries the current role; Role rows carry the history
+        for record in [employee, *roles[employee['id']]]:
+            mismatches = compare(claim, record)
+            if best is None or len(mismatches) < len(best[1]):
+                best = (employee['id'], mismatches)
+            if not mismatches:
+                break
+    employee_id, mismatches = best
+    result = {'index': claim['index'], 'verdict': 'mismatch' if mismatches else 'match', 'employee': employee_id}
+    if mismatches:
+        result['mismatches'] = mismatches
+    return result
@@ -1,25 +1,37 @@
+import hashlib
+import os
+
 from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.exceptions import NotFound
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.authtoken.models import Token
 from django.contrib.auth import get_user_model, login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.urls import reverse
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, JsonResponse, StreamingHttpResponse
 from django.middleware.csrf import get_token
-from django.db import transaction
+from django.db import connections, transaction
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
-from .models import Company, Department, Employee, Role, BulkUpload, UserProfile, EmployeeHistory
-from .serializers import CompanySerializer, DepartmentSerializer, EmployeeSerializer, RoleSerializer, UserSerializer
+from .models import Company, Department, Employee, Role, BulkUpload, UserProfile, EmployeeHistory, blind_index
+from .serializers import (CompanySerializer, DepartmentSerializer, EmployeeSerializer, RoleSerializer, UserSerializer, BulkUploadSerializer,
+                          EmployeeReadSerializer, EMPLOYEE_READ_COLUMNS)
 from .forms import UserRegistrationForm, EmployeeForm, EmployeeHistoryForm
-import pandas as pd
-import json
+from .authentication import issue_token
+from .analytics import company_stats
+from .caching import CachedReadMixin, cache_stats
+from .exports import EXPORT_FORMATS, async_chunks, export_company
+from .jobs import applied_upload
+from .readers import UPLOAD_EXTENSIONS
+from .search import page_params, search_employees
+from .timeline import get_timeline
+from .verification import batch_limit, verify_claims
+from .batch_writes import BatchErrors, write_employees, write_limit, write_roles
 
 User = get_user_model()
 
@@ -29,7 +41,7 @@ class CustomObtainAuthToken(ObtainAuthToken):
         serializer = self.serializer_class(data=request.data, context={'request': request})
         serializer.is_valid(raise_exception=True)
         user = serializer.validated_data['user']
-        token, created = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         return Response({
             'token': token.key,
             'user_id': user.pk,
@@ -46,7 +58,7 @@ def login_view(request):
     password = request.data.get('password')
     user = authenticate(username=username, password=password)
     if user:
-        token, _ = Token.objects.get_or_create(user=user)
+        token = issue_token(user)
         return Response({'token': token.key})
     return Response({'error': 'Invalid credentials'}, status=400)
 
@@ -66,22 +78,58 @@ def register(request):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class EmployeeSearchView(APIView):
-    def get(self, request):
-        query = request.query_params.get('q', '')
-        employees = Employee.objects.filter(name__icontains=query)
-        serializer = EmployeeSerializer(employees, many=True)
-        return Response(serializer.data)
+def find_employees(request):
+    query = request.query_params.get('q', '')
+    limit, offset = page_params(request.query_params)
+    employee_id = request.query_params.get('employee_id')
+    if employee_id:
+        employees = Employee.objects.filter(employee_id_hash=blind_index(employee_id), name__icontains=query)
+        return employees.order_by('name', 'id').values(*EMPLOYEE_READ_COLUMNS)[offset:offset + limit]
+    return search_employees(query, limit=limit, offset=offset)
 
-class CompanyViewSet(viewsets.ModelViewSet):
+class CompanyViewSet(CachedReadMixin, viewsets.ModelViewSet):
     queryset = Company.objects.all()
     serializer_class = CompanySerializer
     permission_classes = [AllowAny]
 
-class DepartmentViewSet(viewsets.ModelViewSet):
+    def cache_scopes(self):
+        if self.action == 'retrieve':
+            return [f"company:{self.kwargs['pk']}"]
+        return ['companies']
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, pk=None):
+        if not request.user.is_authenticated or not request.user.is_superuser:
+            return Response({'error': 'Only superusers can export employees'}, status=status.HTTP_403_FORBIDDEN)
+        fmt = request.query_params.get('type', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            return Response({'error': f"Unsupported export type, use one of: {', '.join(EXPORT_FORMATS)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        compress = request.query_params.get('gzip', '').lower() in ('1', 'true')
+        chunks, content_type, filename = export_company(self.get_object(), fmt, compress)
+        if isinstance(request._request, ASGIRequest):
+            chunks = async_chunks(chunks)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=True, methods=['get'], permission_classes=[IsAuthenticated])
+    def stats(self, request, pk=None):
+        company = self.get_object()
+        if not request.user.is_superuser and not UserProfile.objects.filter(user=request.user, company=company).exists():
+            return Response({'error': 'Only members of this company can view its stats'}, status=status.HTTP_403_FORBIDDEN)
+        return Response(company_stats(company.pk))
+
+class DepartmentViewSet(CachedReadMixin, viewsets.ModelViewSet):
     serializer_class = DepartmentSerializer
     queryset = Department.objects.all()
 
+    def cache_scopes(self):
+        company_id = self.kwargs.get('company_id')
+        if company_id:
+            return [f'departments:{company_id}']
+        return ['departments']
+
     def get_queryset(self):
         company_id = self.kwargs.get('company_id')
         if company_id:
@@ -110,16 +158,6 @@ class DepartmentViewSet(viewsets.ModelViewSet):
             context['company_id'] = company_id
         return context
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-
-    def retrieve(self, request, *args, **kwargs):
-        instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
-
     def update(self, request, *args, **kwargs):
         partial = kwargs.pop('partial', False)
         instance = self.get_object()
@@ -148,7 +186,17 @@ class EmployeeViewSet(viewsets.ModelViewSet):
             return [AllowAny()]
         return super().get_permissions()
 
+    def list(self, request, *args, **kwargs):
+        # Plain rows through the read-only serializer; same JSON as EmployeeSerializer
+        queryset = self.filter_queryset(self.get_queryset()).values(*EMPLOYEE_READ_COLUMNS)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(EmployeeReadSerializer(page, many=True).data)
+        return Response(EmployeeReadSerializer(queryset, many=True).data)
+
     def create(self, request, *args, **kwargs):
+        if isinstance(request.data, list):
+            return batch_write_response(request.data, write_employees, request.user)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         self.perform_create(serializer)
@@ -158,12 +206,9 @@ class EmployeeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-    @action(detail=False, methods=['get'])
-    def search(self, request):
-        query = request.query_params.get('q', '')
-        employees = self.queryset.filter(name__icontains=query)
-        serializer = self.get_serializer(employees, many=True)
-        return Response(serializer.data)
+    @action(detail=False, methods=['post'])
+    def upsert(self, request):
+        return batch_write_response(request.data, write_employees, request.user, upsert=True)
 
     @action(detail=False, methods=['POST'])
     def bulk_upload(self, request):
@@ -180,69 +225,33 @@ class EmployeeViewSet(viewsets.ModelViewSet):
         except Company.DoesNotExist:
             return Response({'error': 'Invalid company ID'}, status=status.HTTP_400_BAD_REQUEST)
 
-        try:
-            if file.name.endswith('.json'):
-                file_content = file.read().decode('utf-8')
-                data = json.loads(file_content)
-                df = pd.DataFrame(data)
-            elif file.name.endswith('.txt'):
-                df = pd.read_csv(file, sep=',', header=None, names=[
-                    'user', 'employee_id', 'name', 'company', 'department', 'role',
-                    'start_date', 'end_date', 'phone_number', 'email', 'position'
-                ])
-            elif file.name.endswith('.csv'):
-                df = pd.read_csv(file)
-            elif file.name.endswith('.xlsx'):
-                df = pd.read_excel(file)
-            else:
-                return Response({'error': 'Unsupported file format'}, status=status.HTTP_400_BAD_REQUEST)
-
-            with transaction.atomic():
-                for index, row in df.iterrows():
-                    try:
-                        user, created = User.objects.get_or_create(
-                            email=row['email'],
-                            defaults={
-                                'username': row['email'],
-                                'first_name': row.get('first_name', ''),
-                                'last_name': row.get('last_name', '')
-                            }
-                        )
-
-                        department, _ = Department.objects.get_or_create(
-                            name=row['department'],
-                            company=company
-                        )
-
-                        employee, created = Employee.objects.update_or_create(
-                            user=user,
-                            company=company,
-                            _employee_id=row['employee_id'],
-                            defaults={
-                                'name': f"{row.get('first_name', '')} {row.get('last_name', '')}".strip(),
-                                'department': department.name,
-                                'role': row.get('role', ''),
-                                'start_date': row.get('start_date'),
-                                'end_date': row.get('end_date'),
-                                'phone_number': row.get('phone_number'),
-                                'email': row.get('email'),
-                                'position': row.get('position')
-                            }
-                        )
-
-                        Role.objects.create(
-                            employee=employee,
-                            title=row['role'],
-                            start_date=row['start_date'],
-                            duties=row.get('duties', '')
-                        )
-                    except Exception as e:
-                        return Response({'error': f'Error processing row {index}: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
-
-            return Response({'message': 'Bulk upload completed successfully'}, status=status.HTTP_200_OK)
-
-        except Exception as e:
-            return Response({'error': f'Error processing file: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        if not file.name.lower().endswith(UPLOAD_EXTENSIONS):
+            return Response({'error': 'Unsupported file format'}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_hash = hashlib.sha256()
+        for chunk in file.chunks():
+            content_hash.update(chunk)
+        content_hash = content_hash.hexdigest()
+        full_roster = request.POST.get('full_roster', '').lower() in ('1', 'true')
+
+        # Re-sending the file that was applied last changes nothing, so answer without queuing it again
+        previous = applied_upload(company, content_hash, full_roster)
+        if previous:
+            return Response({
+                'message': 'Identical file already processed',
+                'id': previous.id,
+                'status': previous.status,
+                'status_url': request.build_absolute_uri(reverse('bulk_upload_status', args=[previous.id])),
+            }, status=status.HTTP_200_OK)
+
+        # Parsing and writing happen in the process_uploads worker
+        upload = BulkUpload.objects.create(company=company, file=file, content_hash=content_hash, full_roster=full_roster)
+        return Response({
+            'message': 'Bulk upload queued',
+            'id': upload.id,
+            'status': upload.status,
+            'status_url': request.build_absolute_uri(reverse('bulk_upload_status', args=[upload.id])),
+        }, status=status.HTTP_202_ACCEPTED)
 
 @login_required
 def add_employee(request):
@@ -252,7 +261,7 @@ def add_employee(request):
             user = form.cleaned_data.get('user')
             company = request.user.userprofile.company
             employee_id = form.cleaned_data.get('employee_id')
-            if Employee.objects.filter(user=user, company=company, _employee_id=employee_id).exists():
+            if employee_id and Employee.objects.filter(user=user, company=company, employee_id_hash=blind_index(employee_id)).exists():
                 messages.error(request, "An employee with this ID already exists for this user in this company.")
                 return render(request, 'add_employee.html', {'form': form})
             employee = form.save(commit=False)
@@ -290,15 +299,86 @@ def add_employee_history(request, employee_id):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
-def employee_role_history(request, id):
-    try:
-        employee = Employee.objects.get(id=id)
-    except Employee.DoesNotExist:
+def employee_timeline(request, id):
+    timeline = get_timeline(id)
+    if timeline is None:
         raise NotFound('Employee not found')
-    
-    roles = Role.objects.filter(employee=employee).order_by('-start_date')
-    serializer = RoleSerializer(roles, many=True)
-    return Response(serializer.data)
+    return Response({'employee': id, **timeline})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def verify_batch(request):
+    claims = request.data.get('claims') if isinstance(request.data, dict) else request.data
+    if not isinstance(claims, list):
+        return Response({'error': 'Expected a list of claims'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(claims) > batch_limit():
+        return Response({'error': f'At most {batch_limit()} claims per request'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    return Response(verify_claims(claims))
+
+def batch_write_response(items, write, owner, upsert=False):
+    if not isinstance(items, list):
+        return Response({'error': 'Expected a list of objects'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > write_limit():
+        return Response({'error': f'At most {write_limit()} objects per request'}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+    try:
+        results = write(items, owner, upsert=upsert)
+    except BatchErrors as e:
+        # Nothing is written unless every item is valid
+        return Response({'error': 'Invalid items', 'items': e.errors}, status=status.HTTP_400_BAD_REQUEST)
+    summary = {result: sum(item['status'] == result for item in results) for result in ('created', 'updated')}
+    return Response({'results': results, 'summary': summary}, status=status.HTTP_201_CREATED if summary['created'] else status.HTTP_200_OK)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def response_cache_stats(request):
+    return Response(cache_stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def database_pool_stats(request):
+    # Pools are per worker process, so this describes the worker that served the request
+    stats = {}
+    for alias in connections:
+        settings_dict = connections[alias].settings_dict
+        pool = None
+        if settings_dict['ENGINE'] == 'api.backends.postgresql_pool':
+            # Imported here so the views only need psycopg2 where the pool is in use
+            from .backends.postgresql_pool.base import pool_stats
+            pool = pool_stats(alias)
+        stats[alias] = {
+            'engine': settings_dict['ENGINE'],
+            'conn_max_age': settings_dict['CONN_MAX_AGE'],
+            'health_checks': settings_dict['CONN_HEALTH_CHECKS'],
+            'pool': pool,
+            'pid': os.getpid(),
+        }
+    return Response(stats)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bulk_upload_status(request, id):
+    if not request.user.is_superuser:
+        return Response({'error': 'Only superusers can view bulk uploads'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        upload = BulkUpload.objects.get(id=id)
+    except BulkUpload.DoesNotExist:
+        raise NotFound('Bulk upload not found')
+
+    data = BulkUploadSerializer(upload).data
+    if upload.error_report:
+        data['error_report_url'] = request.build_absolute_uri(reverse('bulk_upload_errors', args=[upload.id]))
+    return Response(data)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def bulk_upload_errors(request, id):
+    if not request.user.is_superuser:
+        return Response({'error': 'Only superusers can view bulk uploads'}, status=status.HTTP_403_FORBIDDEN)
+    upload = BulkUpload.objects.filter(id=id).first()
+    if upload is None or not upload.error_report:
+        raise NotFound('No error report for this upload')
+    return FileResponse(upload.error_report.open('rb'), as_attachment=True,
+                        filename=f'upload_{upload.id}_errors.csv', content_type='text/csv')
 
 class EmployeeHistoryViewSet(viewsets.ModelViewSet):
     queryset = Role.objects.all()
@@ -310,9 +390,21 @@ class RoleViewSet(viewsets.ModelViewSet):
     serializer_class = RoleSerializer
     permission_classes = [AllowAny]
 
+    def get_permissions(self):
+        # Batch writes create or overwrite up to write_limit() roles at a time, so need a login as on EmployeeViewSet
+        if self.action == 'upsert' or (self.action == 'create' and isinstance(self.request.data, list)):
+            return [IsAuthenticated()]
+        return super().get_permissions()
+
     def create(self, request, employee_id=None):
         employee = get_object_or_404(Employee, id=employee_id)
+        if isinstance(request.data, list):
+            return batch_write_response(request.data, write_roles, employee)
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         serializer.save(employee=employee)
-        return Response(serializer.data, status=status.HTTP_201_CREATED)
\ No newline at end of file
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def upsert(self, request, employee_id=None):
+        employee = get_object_or_404(Employee, id=employee_id)
+        return batch_write_response(request.data, write_roles, employee, upsert=True)
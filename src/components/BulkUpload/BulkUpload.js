@@ -58,7 +58,7 @@ function BulkUpload({ onUploadComplete }) {
         <Box mb={2}>
           <input
             type="file"
-            accept=".csv,.xlsx,.txt,.json"
+            accept=".csv,.xlsx,.txt,.json,.ndjson,.jsonl"
             onChange={handleFileChange}
           />
         </Box>
@@ -31,6 +31,19 @@ export const setAuthToken = (token) => {
 
 
 
+// List endpoints return {next, previous, results}; follow next so components still get every row in response.data
+const getAll = async (url) => {
+  const response = await api.get(url);
+  const results = [...response.data.results];
+  let next = response.data.next;
+  while (next) {
+    const page = await api.get(next);
+    results.push(...page.data.results);
+    next = page.data.next;
+  }
+  return { ...response, data: results };
+};
+
 // In services/api.js
 export const login = (username, password) => api.post('login/', { username, password });
 export const register = (userData) => 
@@ -46,7 +59,7 @@ export const register = (userData) =>
 export const searchEmployees = (query) => api.get(`employees/search/?q=${query}`);
 
 export const getCompanyDepartments = (id) => {
-  return api.get(`/companies/${id}/departments`);
+  return getAll(`/companies/${id}/departments`);
 };
 // In api.js
 export const deleteRole = async (employeeId, roleId) => {
@@ -56,15 +69,15 @@ export const deleteRole = async (employeeId, roleId) => {
 export const addRole = async (employeeId, roleData) => {
   return await axios.post(`/api/employees/${employeeId}/roles/`, roleData);
 };
-export const getRoleHistory = (id) => api.get(`/employees/${id}/role-history/`);
-export const getCompanies = () => api.get('companies/');
+export const getRoleHistory = (id) => getAll(`/employees/${id}/role-history/`);
+export const getCompanies = () => getAll('companies/');
 export const getCompany = (id) => {
   return api.get(`/companies/${id}`);
 };
 
 export const createCompany = (companyData) => api.post('companies/', companyData);
 
-export const getEmployees = () => api.get('employees/');
+export const getEmployees = () => getAll('employees/');
 export const getEmployee = (id) => api.get(`employees/${id}/`);
 export const getEmployeeDetails = async (employeeId) => {
   try {
@@ -114,5 +127,7 @@ export const bulkUpload = async (file, companyId) => {
   }
 };
 
+export const getBulkUploadStatus = (id) => api.get(`employees/bulk_upload/${id}/`);
+
 
 export default api;
\ No newline at end of file
@@ -24,6 +24,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.QueryProfilerMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -62,9 +63,50 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', 'kudzai30'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '5432'),
+        # Persistent connections suit gunicorn's sync workers; under ASGI every request runs in a
+        # fresh thread and would strand a connection per thread, so use DB_POOL there instead
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# Per-process connection pool; connections return to it at the end of each request
+if os.environ.get('DB_POOL', 'False') == 'True':
+    DATABASES['default'].update({
+        'ENGINE': 'api.backends.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+            'MAX_IDLE': int(os.environ.get('DB_POOL_MAX_IDLE', 300)),
+        },
+    })
+
+# Local memory by default; set REDIS_URL to share the cache between workers.
+# LocMemCache is per process: a write bumps the response cache version, and a deleted token
+# or API key is forgotten, only in the worker that made the change; the others keep their
+# copies until they expire. Run more than one worker with REDIS_URL set; without it cached
+# responses and credentials default to a few seconds.
+SHARED_CACHE = bool(os.environ.get('REDIS_URL'))
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'talent-verify',
+        }
+    }
+API_CACHE_TIMEOUT = int(os.environ.get('API_CACHE_TIMEOUT', 300 if SHARED_CACHE else 5))
+AUTH_CACHE_TIMEOUT = int(os.environ.get('AUTH_CACHE_TIMEOUT', 300 if SHARED_CACHE else 5))
+VERIFY_BATCH_LIMIT = int(os.environ.get('VERIFY_BATCH_LIMIT', 500))
+BATCH_WRITE_LIMIT = int(os.environ.get('BATCH_WRITE_LIMIT', 1000))
+
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',},
     {'NAME': 'django.contrib.auth.password_validation.MinimumLengthValidator',},
@@ -91,10 +133,12 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-    ]
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.environ.get('API_PAGE_SIZE', 50)),
 }
 
 LOGGING = {
@@ -111,9 +155,18 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': True,
         },
+        'api.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
+# Per-request query counts and N+1 warnings, as X-Query-* headers and api.profiling logs
+QUERY_PROFILER_ENABLED = os.environ.get('QUERY_PROFILER', 'False') == 'True'
+QUERY_PROFILER_REPEAT_THRESHOLD = int(os.environ.get('QUERY_PROFILER_REPEAT_THRESHOLD', 5))
+
 CSRF_COOKIE_SECURE = not DEBUG
 SESSION_COOKIE_SECURE = not DEBUG
 CSRF_COOKIE_HTTPONLY = True
@@ -137,3 +190,7 @@ CSRF_COOKIE_NAME = 'csrftoken'
 CSRF_FAILURE_VIEW = 'django.views.csrf.csrf_failure'
 
 ENCRYPTION_KEY = os.environ.get('ENCRYPTION_KEY', 'PuK8qBO548l9PZB0-gUMQ-nEJhciBIUI96D_0C30HGs=')
+# Previous keys, comma separated, still accepted for decryption while data is re-encrypted
+ENCRYPTION_KEY_FALLBACKS = [key for key in os.environ.get('ENCRYPTION_KEY_FALLBACKS', '').split(',') if key]
+# HMAC key for the blind index on encrypted employee IDs. Changing it invalidates every stored employee_id_hash.
+BLIND_INDEX_KEY = os.environ.get('BLIND_INDEX_KEY', '5c1f0e7a2b9d4e38a6f1c0d7b3e29a4f8d6c1b0e7f3a9d2c5b8e1f4a7d0c3b6e')
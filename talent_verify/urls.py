@@ -8,6 +8,7 @@ from api.views import (
     register, login_view, employee_list, add_employee, employee_detail, add_employee_history,
     CustomObtainAuthToken  # Add this import
 )
+from api.urls import async_urlpatterns
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.authtoken.views import obtain_auth_token
 from django.contrib.auth.views import LoginView, LogoutView
@@ -25,7 +26,9 @@ router.register(r'roles', RoleViewSet)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/', include(async_urlpatterns)),  # Async search, employee detail and role history
     path('api/', include(router.urls)),  # Include the router URLs under /api/
+    path('api/', include('api.urls')),  # Nested and function-based API routes the router doesn't cover
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     path('api-token-auth/', CustomObtainAuthToken.as_view()),
     path('admin/login/', LoginView.as_view(template_name='admin/login.html'), name='admin_login'),